@@ -1,9 +1,11 @@
 import os
 
 from fastapi import FastAPI, Request
+from fastapi.encoders import jsonable_encoder
 from fastapi.responses import JSONResponse
 from okdata.aws.logging import add_fastapi_logging
 
+import metrics
 from resources import stream, sinks, subscribable, events
 from resources.errors import ErrorResponse
 
@@ -13,6 +15,15 @@ app = FastAPI(title="event-stream-api", version="0.1.0", root_path=root_path)
 
 add_fastapi_logging(app)
 
+
+@app.middleware("http")
+async def flush_metrics(request: Request, call_next):
+    try:
+        return await call_next(request)
+    finally:
+        metrics.flush()
+
+
 prefix = "/{dataset_id}/{version}"
 
 app.include_router(stream.router, prefix=prefix, tags=["stream"])
@@ -33,5 +44,6 @@ app.include_router(
 def abort_exception_handler(request: Request, exc: ErrorResponse):
     return JSONResponse(
         status_code=exc.status_code,
-        content={"message": exc.message, **exc.extra_context},
+        content=jsonable_encoder({"message": exc.message, **exc.extra_context}),
+        headers=exc.headers,
     )
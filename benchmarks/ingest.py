@@ -0,0 +1,306 @@
+"""Benchmark POST /{dataset_id}/{version}/events end to end.
+
+Requests go through the FastAPI test client and the full dependency chain,
+with local stand-ins for AWS and the other services:
+
+* DynamoDB (event streams), SSM (Keycloak config) and STS are moto mocks.
+* Kinesis is an in-process fake accepting records instantly, failing a
+  given fraction of them with ProvisionedThroughputExceededException.
+  Retry back-off sleeps are skipped, so retries only cost the extra work.
+* Keycloak token introspection, resource authorization and the Dataset API
+  are patched to answer straight away.
+
+Each scenario (batch size x failure rate) reports throughput, request
+latency percentiles and the peak RSS of the process so far. Scenarios run
+from the smallest batch up, so a jump in peak RSS belongs to the scenario
+where it appears.
+
+    python -m benchmarks.ingest [--quick] [--save] [--max-regression PCT]
+
+Results are compared with the baseline in `benchmarks/baselines/ingest.json`
+when it exists; `--save` replaces the baseline with the current results.
+With `--max-regression`, the run fails if the p50 latency of any scenario
+is more than PCT percent above the baseline.
+"""
+import argparse
+import contextlib
+import json
+import os
+import random
+import resource
+import statistics
+import sys
+import time
+from unittest import mock
+
+os.environ.setdefault("AWS_ACCESS_KEY_ID", "mock")
+os.environ.setdefault("AWS_SECRET_ACCESS_KEY", "mock")
+os.environ.setdefault("AWS_SECURITY_TOKEN", "mock")
+os.environ.setdefault("AWS_SESSION_TOKEN", "mock")
+os.environ.setdefault("AWS_REGION", "eu-west-1")
+os.environ.setdefault("ES_API_ENDPOINT", "mock")
+os.environ.setdefault("OKDATA_ENVIRONMENT", "localdev")
+os.environ.setdefault("KEYCLOAK_SERVER", "https://example.org")
+os.environ.setdefault("KEYCLOAK_REALM", "mock")
+os.environ.setdefault("RESOURCE_SERVER_CLIENT_ID", "okdata-resource-server")
+
+import boto3  # noqa: E402
+from fastapi.testclient import TestClient  # noqa: E402
+from keycloak import KeycloakOpenID  # noqa: E402
+from moto import mock_dynamodb2, mock_ssm, mock_sts  # noqa: E402
+from okdata.resource_auth import ResourceAuthorizer  # noqa: E402
+from okdata.sdk.data.dataset import Dataset  # noqa: E402
+
+from app import app  # noqa: E402
+from services import admission, service  # noqa: E402
+from services.retry import RetryStrategy  # noqa: E402
+
+BASELINE_PATH = os.path.join(os.path.dirname(__file__), "baselines", "ingest.json")
+
+BATCH_SIZES = [1, 10, 100, 1000, 10000]
+FAILURE_RATES = [0.0, 0.01, 0.1]
+QUICK_BATCH_SIZES = [1, 100, 1000]
+QUICK_FAILURE_RATES = [0.0, 0.1]
+
+DATASET_ID = "benchmark"
+VERSION = "1"
+TOKEN = "benchmark-token"
+
+
+class FakeKinesisClient:
+    """Kinesis stand-in failing about `failure_rate` of the records put."""
+
+    def __init__(self, failure_rate, seed=1):
+        self.failure_rate = failure_rate
+        self.rng = random.Random(seed)
+        self.sequence_number = 0
+
+    def put_records(self, StreamName, Records):
+        results = []
+        for _ in Records:
+            if self.rng.random() < self.failure_rate:
+                results.append(
+                    {
+                        "ErrorCode": "ProvisionedThroughputExceededException",
+                        "ErrorMessage": "Rate exceeded for shard",
+                    }
+                )
+            else:
+                self.sequence_number += 1
+                results.append(
+                    {
+                        "SequenceNumber": str(self.sequence_number),
+                        "ShardId": "shardId-000000000000",
+                    }
+                )
+        return {
+            "ResponseMetadata": {"RetryAttempts": 0},
+            "FailedRecordCount": sum("ErrorCode" in r for r in results),
+            "Records": results,
+        }
+
+
+def events(batch_size):
+    return [
+        {
+            "id": i,
+            "timestamp": "2021-06-01T12:00:00+02:00",
+            "sensor": {"id": f"sensor-{i % 17}", "value": i * 0.5},
+        }
+        for i in range(batch_size)
+    ]
+
+
+def iterations(batch_size, quick):
+    """Enough requests for stable percentiles without running for ages."""
+    total_events = 5000 if quick else 50000
+    return max(5, min(200, total_events // batch_size))
+
+
+def create_stand_ins():
+    ssm = boto3.client("ssm", region_name="eu-west-1")
+    ssm.put_parameter(
+        Name="/dataplatform/shared/keycloak-server-url",
+        Value="https://keycloak.example.org",
+        Type="String",
+    )
+    ssm.put_parameter(
+        Name="/dataplatform/event-stream-api/keycloak-client-secret",
+        Value="secret",
+        Type="SecureString",
+    )
+
+    dynamodb = boto3.client("dynamodb", region_name="eu-west-1")
+    dynamodb.create_table(
+        TableName="event-streams",
+        KeySchema=[
+            {"AttributeName": "id", "KeyType": "HASH"},
+            {"AttributeName": "config_version", "KeyType": "RANGE"},
+        ],
+        AttributeDefinitions=[
+            {"AttributeName": "id", "AttributeType": "S"},
+            {"AttributeName": "config_version", "AttributeType": "N"},
+        ],
+        ProvisionedThroughput={"ReadCapacityUnits": 1, "WriteCapacityUnits": 1},
+        GlobalSecondaryIndexes=[
+            {
+                "IndexName": "by_id",
+                "KeySchema": [{"AttributeName": "id", "KeyType": "HASH"}],
+                "Projection": {"ProjectionType": "ALL"},
+                "ProvisionedThroughput": {
+                    "ReadCapacityUnits": 1,
+                    "WriteCapacityUnits": 1,
+                },
+            }
+        ],
+    )
+    boto3.resource("dynamodb", region_name="eu-west-1").Table("event-streams").put_item(
+        Item={"id": f"{DATASET_ID}/{VERSION}", "config_version": 1, "create_raw": True}
+    )
+
+
+def patches(kinesis_client):
+    def get_dataset(self, dataset_id, *args, **kwargs):
+        return {"Id": dataset_id, "accessRights": "public"}
+
+    def get_versions(self, dataset_id):
+        return [{"id": f"{dataset_id}/{VERSION}", "version": VERSION}]
+
+    def introspect(self, token):
+        return {"active": token == TOKEN, "username": "benchmark"}
+
+    def has_access(self, bearer_token, scope, resource_name=None, **kwargs):
+        return bearer_token == TOKEN
+
+    return [
+        mock.patch.object(Dataset, "get_dataset", get_dataset),
+        mock.patch.object(Dataset, "get_versions", get_versions),
+        mock.patch.object(KeycloakOpenID, "introspect", introspect),
+        mock.patch.object(ResourceAuthorizer, "has_access", has_access),
+        mock.patch.object(service, "get_kinesis_client", lambda: kinesis_client),
+        mock.patch.object(admission, "_shard_count", lambda stream_name: None),
+        mock.patch.object(RetryStrategy, "sleep", lambda self, delay: None),
+    ]
+
+
+def percentile(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(p / 100 * (len(values) - 1))))]
+
+
+def run_scenario(client, batch_size, failure_rate, quick):
+    body = json.dumps(events(batch_size))
+    headers = {"Authorization": f"Bearer {TOKEN}", "Content-Type": "application/json"}
+    kinesis_client = FakeKinesisClient(failure_rate)
+    latencies = []
+
+    with contextlib.ExitStack() as stack:
+        for patch in patches(kinesis_client):
+            stack.enter_context(patch)
+
+        # Warm up caches and the code paths before measuring.
+        client.post(f"/{DATASET_ID}/{VERSION}/events", data=body, headers=headers)
+
+        statuses = {}
+        start = time.perf_counter()
+        for _ in range(iterations(batch_size, quick)):
+            request_start = time.perf_counter()
+            response = client.post(
+                f"/{DATASET_ID}/{VERSION}/events", data=body, headers=headers
+            )
+            latencies.append((time.perf_counter() - request_start) * 1000)
+            statuses[response.status_code] = statuses.get(response.status_code, 0) + 1
+        elapsed = time.perf_counter() - start
+
+    return {
+        "batch_size": batch_size,
+        "failure_rate": failure_rate,
+        "requests": len(latencies),
+        "statuses": {str(code): count for code, count in sorted(statuses.items())},
+        "events_per_second": round(batch_size * len(latencies) / elapsed, 1),
+        "p50_ms": round(statistics.median(latencies), 3),
+        "p95_ms": round(percentile(latencies, 95), 3),
+        "p99_ms": round(percentile(latencies, 99), 3),
+        "peak_rss_mb": round(
+            resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1
+        ),
+    }
+
+
+def scenario_key(result):
+    return f"batch={result['batch_size']},failure={result['failure_rate']}"
+
+
+def compare(result, baseline):
+    if baseline is None:
+        return ""
+    change = (result["p50_ms"] - baseline["p50_ms"]) / baseline["p50_ms"] * 100
+    return f"{change:+.1f}%"
+
+
+@mock_dynamodb2
+@mock_ssm
+@mock_sts
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--quick", action="store_true", help="fewer scenarios")
+    parser.add_argument("--save", action="store_true", help="save as baseline")
+    parser.add_argument("--max-regression", type=float, metavar="PCT")
+    args = parser.parse_args(argv)
+
+    create_stand_ins()
+    client = TestClient(app)
+
+    baselines = {}
+    if os.path.exists(BASELINE_PATH):
+        with open(BASELINE_PATH) as f:
+            baselines = {scenario_key(r): r for r in json.load(f)["results"]}
+
+    batch_sizes = QUICK_BATCH_SIZES if args.quick else BATCH_SIZES
+    failure_rates = QUICK_FAILURE_RATES if args.quick else FAILURE_RATES
+
+    print(
+        f"{'batch':>6} {'fail':>5} {'reqs':>5} {'events/s':>10} {'p50 ms':>9} "
+        f"{'p95 ms':>9} {'p99 ms':>9} {'rss MB':>7} {'p50 vs baseline':>16}"
+    )
+    results = []
+    regressions = []
+    for batch_size in batch_sizes:
+        for failure_rate in failure_rates:
+            # The metrics middleware writes to stdout after every request.
+            with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+                result = run_scenario(client, batch_size, failure_rate, args.quick)
+            results.append(result)
+
+            baseline = baselines.get(scenario_key(result))
+            print(
+                f"{batch_size:>6} {failure_rate:>5} {result['requests']:>5} "
+                f"{result['events_per_second']:>10} {result['p50_ms']:>9} "
+                f"{result['p95_ms']:>9} {result['p99_ms']:>9} "
+                f"{result['peak_rss_mb']:>7} {compare(result, baseline):>16}"
+            )
+            if (
+                args.max_regression is not None
+                and baseline is not None
+                and result["p50_ms"]
+                > baseline["p50_ms"] * (1 + args.max_regression / 100)
+            ):
+                regressions.append(scenario_key(result))
+
+    if args.save:
+        os.makedirs(os.path.dirname(BASELINE_PATH), exist_ok=True)
+        with open(BASELINE_PATH, "w") as f:
+            json.dump(
+                {"python": sys.version.split()[0], "results": results}, f, indent=2
+            )
+            f.write("\n")
+        print(f"Saved baseline to {BASELINE_PATH}")
+
+    if regressions:
+        print(f"p50 regressions above {args.max_regression}%: {', '.join(regressions)}")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
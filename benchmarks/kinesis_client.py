@@ -0,0 +1,60 @@
+"""Compare a Kinesis client per PutRecords request with a shared client.
+
+Runs against a local moto Kinesis stream, so the numbers show the cost of
+building the botocore client itself; against AWS the shared client also
+saves the TLS handshake of every request.
+
+    python -m benchmarks.kinesis_client [iterations]
+"""
+import os
+import sys
+import time
+
+os.environ.setdefault("AWS_ACCESS_KEY_ID", "mock")
+os.environ.setdefault("AWS_SECRET_ACCESS_KEY", "mock")
+os.environ.setdefault("AWS_REGION", "eu-west-1")
+
+import boto3  # noqa: E402
+from moto import mock_kinesis  # noqa: E402
+
+from clients.kinesis_client import (  # noqa: E402
+    KINESIS_CONFIG,
+    get_kinesis_client,
+    reset_kinesis_client,
+)
+
+STREAM_NAME = "benchmark"
+RECORDS = [{"Data": b'{"foo": "bar"}\n', "PartitionKey": "benchmark"}] * 10
+
+
+def new_client():
+    return boto3.session.Session().client(
+        "kinesis", region_name="eu-west-1", config=KINESIS_CONFIG
+    )
+
+
+def run(get_client, iterations):
+    start = time.perf_counter()
+    for _ in range(iterations):
+        get_client().put_records(StreamName=STREAM_NAME, Records=RECORDS)
+    return (time.perf_counter() - start) / iterations * 1000
+
+
+@mock_kinesis
+def main(iterations):
+    boto3.client("kinesis", region_name="eu-west-1").create_stream(
+        StreamName=STREAM_NAME, ShardCount=1
+    )
+    reset_kinesis_client()
+
+    per_request = run(new_client, iterations)
+    shared = run(get_kinesis_client, iterations)
+
+    print(f"iterations:          {iterations}")
+    print(f"client per request:  {per_request:.2f} ms/request")
+    print(f"shared client:       {shared:.2f} ms/request")
+    print(f"saved:               {per_request - shared:.2f} ms/request")
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 200)
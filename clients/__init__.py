@@ -1,11 +1,17 @@
 from .cloudformation_client import CloudformationClient
-from .keycloak_client import setup_keycloak_client
-from .origo_sdk import setup_origo_sdk
-from .keycloak_config import get_keycloak_config
+from .keycloak_client import get_keycloak_client, setup_keycloak_client
+from .kinesis_client import get_kinesis_client, reset_kinesis_client
+from .origo_sdk import get_origo_sdk, setup_origo_sdk
+from .keycloak_config import get_keycloak_config, refresh_keycloak_config
 
 __all__ = [
     "CloudformationClient",
+    "get_keycloak_client",
     "setup_keycloak_client",
+    "get_kinesis_client",
+    "reset_kinesis_client",
+    "get_origo_sdk",
     "setup_origo_sdk",
     "get_keycloak_config",
+    "refresh_keycloak_config",
 ]
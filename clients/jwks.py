@@ -0,0 +1,59 @@
+import os
+import threading
+import time
+from typing import Dict, Optional
+
+from okdata.aws.logging import log_add
+
+from cache import TTLCache
+
+# How long (in seconds) the signing keys of a realm are used before they're
+# fetched again. Keys are also fetched again when a token is signed with a key
+# that isn't known yet, as happens right after Keycloak rotates its keys, but
+# no more often than every `JWKS_MIN_REFRESH_INTERVAL` seconds.
+JWKS_CACHE_TTL = int(os.environ.get("JWKS_CACHE_TTL", 3600))
+JWKS_MIN_REFRESH_INTERVAL = int(os.environ.get("JWKS_MIN_REFRESH_INTERVAL", 10))
+
+_jwks = TTLCache(maxsize=16, ttl=JWKS_CACHE_TTL)
+_refresh_lock = threading.Lock()
+
+
+def issuer(keycloak_client) -> str:
+    """Return the issuer of the tokens of the realm of `keycloak_client`."""
+    return f"{keycloak_client.connection.base_url}realms/{keycloak_client.realm_name}"
+
+
+def signing_key(keycloak_client, key_id: str) -> Optional[dict]:
+    """Return the JWK with ID `key_id` of the realm of `keycloak_client`.
+
+    Return None when the realm has no such key, even after fetching its keys
+    again.
+    """
+    realm = issuer(keycloak_client)
+    entry = _jwks.get(realm)
+
+    if entry is None or (
+        key_id not in entry[0]
+        and time.monotonic() - entry[1] >= JWKS_MIN_REFRESH_INTERVAL
+    ):
+        with _refresh_lock:
+            # Another thread may have fetched the keys while we waited.
+            current = _jwks.get(realm)
+            if current is entry or current is None:
+                entry = _fetch_jwks(keycloak_client, realm)
+            else:
+                entry = current
+
+    return entry[0].get(key_id)
+
+
+def _fetch_jwks(keycloak_client, realm: str):
+    keys: Dict[str, dict] = {
+        key["kid"]: key
+        for key in keycloak_client.certs()["keys"]
+        if key.get("use", "sig") == "sig" and "kid" in key
+    }
+    entry = (keys, time.monotonic())
+    _jwks.set(realm, entry)
+    log_add(jwks_fetched=True, jwks_key_ids=sorted(keys))
+    return entry
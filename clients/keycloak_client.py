@@ -1,3 +1,5 @@
+import functools
+
 from keycloak import KeycloakOpenID
 from .keycloak_config import KeycloakConfig
 
@@ -9,3 +11,14 @@ def setup_keycloak_client(keycloak_config: KeycloakConfig):
         client_id=keycloak_config.client_id,
         client_secret_key=keycloak_config.client_secret,
     )
+
+
+@functools.lru_cache(maxsize=4)
+def get_keycloak_client(keycloak_config: KeycloakConfig):
+    """Return the Keycloak client of the process for `keycloak_config`.
+
+    The client is shared between requests, so that they can reuse its
+    connections. A new client is made when the config changes, e.g. after the
+    client secret has been rotated.
+    """
+    return setup_keycloak_client(keycloak_config)
@@ -1,9 +1,19 @@
 import os
 from dataclasses import dataclass
 import boto3
+from okdata.aws.logging import log_add
 
+from cache import TTLCache
 
-@dataclass
+# How long (in seconds) the Keycloak config is used before it's read from SSM
+# again. It's also read again as soon as Keycloak rejects the credentials, see
+# `refresh_keycloak_config`.
+KEYCLOAK_CONFIG_TTL = int(os.environ.get("KEYCLOAK_CONFIG_TTL", 300))
+
+_keycloak_config = TTLCache(maxsize=1, ttl=KEYCLOAK_CONFIG_TTL)
+
+
+@dataclass(frozen=True)
 class KeycloakConfig:
     client_id: str
     client_secret: str
@@ -12,6 +22,30 @@ class KeycloakConfig:
 
 
 def get_keycloak_config() -> KeycloakConfig:
+    """Return the Keycloak config of the service, loading it when needed.
+
+    The config is shared by every request handled by the process, saving a
+    decrypting SSM call per request.
+    """
+    keycloak_config = _keycloak_config.get("config")
+    if keycloak_config is None:
+        keycloak_config = refresh_keycloak_config()
+    return keycloak_config
+
+
+def refresh_keycloak_config() -> KeycloakConfig:
+    """Load the Keycloak config from SSM, replacing the cached one.
+
+    Meant to be called when Keycloak rejects the client credentials, in case
+    the client secret has been rotated since the config was loaded.
+    """
+    keycloak_config = load_keycloak_config()
+    _keycloak_config.set("config", keycloak_config)
+    log_add(keycloak_config_loaded=True)
+    return keycloak_config
+
+
+def load_keycloak_config() -> KeycloakConfig:
     ssm_client = SSMClient()
 
     client_id = "event-stream-api"
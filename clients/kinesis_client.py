@@ -0,0 +1,46 @@
+import os
+import threading
+
+import boto3
+import botocore
+
+# Should be at least as large as the number of PutRecords requests sent
+# concurrently, so that no request has to wait for a free connection.
+KINESIS_MAX_POOL_CONNECTIONS = int(os.environ.get("KINESIS_MAX_POOL_CONNECTIONS", 10))
+
+KINESIS_CONFIG = botocore.config.Config(
+    connect_timeout=3,
+    read_timeout=3,
+    retries={"max_attempts": 3, "mode": "standard"},
+    max_pool_connections=KINESIS_MAX_POOL_CONNECTIONS,
+)
+
+_kinesis_client = None
+_kinesis_client_lock = threading.Lock()
+
+
+def get_kinesis_client():
+    """Return the process-wide Kinesis client, creating it on first use.
+
+    Botocore clients are thread safe, so the client and its connection pool
+    are shared by every request handled by the process, including warm Lambda
+    invocations.
+    """
+    global _kinesis_client
+
+    if _kinesis_client is None:
+        with _kinesis_client_lock:
+            if _kinesis_client is None:
+                _kinesis_client = boto3.session.Session().client(
+                    "kinesis", region_name="eu-west-1", config=KINESIS_CONFIG
+                )
+
+    return _kinesis_client
+
+
+def reset_kinesis_client():
+    """Drop the process-wide Kinesis client, forcing a new one on next use."""
+    global _kinesis_client
+
+    with _kinesis_client_lock:
+        _kinesis_client = None
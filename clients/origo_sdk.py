@@ -1,8 +1,57 @@
+import functools
+import os
+import threading
+import time
+
+from jose import JWTError, jwt
+from okdata.aws.logging import log_add
 from okdata.sdk import SDK
+from okdata.sdk.auth.auth import Authenticate
 from okdata.sdk.config import Config
 
 from .keycloak_config import KeycloakConfig
 
+# Service tokens are renewed this many seconds before they expire, so that a
+# token never runs out while a request is on its way.
+SERVICE_TOKEN_REFRESH_MARGIN = int(os.environ.get("SERVICE_TOKEN_REFRESH_MARGIN", 30))
+
+
+class ServiceTokenAuth(Authenticate):
+    """SDK authentication keeping the service's access token in memory.
+
+    The token is fetched with the client credentials when first needed and
+    renewed shortly before it expires. Threads sharing an instance share the
+    token, and only one of them renews it at a time.
+    """
+
+    def __init__(self, config, token_provider=None, file_cache=None):
+        super().__init__(config, token_provider, file_cache)
+        self._lock = threading.Lock()
+
+    @property
+    def access_token(self):
+        if not self.token_provider:
+            return None
+
+        access_token = self._access_token
+        if access_token and not _expires_soon(access_token):
+            return access_token
+
+        with self._lock:
+            # Another thread may have renewed the token while we waited.
+            if not self._access_token or _expires_soon(self._access_token):
+                self.refresh_access_token()
+                log_add(service_token_refreshed=True)
+            return self._access_token
+
+
+def _expires_soon(token: str) -> bool:
+    try:
+        expires_at = jwt.get_unverified_claims(token)["exp"]
+    except (JWTError, KeyError):
+        return True
+    return expires_at - time.time() < SERVICE_TOKEN_REFRESH_MARGIN
+
 
 def setup_origo_sdk(keycloak_config: KeycloakConfig, sdk: SDK):
     origo_config = Config()
@@ -10,5 +59,15 @@ def setup_origo_sdk(keycloak_config: KeycloakConfig, sdk: SDK):
     origo_config.config["client_secret"] = keycloak_config.client_secret
     origo_config.config["cacheCredentials"] = False
 
-    sdk_instance = sdk(config=origo_config)
+    sdk_instance = sdk(config=origo_config, auth=ServiceTokenAuth(origo_config))
     return sdk_instance
+
+
+@functools.lru_cache(maxsize=16)
+def get_origo_sdk(keycloak_config: KeycloakConfig, sdk: SDK):
+    """Return the `sdk` instance of the process for `keycloak_config`.
+
+    The instance and its access token are shared between requests, saving a
+    token exchange with Keycloak per request.
+    """
+    return setup_origo_sdk(keycloak_config, sdk)
@@ -5,8 +5,12 @@ from .models import (
     CfStackType,
     Sink,
     SinkType,
+    PartitionKey,
+    PartitionKeyType,
+    HashKeyDistribution,
+    HashKeyDistributionType,
 )
-from .db import EventStreamsTable
+from .db import EventStreamsTable, IdempotencyKeysTable
 from .db_elasticsearch import ElasticsearchConnection
 
 __all__ = [
@@ -14,8 +18,13 @@ __all__ = [
     "Subscribable",
     "Sink",
     "SinkType",
+    "PartitionKey",
+    "PartitionKeyType",
+    "HashKeyDistribution",
+    "HashKeyDistributionType",
     "StackTemplate",
     "EventStreamsTable",
+    "IdempotencyKeysTable",
     "CfStackType",
     "ElasticsearchConnection",
 ]
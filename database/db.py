@@ -1,8 +1,11 @@
 import os
+import time
 import boto3
 import json
+from typing import Optional
 from database import EventStream
-from boto3.dynamodb.conditions import Key
+from boto3.dynamodb.conditions import Attr, Key
+from botocore.exceptions import ClientError
 from decimal import Decimal
 
 
@@ -26,3 +29,65 @@ class EventStreamsTable:
             )
             return EventStream(**current_item)
         return None
+
+
+class IdempotencyKeysTable:
+    """Requests made with an idempotency key, and their results.
+
+    A key is first reserved with an in-progress item, which is then either
+    completed with the result of the request or deleted again. Items expire
+    through DynamoDB's TTL on `expires_at`. Since expired items may linger
+    until DynamoDB gets around to deleting them, they are also filtered out on
+    read and may be reserved again.
+    """
+
+    def __init__(self):
+        table_name = "event-stream-idempotency-keys"
+        dynamodb = boto3.resource("dynamodb", region_name=os.environ["AWS_REGION"])
+        self.table = dynamodb.Table(table_name)
+
+    def reserve(self, key: str, request_hash: str, expires_at: int) -> bool:
+        """Reserve `key` for a request until `expires_at`.
+
+        Return False when the key is already taken by another request.
+        """
+        try:
+            self.table.put_item(
+                Item={
+                    "id": key,
+                    "status": "in_progress",
+                    "request_hash": request_hash,
+                    "expires_at": expires_at,
+                },
+                ConditionExpression=Attr("id").not_exists()
+                | Attr("expires_at").lte(int(time.time())),
+            )
+        except ClientError as e:
+            if e.response["Error"]["Code"] == "ConditionalCheckFailedException":
+                return False
+            raise
+        return True
+
+    def put_result(self, key: str, request_hash: str, result, expires_at: int):
+        self.table.put_item(
+            Item={
+                "id": key,
+                "status": "done",
+                "request_hash": request_hash,
+                "result": json.dumps(result),
+                "expires_at": expires_at,
+            }
+        )
+
+    def get(self, key: str) -> Optional[dict]:
+        """Return the unexpired item of `key`, with its result decoded."""
+        item = self.table.get_item(Key={"id": key}, ConsistentRead=True).get("Item")
+        if not item or item["expires_at"] <= time.time():
+            return None
+        if "result" in item:
+            item["result"] = json.loads(item["result"])
+        item["expires_at"] = int(item["expires_at"])
+        return item
+
+    def delete(self, key: str):
+        self.table.delete_item(Key={"id": key})
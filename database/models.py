@@ -1,7 +1,7 @@
 from typing import List, Optional
 from datetime import datetime
 from shortuuid import ShortUUID  # type: ignore
-from pydantic import BaseModel, Field, validator
+from pydantic import BaseModel, Field, root_validator, validator
 from typing import Dict
 from enum import Enum
 
@@ -74,6 +74,83 @@ class SinkType(Enum):
     ELASTICSEARCH = "elasticsearch"
 
 
+class PartitionKeyType(Enum):
+    RANDOM = "random"
+    PATH = "path"
+    HASH = "hash"
+
+
+class PartitionKey(BaseModel):
+    """How partition keys are chosen for events sent to a stream.
+
+    `random`: A random key per event, spreading events evenly over the shards.
+    `path`: The value found at `path` in the event, e.g. `vehicleId` or
+        `vehicle.id`, keeping events with the same value in order.
+    `hash`: A hash of the values found at each of `fields` in the event.
+    """
+
+    type: str = PartitionKeyType.RANDOM.value
+    path: Optional[str] = None
+    fields: List[str] = list()
+
+    @validator("type")
+    def valid_type(cls, v):
+        return PartitionKeyType(v).value
+
+    @root_validator(skip_on_failure=True)
+    def valid_options(cls, values):
+        partition_key_type = PartitionKeyType(values["type"])
+        if partition_key_type == PartitionKeyType.PATH and not values.get("path"):
+            raise ValueError("A path is required for partition keys of type 'path'")
+        if partition_key_type == PartitionKeyType.HASH and not values.get("fields"):
+            raise ValueError("Fields are required for partition keys of type 'hash'")
+        return values
+
+
+class HashKeyDistributionType(Enum):
+    ROUND_ROBIN = "round_robin"
+    WEIGHTED = "weighted"
+
+
+class HashKeyDistribution(BaseModel):
+    """How events are spread over the open shards of a stream.
+
+    Each event is sent with an explicit hash key in the middle of the hash key
+    range of the shard it's assigned to, instead of being placed by the hash
+    of its partition key.
+
+    `round_robin`: Every open shard gets the same share of the events.
+    `weighted`: Each shard gets a share of the events proportional to its
+        weight in `shard_weights`, keyed by shard ID. Shards without a weight
+        have weight 1, and a weight of 0 drains the shard.
+    """
+
+    type: str = HashKeyDistributionType.ROUND_ROBIN.value
+    shard_weights: Dict[str, float] = dict()
+
+    @validator("type")
+    def valid_type(cls, v):
+        return HashKeyDistributionType(v).value
+
+    @validator("shard_weights")
+    def valid_shard_weights(cls, v):
+        if any(weight < 0 for weight in v.values()):
+            raise ValueError("Shard weights can't be negative")
+        return v
+
+    @root_validator(skip_on_failure=True)
+    def valid_options(cls, values):
+        distribution_type = HashKeyDistributionType(values["type"])
+        if distribution_type == HashKeyDistributionType.WEIGHTED and not values.get(
+            "shard_weights"
+        ):
+            raise ValueError(
+                "Shard weights are required for hash key distribution of type "
+                "'weighted'"
+            )
+        return values
+
+
 class EventStream(Stack):
     id: str
     config_version: int = 1
@@ -81,6 +158,9 @@ class EventStream(Stack):
     deleted: bool = False
     subscribable: Subscribable = Field(default_factory=Subscribable)
     sinks: List[Sink] = list()
+    partition_key: PartitionKey = Field(default_factory=PartitionKey)
+    aggregate_records: bool = False
+    hash_key_distribution: Optional[HashKeyDistribution] = None
 
     def get_stack_name(self):
         [dataset_id, version] = self.id.split("/")
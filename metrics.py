@@ -0,0 +1,145 @@
+import json
+import os
+import sys
+import threading
+import time
+from typing import Callable, Dict, Iterator, List, Tuple
+
+from okdata.aws.logging import log_add
+
+METRICS_NAMESPACE = os.environ.get("METRICS_NAMESPACE", "okdata/event-stream-api")
+
+MILLISECONDS = "Milliseconds"
+COUNT = "Count"
+BYTES = "Bytes"
+
+# CloudWatch accepts at most 100 values per metric in a single EMF document:
+# https://docs.aws.amazon.com/AmazonCloudWatch/latest/monitoring/CloudWatch_Embedded_Metric_Format_Specification.html
+EMF_MAX_VALUES = 100
+
+_Dimensions = Tuple[Tuple[str, str], ...]
+
+
+class MetricsRegistry:
+    """In-process metrics, written in CloudWatch Embedded Metric Format.
+
+    Histograms keep every value recorded since the last flush, leaving the
+    percentiles to CloudWatch. Counters keep a running sum. Metrics recorded
+    with dimensions are published both per dimension value and across all of
+    them.
+
+    Recording is cheap and thread safe; nothing is written until `flush`,
+    which is meant to be called once per invocation.
+    """
+
+    def __init__(
+        self,
+        namespace: str = METRICS_NAMESPACE,
+        clock: Callable[[], float] = time.time,
+    ):
+        self.namespace = namespace
+        self.clock = clock
+        self._histograms: Dict[Tuple[_Dimensions, str, str], List[float]] = {}
+        self._counters: Dict[Tuple[_Dimensions, str, str], float] = {}
+        self._lock = threading.Lock()
+
+    def histogram(
+        self, name: str, value: float, unit: str = MILLISECONDS, **dimensions
+    ):
+        key = (_dimensions(dimensions), name, unit)
+        with self._lock:
+            self._histograms.setdefault(key, []).append(value)
+
+    def count(self, name: str, value: float = 1, unit: str = COUNT, **dimensions):
+        key = (_dimensions(dimensions), name, unit)
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def flush(self, stream=None) -> None:
+        """Write the recorded metrics to `stream` (stdout) and reset them."""
+        with self._lock:
+            histograms, self._histograms = self._histograms, {}
+            counters, self._counters = self._counters, {}
+
+        stream = stream or sys.stdout
+        for document in self._documents(histograms, counters):
+            stream.write(json.dumps(document) + "\n")
+        stream.flush()
+
+    def _documents(self, histograms, counters) -> Iterator[dict]:
+        groups: Dict[_Dimensions, Dict[Tuple[str, str], List[float]]] = {}
+        for (dimensions, name, unit), values in histograms.items():
+            groups.setdefault(dimensions, {})[(name, unit)] = values
+        for (dimensions, name, unit), value in counters.items():
+            groups.setdefault(dimensions, {})[(name, unit)] = [value]
+
+        timestamp = int(self.clock() * 1000)
+
+        for dimensions, metrics in groups.items():
+            # Long histograms are spread over as many documents as needed.
+            offset = 0
+            while True:
+                chunk = {
+                    key: values[offset : offset + EMF_MAX_VALUES]
+                    for key, values in metrics.items()
+                    if len(values) > offset
+                }
+                if not chunk:
+                    break
+                yield self._document(timestamp, dimensions, chunk)
+                offset += EMF_MAX_VALUES
+
+    def _document(self, timestamp, dimensions: _Dimensions, metrics) -> dict:
+        dimension_names = [name for name, _ in dimensions]
+        document: dict = {
+            "_aws": {
+                "Timestamp": timestamp,
+                "CloudWatchMetrics": [
+                    {
+                        "Namespace": self.namespace,
+                        "Dimensions": (
+                            [dimension_names, []] if dimension_names else [[]]
+                        ),
+                        "Metrics": [
+                            {"Name": name, "Unit": unit} for name, unit in metrics
+                        ],
+                    }
+                ],
+            },
+            **dict(dimensions),
+        }
+        for (name, _), values in metrics.items():
+            document[name] = values if len(values) > 1 else values[0]
+        return document
+
+
+def _dimensions(dimensions) -> _Dimensions:
+    return tuple(
+        sorted((name, str(value)) for name, value in dimensions.items() if value)
+    )
+
+
+registry = MetricsRegistry()
+
+
+def log_duration(f, duration_field: str, **dimensions):
+    """Like `okdata.aws.logging.log_duration`, also recording the duration in
+    the `duration_field` histogram."""
+    start_time = time.perf_counter_ns()
+    try:
+        return f()
+    finally:
+        record_duration(duration_field, start_time, **dimensions)
+
+
+def record_duration(duration_field: str, start_time: int, **dimensions) -> float:
+    """Log and record the milliseconds since `start_time`, a
+    `time.perf_counter_ns()` value."""
+    duration_ms = (time.perf_counter_ns() - start_time) / 1000000.0
+    log_add(**{duration_field: duration_ms})
+    registry.histogram(duration_field, duration_ms, **dimensions)
+    return duration_ms
+
+
+def flush(stream=None) -> None:
+    registry.flush(stream)
@@ -0,0 +1,46 @@
+import json
+import time
+from typing import List
+
+from okdata.aws.logging import logging_wrapper
+
+import metrics
+from services import EventService
+from services.overflow import drain, get_overflow_store
+
+# Time kept at the end of each run for wrapping up, so that the function is
+# never stopped between replaying a batch and deleting it.
+DRAIN_TIME_MARGIN = 5
+
+
+@logging_wrapper("event-stream-api")
+def handle(event, context):
+    """Replay spilled records into their streams, run on a schedule.
+
+    The status code of the response only decides the level of the run's log
+    entry: runs where a batch couldn't be replayed because of an error are
+    logged as errors.
+    """
+    overflow_store = get_overflow_store()
+    if overflow_store is None:
+        return {"statusCode": 200, "body": "{}"}
+
+    deadline = (
+        time.monotonic()
+        + context.get_remaining_time_in_millis() / 1000
+        - DRAIN_TIME_MARGIN
+    )
+    errors: List[Exception] = []
+
+    # Only the Kinesis side of the service is used for draining.
+    try:
+        replayed = drain(
+            overflow_store,
+            EventService(dataset_client=None),
+            deadline=deadline,
+            errors=errors,
+        )
+    finally:
+        metrics.flush()
+
+    return {"statusCode": 500 if errors else 200, "body": json.dumps(replayed)}
@@ -1,14 +1,59 @@
+import asyncio
+import hashlib
+import os
+import time
+from typing import NamedTuple, Optional
+
 from fastapi import Depends
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
+from jose import JWTError, jwt
+from keycloak.exceptions import KeycloakAuthenticationError
+from okdata.aws.logging import log_add
 from okdata.resource_auth import ResourceAuthorizer
+from starlette.concurrency import run_in_threadpool
 
-from clients import setup_keycloak_client, get_keycloak_config
+from cache import TTLCache
+from clients import (
+    get_keycloak_client,
+    get_keycloak_config,
+    jwks,
+    refresh_keycloak_config,
+)
 from .errors import ErrorResponse
 from .origo_clients import dataset_client
 
+# Active token introspections are reused for a short while, so that clients
+# sending many batches with the same token don't wait for Keycloak every time.
+# A cached introspection never outlives the token itself, but a token revoked
+# in Keycloak may still be accepted for up to this many seconds. Set to 0 to
+# turn the cache off.
+INTROSPECTION_CACHE_TTL = int(os.environ.get("INTROSPECTION_CACHE_TTL", 60))
+INTROSPECTION_CACHE_SIZE = int(os.environ.get("INTROSPECTION_CACHE_SIZE", 1024))
+
+_introspections = TTLCache(INTROSPECTION_CACHE_SIZE, INTROSPECTION_CACHE_TTL)
+
+# How bearer tokens are checked: "introspection" asks Keycloak about every
+# token (see `INTROSPECTION_CACHE_TTL`), while "jwt" verifies their signature
+# and claims locally, only introspecting tokens that aren't JWTs. Local
+# verification doesn't notice tokens revoked before they expire.
+AUTH_MODE = os.environ.get("AUTH_MODE", "introspection")
+JWT_AUDIENCE = os.environ.get(
+    "JWT_AUDIENCE", os.environ.get("RESOURCE_SERVER_CLIENT_ID", "")
+)
+JWT_ALGORITHMS = ["RS256", "RS384", "RS512", "ES256", "ES384", "ES512"]
+
+# Permission decisions are reused per principal, scope and resource, denials
+# for a much shorter while than grants so that newly granted access shows up
+# quickly. Set `PERMISSION_CACHE_TTL` to 0 to turn the cache off.
+PERMISSION_CACHE_TTL = int(os.environ.get("PERMISSION_CACHE_TTL", 60))
+PERMISSION_CACHE_NEGATIVE_TTL = int(os.environ.get("PERMISSION_CACHE_NEGATIVE_TTL", 5))
+PERMISSION_CACHE_SIZE = int(os.environ.get("PERMISSION_CACHE_SIZE", 4096))
+
+_permissions = TTLCache(PERMISSION_CACHE_SIZE, PERMISSION_CACHE_TTL)
+
 
 def keycloak_client(keycloak_config=Depends(get_keycloak_config)):
-    return setup_keycloak_client(keycloak_config)
+    return get_keycloak_client(keycloak_config)
 
 
 def resource_authorizer() -> ResourceAuthorizer:
@@ -27,7 +72,10 @@ class AuthInfo:
         authorization: HTTPAuthorizationCredentials = Depends(http_bearer),
         keycloak_client=Depends(keycloak_client),
     ):
-        introspected = keycloak_client.introspect(authorization.credentials)
+        if AUTH_MODE == "jwt":
+            introspected = verify_jwt(keycloak_client, authorization.credentials)
+        else:
+            introspected = introspect(keycloak_client, authorization.credentials)
 
         if not introspected["active"]:
             raise ErrorResponse(401, "Invalid access token")
@@ -36,20 +84,116 @@ class AuthInfo:
         self.bearer_token = authorization.credentials
 
 
+def verify_jwt(keycloak_client, token: str) -> dict:
+    """Check `token` locally against the signing keys of the realm.
+
+    Return the token's claims in the shape of an introspection, inactive when
+    the signature, expiry, issuer or audience doesn't check out. Tokens that
+    aren't JWTs are introspected instead.
+    """
+    try:
+        header = jwt.get_unverified_header(token)
+    except JWTError:
+        return introspect(keycloak_client, token)
+
+    key = jwks.signing_key(keycloak_client, header.get("kid", ""))
+    if key is None:
+        return {"active": False}
+
+    try:
+        claims = jwt.decode(
+            token,
+            key,
+            algorithms=JWT_ALGORITHMS,
+            audience=JWT_AUDIENCE or None,
+            issuer=jwks.issuer(keycloak_client),
+            options={"verify_aud": bool(JWT_AUDIENCE), "require_exp": True},
+        )
+    except JWTError:
+        return {"active": False}
+
+    return {**claims, "active": True, "username": claims.get("preferred_username")}
+
+
+def introspect(keycloak_client, token: str) -> dict:
+    """Introspect `token`, reusing a recent result for the same token.
+
+    Only active tokens are cached, keyed by a hash of the token so that the
+    tokens themselves aren't kept around in memory.
+    """
+    if INTROSPECTION_CACHE_TTL <= 0:
+        return _introspect(keycloak_client, token)
+
+    key = hashlib.sha256(token.encode("utf-8")).hexdigest()
+    introspected = _introspections.get(key)
+    if introspected is not None:
+        return introspected
+
+    introspected = _introspect(keycloak_client, token)
+    if introspected["active"]:
+        ttl = INTROSPECTION_CACHE_TTL
+        if "exp" in introspected:
+            ttl = min(ttl, introspected["exp"] - time.time())
+        if ttl > 0:
+            _introspections.set(key, introspected, ttl=ttl)
+    return introspected
+
+
+def _introspect(keycloak_client, token: str) -> dict:
+    try:
+        return keycloak_client.introspect(token)
+    except KeycloakAuthenticationError:
+        # Our client credentials were rejected, e.g. because the client
+        # secret has been rotated; try once more with a fresh config.
+        keycloak_client = get_keycloak_client(refresh_keycloak_config())
+        return keycloak_client.introspect(token)
+
+
 def authorize(scope: str):
     def _verify_permission(
         dataset_id: str,
         auth_info: AuthInfo = Depends(),
         resource_authorizer: ResourceAuthorizer = Depends(resource_authorizer),
     ):
-        if not resource_authorizer.has_access(
-            auth_info.bearer_token, scope, f"okdata:dataset:{dataset_id}"
+        if not has_access(
+            resource_authorizer, auth_info, scope, f"okdata:dataset:{dataset_id}"
         ):
             raise ErrorResponse(403, "Forbidden")
 
     return _verify_permission
 
 
+def has_access(
+    resource_authorizer: ResourceAuthorizer,
+    auth_info: AuthInfo,
+    scope: str,
+    resource_name: str,
+) -> bool:
+    """Return whether the caller of `auth_info` has `scope` on `resource_name`,
+    reusing a recent decision for the same principal."""
+    if PERMISSION_CACHE_TTL <= 0 or not auth_info.principal_id:
+        return resource_authorizer.has_access(
+            auth_info.bearer_token, scope, resource_name
+        )
+
+    key = (auth_info.principal_id, scope, resource_name)
+    decision = _permissions.get(key)
+    log_add(permission_cache_hit=decision is not None)
+    if decision is None:
+        decision = bool(
+            resource_authorizer.has_access(auth_info.bearer_token, scope, resource_name)
+        )
+        _permissions.set(
+            key, decision, ttl=None if decision else PERMISSION_CACHE_NEGATIVE_TTL
+        )
+    return decision
+
+
+def flush_permission_cache() -> None:
+    """Forget all cached permission decisions, e.g. after access was revoked."""
+    _permissions.clear()
+
+
 def dataset_exists(dataset_id: str, dataset_client=Depends(dataset_client)) -> dict:
     try:
         dataset = dataset_client.get_dataset(dataset_id)
@@ -63,7 +207,7 @@ def version_exists(
     dataset_id: str, version: str, dataset_client=Depends(dataset_client)
 ) -> dict:
     try:
-        versions = dataset_client.get_versions(dataset_id)
+        versions = dataset_client.get_versions(dataset_id, prefetch_dataset=True)
         for v in versions:
             if v["version"] == version:
                 return v
@@ -76,6 +220,55 @@ def version_exists(
     )
 
 
+class AuthorizedVersion(NamedTuple):
+    """A dataset version the caller has been authorized for."""
+
+    metadata: dict
+    principal_id: Optional[str]
+
+
+def authorized_version(scope: str):
+    """Like `authorize(scope)` and `version_exists` together, returning the
+    version metadata and the principal of the caller as an
+    `AuthorizedVersion`.
+
+    The permission check and the version lookup are independent, so they're
+    made at the same time. A 401 or 403 is raised as soon as it's known, while
+    a missing version is only reported to callers that have access.
+    """
+    verify_permission = authorize(scope)
+
+    async def _authorized_version(
+        dataset_id: str,
+        version: str,
+        authorization: HTTPAuthorizationCredentials = Depends(http_bearer),
+        keycloak_client=Depends(keycloak_client),
+        resource_authorizer: ResourceAuthorizer = Depends(resource_authorizer),
+        dataset_client=Depends(dataset_client),
+    ) -> AuthorizedVersion:
+        def check_access():
+            auth_info = AuthInfo(authorization, keycloak_client)
+            verify_permission(dataset_id, auth_info, resource_authorizer)
+            return auth_info
+
+        access = asyncio.ensure_future(run_in_threadpool(check_access))
+        version_metadata = asyncio.ensure_future(
+            run_in_threadpool(version_exists, dataset_id, version, dataset_client)
+        )
+        try:
+            auth_info = await access
+        except BaseException:
+            if version_metadata.done():
+                # Retrieve any error, which is masked by the one raised here.
+                version_metadata.exception()
+            else:
+                version_metadata.cancel()
+            raise
+        return AuthorizedVersion(await version_metadata, auth_info.principal_id)
+
+    return _authorized_version
+
+
 def is_event_source(dataset_id: str, dataset=Depends(dataset_exists)) -> bool:
     source_type = dataset.get("source", {}).get("type")
     if source_type == "event":
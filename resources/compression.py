@@ -0,0 +1,147 @@
+import abc
+import os
+import zlib
+from typing import Callable, List
+
+from fastapi import Request, Response, status
+from fastapi.routing import APIRoute
+from starlette.exceptions import HTTPException
+
+from resources.errors import ErrorResponse
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None  # type: ignore
+
+MAX_DECOMPRESSED_BODY_BYTES = int(
+    os.environ.get("MAX_DECOMPRESSED_BODY_BYTES", 32 * 1024 * 1024)
+)
+
+# Upper bound on the amount of output produced by a single decompression step,
+# so that a small, highly compressed body can't blow up memory before the size
+# limit is checked.
+_OUTPUT_CHUNK_SIZE = 256 * 1024
+
+
+class _Decompressor(abc.ABC):
+    def __init__(self, max_size: int):
+        self.max_size = max_size
+        self.size = 0
+
+    def _count(self, data: bytes) -> bytes:
+        self.size += len(data)
+        if self.size > self.max_size:
+            raise ErrorResponse(
+                status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+                f"Decompressed request body exceeds {self.max_size} bytes",
+            )
+        return data
+
+    @abc.abstractmethod
+    def decompress(self, data: bytes) -> List[bytes]:
+        ...
+
+    def finish(self) -> List[bytes]:
+        return []
+
+
+class _GzipDecompressor(_Decompressor):
+    def __init__(self, max_size: int):
+        super().__init__(max_size)
+        self._decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+
+    def decompress(self, data: bytes) -> List[bytes]:
+        chunks = []
+        try:
+            while data and not self._decompressor.eof:
+                chunk = self._decompressor.decompress(data, _OUTPUT_CHUNK_SIZE)
+                chunks.append(self._count(chunk))
+                data = self._decompressor.unconsumed_tail
+        except zlib.error:
+            raise ErrorResponse(status.HTTP_400_BAD_REQUEST, "Invalid gzip data")
+        return chunks
+
+    def finish(self) -> List[bytes]:
+        if not self._decompressor.eof:
+            raise ErrorResponse(status.HTTP_400_BAD_REQUEST, "Truncated gzip data")
+        return []
+
+
+class _ZstdDecompressor(_Decompressor):
+    def __init__(self, max_size: int):
+        super().__init__(max_size)
+        self._chunks: List[bytes] = []
+        self._writer = zstandard.ZstdDecompressor().stream_writer(
+            self, write_size=_OUTPUT_CHUNK_SIZE  # type: ignore
+        )
+
+    def write(self, data: bytes) -> int:
+        # Called by the zstandard stream writer for each block of output.
+        self._chunks.append(self._count(data))
+        return len(data)
+
+    def decompress(self, data: bytes) -> List[bytes]:
+        try:
+            self._writer.write(data)
+        except zstandard.ZstdError:
+            raise ErrorResponse(status.HTTP_400_BAD_REQUEST, "Invalid zstd data")
+        chunks, self._chunks = self._chunks, []
+        return chunks
+
+
+def _decompressor(content_encoding: str, max_size: int) -> _Decompressor:
+    if content_encoding in ("gzip", "x-gzip"):
+        return _GzipDecompressor(max_size)
+    if content_encoding == "zstd" and zstandard is not None:
+        return _ZstdDecompressor(max_size)
+    raise ErrorResponse(
+        status.HTTP_415_UNSUPPORTED_MEDIA_TYPE,
+        f"Unsupported content encoding: {content_encoding}",
+    )
+
+
+class DecompressingRequest(Request):
+    """Request whose body is decompressed according to its `Content-Encoding`.
+
+    The body is decompressed incrementally as it is streamed, so it works both
+    for endpoints reading the whole body and for those consuming
+    `request.stream()` directly. Bodies decompressing to more than
+    `MAX_DECOMPRESSED_BODY_BYTES` are rejected with 413.
+    """
+
+    async def stream(self):
+        content_encoding = self.headers.get("content-encoding", "identity")
+        content_encoding = content_encoding.strip().lower()
+
+        if content_encoding == "identity" or hasattr(self, "_body"):
+            async for data in super().stream():
+                yield data
+            return
+
+        decompressor = _decompressor(content_encoding, MAX_DECOMPRESSED_BODY_BYTES)
+        async for data in super().stream():
+            for chunk in decompressor.decompress(data):
+                if chunk:
+                    yield chunk
+        for chunk in decompressor.finish():
+            yield chunk
+        yield b""
+
+
+class DecompressingRoute(APIRoute):
+    def get_route_handler(self) -> Callable:
+        original_route_handler = super().get_route_handler()
+
+        async def route_handler(request: Request) -> Response:
+            request = DecompressingRequest(request.scope, request.receive)
+            try:
+                return await original_route_handler(request)
+            except HTTPException as e:
+                # FastAPI turns any error raised while reading the body into a
+                # generic 400; surface our own error response instead.
+                if isinstance(e.__cause__, ErrorResponse):
+                    raise e.__cause__
+                raise
+
+        return route_handler
@@ -7,10 +7,12 @@ class ErrorResponse(Exception):
         self,
         status_code: int,
         message: Optional[str] = None,
-        **extra_context: Dict[str, Any],
+        headers: Optional[Dict[str, str]] = None,
+        **extra_context: Any,
     ):
         self.status_code = status_code
         self.message = message
+        self.headers = headers or {}
         self.extra_context = extra_context
 
 
@@ -1,18 +1,40 @@
+import asyncio
 import logging
+import math
 from datetime import date
-from typing import List
+from typing import List, Optional
+from urllib.parse import quote
 
 from botocore.client import ClientError
-from fastapi import APIRouter, Depends, Path, Query, status
+from fastapi import APIRouter, Depends, Header, Path, Query, Request, Response, status
 from okdata.aws.logging import log_add
+from starlette.concurrency import run_in_threadpool
 
-from resources.authorizer import authorize, version_exists
+from resources.authorizer import AuthorizedVersion, authorized_version
+from resources.compression import DecompressingRoute
 from resources.errors import ErrorResponse, error_message_models
 from resources.origo_clients import dataset_client
-from services import ElasticsearchDataService, EventService, PutRecordsError
+from services import (
+    ElasticsearchDataService,
+    EventService,
+    IdempotencyKeyInProgress,
+    IdempotencyKeyReused,
+    IdempotencyService,
+    InvalidEventsError,
+    PutRecordsError,
+    RecordsTooLargeError,
+    ThroughputExceededError,
+)
+from services.ndjson import NdjsonChunker
+from services.idempotency import request_hash
+from services.overflow import get_overflow_store
+from services.validation import event_validator, validate_events
+from services.service import PUT_RECORDS_MAX_WORKERS, record_batch_metrics
 
 logger = logging.getLogger()
-router = APIRouter()
+router = APIRouter(route_class=DecompressingRoute)
+
+NDJSON_MEDIA_TYPE = "application/x-ndjson"
 
 
 def query_service(dataset_client=Depends(dataset_client)) -> ElasticsearchDataService:
@@ -20,12 +42,16 @@ def query_service(dataset_client=Depends(dataset_client)) -> ElasticsearchDataSe
 
 
 def event_service(dataset_client=Depends(dataset_client)) -> EventService:
-    return EventService(dataset_client)
+    return EventService(dataset_client, overflow_store=get_overflow_store())
+
+
+def idempotency_service() -> IdempotencyService:
+    return IdempotencyService()
 
 
 @router.get(
     "",
-    dependencies=[Depends(authorize("okdata:dataset:read")), Depends(version_exists)],
+    dependencies=[Depends(authorized_version("okdata:dataset:read"))],
     responses=error_message_models(400),
 )
 def get(
@@ -53,30 +79,149 @@ def get(
 
 @router.post(
     "",
-    dependencies=[
-        Depends(authorize("okdata:dataset:write")),
-        Depends(version_exists),
-    ],
-    responses=error_message_models(
-        status.HTTP_400_BAD_REQUEST,
-        status.HTTP_403_FORBIDDEN,
-        status.HTTP_404_NOT_FOUND,
-        status.HTTP_422_UNPROCESSABLE_ENTITY,
-        status.HTTP_500_INTERNAL_SERVER_ERROR,
-    ),
+    responses={
+        status.HTTP_207_MULTI_STATUS: {
+            "description": "Some of the events failed (with `per_record_status`)"
+        },
+        **error_message_models(
+            status.HTTP_400_BAD_REQUEST,
+            status.HTTP_403_FORBIDDEN,
+            status.HTTP_404_NOT_FOUND,
+            status.HTTP_409_CONFLICT,
+            status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            status.HTTP_415_UNSUPPORTED_MEDIA_TYPE,
+            status.HTTP_422_UNPROCESSABLE_ENTITY,
+            status.HTTP_429_TOO_MANY_REQUESTS,
+            status.HTTP_500_INTERNAL_SERVER_ERROR,
+        ),
+    },
 )
-def post(
+async def post(
     *,
     dataset_id: str = Path(..., min_length=3, max_length=70, regex="^[a-z0-9-]*$"),
     version: str = Path(..., min_length=1),
+    authorized: AuthorizedVersion = Depends(authorized_version("okdata:dataset:write")),
     event_service=Depends(event_service),
+    idempotency_service=Depends(idempotency_service),
+    idempotency_key: Optional[str] = Header(None, min_length=1, max_length=255),
+    per_record_status: bool = False,
+    request: Request,
+    response: Response,
     events: List[dict],
 ):
+    """
+    Send a list of events. With an `Idempotency-Key` header, retries of a
+    successful request with the same key by the same caller return the
+    original response without sending the events again. A retry arriving while the original request is
+    still in progress gets a 409, and reusing a key for a different request
+    body a 422.
+
+    With `per_record_status`, the response lists the status of each event in
+    order: its `sequence_number` and `shard_id` if it was sent, or its
+    `error_code` and `error_message` if it wasn't. The response status is 207
+    if any of the events failed, so that only those need to be sent again.
+    Events turned away because the write capacity of the stream is exhausted
+    also get a `retry_after` (in seconds), and the response a `Retry-After`
+    header.
+
+    When the dataset version has a JSON schema, no events are sent unless all
+    of them match it.
+    """
     log_add(dataset_id=dataset_id, version=version)
-    dataset = event_service.dataset_client.get_dataset(dataset_id)
+
+    key = None
+    if idempotency_key:
+        # Keys are only unique per caller, so that one caller can neither
+        # replay nor block the requests of another.
+        principal = quote(authorized.principal_id or "", safe="")
+        key = f"{dataset_id}/{version}/{principal}/{idempotency_key}"
+        body_hash = request_hash(await request.body())
+        try:
+            stored = await run_in_threadpool(
+                idempotency_service.reserve, key, body_hash
+            )
+        except IdempotencyKeyInProgress:
+            raise ErrorResponse(
+                status.HTTP_409_CONFLICT,
+                "A request with the same Idempotency-Key is still in progress",
+                headers={"Retry-After": "1"},
+            )
+        except IdempotencyKeyReused:
+            raise ErrorResponse(
+                status.HTTP_422_UNPROCESSABLE_ENTITY,
+                "The Idempotency-Key was already used for a different request",
+            )
+        if stored is not None:
+            response.headers["Idempotent-Replayed"] = "true"
+            return stored.result
+
+    try:
+        result = await _send_events(
+            dataset_id,
+            version,
+            authorized.metadata,
+            event_service,
+            per_record_status,
+            response,
+            events,
+        )
+    except BaseException:
+        if key:
+            await run_in_threadpool(_release_key, idempotency_service, key)
+        raise
+
+    if key:
+        if response.status_code == status.HTTP_207_MULTI_STATUS:
+            # Let the client retry the failed events with the same key.
+            await run_in_threadpool(_release_key, idempotency_service, key)
+        else:
+            try:
+                await run_in_threadpool(
+                    idempotency_service.put_result, key, body_hash, result
+                )
+            except ClientError as e:
+                # The events have been sent, so don't fail the request (and
+                # invite a retry) just because the result couldn't be stored.
+                logger.exception(e)
+                log_add(idempotency_key_stored=False)
+
+    return result
+
+
+async def _send_events(
+    dataset_id,
+    version,
+    version_metadata,
+    event_service,
+    per_record_status,
+    response,
+    events,
+):
+    validator = event_validator(version_metadata.get("schema"))
+    if validator:
+        try:
+            await run_in_threadpool(validate_events, validator, events)
+        except InvalidEventsError as e:
+            raise ErrorResponse(
+                status.HTTP_400_BAD_REQUEST,
+                str(e),
+                invalid_records=e.invalid_records,
+            )
 
     try:
-        return event_service.send_events(dataset, version, events)
+        result = await event_service.send_events_async(
+            dataset_id, version, events, per_record=per_record_status
+        )
+    except RecordsTooLargeError as e:
+        raise ErrorResponse(
+            status.HTTP_400_BAD_REQUEST, str(e), too_large_records=e.indices
+        )
+    except ThroughputExceededError as e:
+        raise ErrorResponse(
+            status.HTTP_429_TOO_MANY_REQUESTS,
+            str(e),
+            headers=_retry_after_header(e.retry_after),
+        )
     except PutRecordsError as e:
         log_add(failed_records=len(e.records))
         raise ErrorResponse(
@@ -84,3 +229,161 @@ def post(
         )
     except ClientError:
         raise ErrorResponse(status.HTTP_500_INTERNAL_SERVER_ERROR, "Server error")
+
+    if per_record_status:
+        failed_record_count = sum("error_code" in status for status in result)
+        result = {"failed_record_count": failed_record_count, "records": result}
+        if failed_record_count:
+            response.status_code = status.HTTP_207_MULTI_STATUS
+            retry_after = max(
+                record_status.get("retry_after", 0)
+                for record_status in result["records"]
+            )
+            if retry_after:
+                response.headers.update(_retry_after_header(retry_after))
+
+    return result
+
+
+def _release_key(idempotency_service: IdempotencyService, key: str) -> None:
+    try:
+        idempotency_service.release(key)
+    except ClientError as e:
+        # The reservation expires by itself after a while.
+        logger.exception(e)
+        log_add(idempotency_key_released=False)
+
+
+@router.post(
+    "/ndjson",
+    responses=error_message_models(
+        status.HTTP_400_BAD_REQUEST,
+        status.HTTP_403_FORBIDDEN,
+        status.HTTP_404_NOT_FOUND,
+        status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+        status.HTTP_415_UNSUPPORTED_MEDIA_TYPE,
+        status.HTTP_429_TOO_MANY_REQUESTS,
+        status.HTTP_500_INTERNAL_SERVER_ERROR,
+    ),
+)
+async def post_ndjson(
+    request: Request,
+    dataset_id: str = Path(..., min_length=3, max_length=70, regex="^[a-z0-9-]*$"),
+    version: str = Path(..., min_length=1),
+    authorized: AuthorizedVersion = Depends(authorized_version("okdata:dataset:write")),
+    event_service=Depends(event_service),
+):
+    """
+    Send events as newline delimited JSON, one event per line:
+        curl -H "Authorization: bearer $TOKEN" -H "Content-Type: application/x-ndjson" --data-binary @events.ndjson -XPOST http://127.0.0.1:8080/{dataset-id}/{version}/events/ndjson
+
+    Events are sent to the stream in chunks while the request body is still
+    arriving. The body may be compressed with gzip or zstd, as indicated by the
+    `Content-Encoding` header. Lines that don't match the JSON schema of the
+    dataset version, if it has one, are reported as invalid.
+    """
+    content_type = request.headers.get("content-type", "").split(";")[0].strip()
+    if content_type != NDJSON_MEDIA_TYPE:
+        raise ErrorResponse(
+            status.HTTP_415_UNSUPPORTED_MEDIA_TYPE,
+            f"Content type must be {NDJSON_MEDIA_TYPE}",
+        )
+
+    log_add(dataset_id=dataset_id, version=version)
+    try:
+        target = await event_service.stream_target_async(dataset_id, version)
+    except ClientError:
+        raise ErrorResponse(status.HTTP_500_INTERNAL_SERVER_ERROR, "Server error")
+
+    chunker = NdjsonChunker(
+        target.partition_key,
+        validator=event_validator(authorized.metadata.get("schema")),
+    )
+    failed_records: List[dict] = []
+    retry_after = 0.0
+    in_flight: List[asyncio.Future] = []
+
+    async def send(records):
+        nonlocal retry_after
+        if target.ordered and failed_records:
+            # Don't let these overtake the records that failed before them.
+            failed_records.extend(records)
+            return
+        try:
+            await event_service.send_records_async(target, records)
+        except ThroughputExceededError as e:
+            failed_records.extend(e.records)
+            retry_after = max(retry_after, e.retry_after)
+        except PutRecordsError as e:
+            failed_records.extend(e.records)
+
+    # Chunks are sent one at a time when records with the same partition key
+    # must stay in order, and held back once one of them has failed.
+    max_in_flight = 1 if target.ordered else PUT_RECORDS_MAX_WORKERS
+
+    async def send_chunks(chunks):
+        for records in chunks:
+            if len(in_flight) >= max_in_flight:
+                await in_flight.pop(0)
+            in_flight.append(asyncio.ensure_future(send(records)))
+
+    try:
+        async for data in request.stream():
+            await send_chunks(chunker.feed(data))
+        await send_chunks(chunker.finish())
+        await asyncio.gather(*in_flight)
+    except ClientError:
+        raise ErrorResponse(status.HTTP_500_INTERNAL_SERVER_ERROR, "Server error")
+    finally:
+        # Don't leave chunks being sent in the background when the request
+        # fails part way.
+        for future in in_flight:
+            future.cancel()
+        await asyncio.gather(*in_flight, return_exceptions=True)
+
+    log_add(num_events=chunker.num_events, num_bytes=chunker.num_bytes)
+    record_batch_metrics(chunker.num_events, chunker.num_bytes, dataset_id)
+
+    _raise_ndjson_errors(chunker, failed_records, retry_after)
+
+    return {"num_events": chunker.num_events}
+
+
+def _raise_ndjson_errors(chunker: NdjsonChunker, failed_records, retry_after):
+    """Raise an `ErrorResponse` if any of the lines seen by `chunker` weren't
+    sent."""
+    skipped_lines = {}
+    if chunker.invalid_lines:
+        skipped_lines["invalid_lines"] = chunker.invalid_lines
+    if chunker.too_large_lines:
+        skipped_lines["too_large_lines"] = chunker.too_large_lines
+
+    if failed_records:
+        log_add(failed_records=len(failed_records))
+        error = PutRecordsError(failed_records)
+        # When chunks were turned away before reaching Kinesis, tell the client
+        # when to send the failed records again.
+        raise ErrorResponse(
+            status.HTTP_429_TOO_MANY_REQUESTS
+            if retry_after
+            else status.HTTP_500_INTERNAL_SERVER_ERROR,
+            str(error),
+            headers=_retry_after_header(retry_after) if retry_after else None,
+            failed_records=failed_records,
+            **skipped_lines,
+        )
+
+    if skipped_lines:
+        num_skipped = len(chunker.invalid_lines) + len(chunker.too_large_lines)
+        raise ErrorResponse(
+            status.HTTP_400_BAD_REQUEST,
+            "{} line{} not sent".format(
+                num_skipped, "s were" if num_skipped > 1 else " was"
+            ),
+            num_events=chunker.num_events,
+            **skipped_lines,
+        )
+
+
+def _retry_after_header(retry_after):
+    return {"Retry-After": str(max(1, math.ceil(retry_after)))}
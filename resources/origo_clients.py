@@ -1,8 +1,23 @@
+import copy
+import os
+from concurrent.futures import ThreadPoolExecutor
+
 from fastapi import Depends
+from keycloak.exceptions import KeycloakAuthenticationError
+from okdata.aws.logging import log_add
 from okdata.sdk.data.dataset import Dataset
 
 
-from clients import setup_origo_sdk, get_keycloak_config
+from cache import TTLCache
+from clients import get_keycloak_config, get_origo_sdk, refresh_keycloak_config
+
+# Dataset metadata is shared between requests for a short while, as it rarely
+# changes and is fetched with the service's own credentials regardless of the
+# caller.
+DATASET_CACHE_TTL = int(os.environ.get("DATASET_CACHE_TTL", 30))
+DATASET_CACHE_SIZE = int(os.environ.get("DATASET_CACHE_SIZE", 256))
+
+_dataset_metadata = TTLCache(DATASET_CACHE_SIZE, DATASET_CACHE_TTL)
 
 
 class OrigoSDK:
@@ -10,7 +25,94 @@ class OrigoSDK:
         self.sdk = sdk
 
     def __call__(self, keycloak_config=Depends(get_keycloak_config)):
-        return setup_origo_sdk(keycloak_config, self.sdk)
+        return get_origo_sdk(keycloak_config, self.sdk)
+
+
+class CachedDatasetClient:
+    """Dataset client caching dataset metadata.
+
+    Datasets and their versions are fetched at most once per instance, which
+    lives for a single request, and are shared between requests through a
+    TTL-bounded cache. Other methods are passed through to `client`.
+    """
+
+    def __init__(self, client: Dataset):
+        self.client = client
+        self.api_calls = 0
+        self._request_cache: dict = {}
+
+    def __getattr__(self, name):
+        return getattr(self.client, name)
+
+    def get_dataset(self, dataset_id):
+        return self._get("get_dataset", dataset_id)
+
+    def get_versions(self, dataset_id, prefetch_dataset=False):
+        """Return the versions of dataset `dataset_id`.
+
+        Most requests need the dataset too, but the metadata API has no single
+        endpoint for both. With `prefetch_dataset`, the dataset is fetched
+        concurrently when neither is cached, so that the two cost a single
+        round trip. Errors fetching the dataset are left to `get_dataset`.
+        """
+        if not prefetch_dataset or self._cached("get_dataset", dataset_id):
+            return self._get("get_versions", dataset_id)
+
+        versions = self._cached("get_versions", dataset_id)
+        if versions is not None:
+            return versions
+
+        with ThreadPoolExecutor(max_workers=2) as executor:
+            dataset = executor.submit(self._fetch, "get_dataset", dataset_id)
+            versions = executor.submit(self._fetch, "get_versions", dataset_id)
+
+        if dataset.exception() is None:
+            self._store("get_dataset", dataset_id, dataset.result())
+        return self._store("get_versions", dataset_id, versions.result())
+
+    def _get(self, method, dataset_id):
+        value = self._cached(method, dataset_id)
+        if value is None:
+            value = self._store(method, dataset_id, self._fetch(method, dataset_id))
+        return value
+
+    def _cached(self, method, dataset_id):
+        key = (method, dataset_id)
+        if key in self._request_cache:
+            return self._request_cache[key]
+
+        value = _dataset_metadata.get(key)
+        if value is not None:
+            # Callers get their own copy, so that they can't change what other
+            # requests see.
+            value = copy.deepcopy(value)
+            self._request_cache[key] = value
+        return value
+
+    def _fetch(self, method, dataset_id):
+        client = self.client
+        try:
+            return getattr(client, method)(dataset_id)
+        except KeycloakAuthenticationError:
+            # The client secret may have been rotated; retry once with a fresh
+            # config.
+            client = get_origo_sdk(refresh_keycloak_config(), type(client))
+            self.client = client
+            return getattr(client, method)(dataset_id)
+
+    def _store(self, method, dataset_id, value):
+        key = (method, dataset_id)
+        _dataset_metadata.set(key, value)
+        self.api_calls += 1
+        log_add(dataset_api_calls=self.api_calls)
+
+        value = copy.deepcopy(value)
+        self._request_cache[key] = value
+        return value
+
+
+_dataset_sdk = OrigoSDK(Dataset)
 
 
-dataset_client = OrigoSDK(Dataset)
+def dataset_client(client=Depends(_dataset_sdk)) -> CachedDatasetClient:
+    return CachedDatasetClient(client)
@@ -2,7 +2,7 @@ import logging
 from typing import Optional
 from datetime import datetime
 from fastapi import Depends, APIRouter, status, Body
-from pydantic import BaseModel, Field
+from pydantic import BaseModel, Field, root_validator
 
 from resources.authorizer import (
     AuthInfo,
@@ -18,6 +18,7 @@ from services import (
     ResourceConflict,
     ResourceNotFound,
 )
+from database import HashKeyDistribution, PartitionKey, PartitionKeyType
 from util import CONFIDENTIALITY_MAP
 
 logger = logging.getLogger()
@@ -45,6 +46,26 @@ class EventStreamIn(BaseModel):
     create_raw: Optional[bool] = True
 
 
+class EventStreamSettingsIn(BaseModel):
+    partition_key: PartitionKey = Field(default_factory=PartitionKey)
+    aggregate_records: bool = False
+    hash_key_distribution: Optional[HashKeyDistribution] = None
+
+    @root_validator(skip_on_failure=True)
+    def random_partition_key_with_hash_keys(cls, values):
+        # Explicit hash keys decide the shard instead of the partition key, so
+        # events with the same partition key would no longer stay in order.
+        partition_key_type = PartitionKeyType(values["partition_key"].type)
+        if (
+            values.get("hash_key_distribution")
+            and partition_key_type != PartitionKeyType.RANDOM
+        ):
+            raise ValueError(
+                "A hash key distribution can only be used with random partition keys"
+            )
+        return values
+
+
 class EventStreamOut(BaseModel):
     id: str
     create_raw: bool
@@ -52,6 +73,9 @@ class EventStreamOut(BaseModel):
     updated_at: datetime
     deleted: bool
     cf_status: str = Field("INACTIVE", max_length=20, alias="status")
+    partition_key: PartitionKey
+    aggregate_records: bool
+    hash_key_distribution: Optional[HashKeyDistribution]
 
 
 class EventStreamWithAcccessRightsOut(EventStreamOut):
@@ -125,11 +149,39 @@ def get(dataset=Depends(dataset_exists), event_stream=Depends(get_event_stream))
 @router.put(
     "",
     dependencies=[Depends(authorize("okdata:dataset:update")), Depends(version_exists)],
-    status_code=status.HTTP_501_NOT_IMPLEMENTED,
-    response_model=Message,
+    response_model=EventStreamOut,
+    response_model_by_alias=True,
+    responses=error_message_models(
+        status.HTTP_404_NOT_FOUND,
+        status.HTTP_500_INTERNAL_SERVER_ERROR,
+    ),
 )
-def put():
-    raise ErrorResponse(status.HTTP_501_NOT_IMPLEMENTED)
+def put(
+    dataset_id: str,
+    version: str,
+    body: EventStreamSettingsIn,
+    auth_info: AuthInfo = Depends(),
+    event_stream_service=Depends(event_stream_service),
+):
+    """
+    Update the settings for sending events to an event stream:
+        curl -H "Authorization: bearer $TOKEN" -H "Content-Type: application/json" --data '{"partition_key":{"type":"path","path":"vehicleId"},"aggregate_records":true}' -XPUT http://127.0.0.1:8080/{dataset-id}/{version}
+    """
+    try:
+        return event_stream_service.update_event_stream_settings(
+            dataset_id=dataset_id,
+            version=version,
+            updated_by=auth_info.principal_id,
+            partition_key=body.partition_key,
+            aggregate_records=body.aggregate_records,
+            hash_key_distribution=body.hash_key_distribution,
+        )
+    except ResourceNotFound:
+        response_msg = f"Event stream with id {dataset_id}/{version} does not exist"
+        raise ErrorResponse(404, response_msg)
+    except Exception as e:
+        logger.exception(e)
+        raise ErrorResponse(500, "Server error")
 
 
 @router.delete(
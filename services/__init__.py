@@ -1,29 +1,43 @@
 from .exceptions import (
+    IdempotencyKeyInProgress,
+    IdempotencyKeyReused,
+    InvalidEventsError,
     PutRecordsError,
+    RecordsTooLargeError,
     ResourceConflict,
     ResourceNotFound,
     ResourceUnderConstruction,
     ResourceUnderDeletion,
     SubResourceNotFound,
+    ThroughputExceededError,
 )
+from .retry import RetryStrategy
 from .service import EventService
 from .stream import EventStreamService
 from .sink import SinkService
 from .subscribable import SubscribableService
 from .cf_status import CfStatusService
 from .events import ElasticsearchDataService
+from .idempotency import IdempotencyService
 
 __all__ = [
     "CfStatusService",
     "ElasticsearchDataService",
     "EventService",
     "EventStreamService",
+    "IdempotencyKeyInProgress",
+    "IdempotencyKeyReused",
+    "IdempotencyService",
+    "InvalidEventsError",
     "PutRecordsError",
+    "RecordsTooLargeError",
     "ResourceConflict",
     "ResourceNotFound",
     "ResourceUnderConstruction",
     "ResourceUnderDeletion",
+    "RetryStrategy",
     "SinkService",
     "SubResourceNotFound",
     "SubscribableService",
+    "ThroughputExceededError",
 ]
@@ -0,0 +1,123 @@
+import os
+import threading
+import time
+
+from botocore.exceptions import ClientError
+from okdata.aws.logging import log_add
+
+from cache import TTLCache
+from clients import get_kinesis_client
+
+# Write limits of a single shard:
+# https://docs.aws.amazon.com/streams/latest/dev/service-sizes-and-limits.html
+SHARD_MAX_BYTES_PER_SECOND = 1024 * 1024
+SHARD_MAX_RECORDS_PER_SECOND = 1000
+
+# How long (in seconds) the shard count of a stream is trusted before it's
+# looked up again.
+SHARD_COUNT_CACHE_TTL = int(os.environ.get("SHARD_COUNT_CACHE_TTL", 300))
+
+_limiters = TTLCache(maxsize=1024, ttl=SHARD_COUNT_CACHE_TTL)
+_MISSING = object()
+
+
+class TokenBucket:
+    """Tokens refilling at `rate` per second, holding at most `capacity`."""
+
+    def __init__(self, rate, capacity, now):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated_at = now
+
+    def refill(self, now):
+        elapsed = now - self.updated_at
+        self.tokens = min(self.capacity, self.tokens + elapsed * self.rate)
+        self.updated_at = now
+
+    def wait_time(self, amount):
+        """Return the number of seconds until `amount` tokens can be taken.
+
+        Amounts beyond the capacity of the bucket can be taken once it's full,
+        leaving it in debt.
+        """
+        needed = min(amount, self.capacity)
+        return max(0.0, (needed - self.tokens) / self.rate)
+
+    def take(self, amount):
+        self.tokens -= amount
+
+
+class StreamLimiter:
+    """Write throughput limiter for a stream with `shard_count` shards.
+
+    Records and bytes each have a token bucket holding one second's worth of
+    the stream's write capacity.
+    """
+
+    def __init__(self, shard_count, clock=time.monotonic):
+        self.shard_count = shard_count
+        self.clock = clock
+
+        now = clock()
+        records_per_second = shard_count * SHARD_MAX_RECORDS_PER_SECOND
+        bytes_per_second = shard_count * SHARD_MAX_BYTES_PER_SECOND
+        self.records = TokenBucket(records_per_second, records_per_second, now)
+        self.bytes = TokenBucket(bytes_per_second, bytes_per_second, now)
+        self._lock = threading.Lock()
+
+    def acquire(self, num_records, num_bytes):
+        """Take capacity for writing `num_records` records of `num_bytes`.
+
+        Return 0 if the capacity was taken, and otherwise the number of seconds
+        to wait before it's available.
+        """
+        with self._lock:
+            now = self.clock()
+            self.records.refill(now)
+            self.bytes.refill(now)
+
+            wait_time = max(
+                self.records.wait_time(num_records), self.bytes.wait_time(num_bytes)
+            )
+            if wait_time == 0:
+                self.records.take(num_records)
+                self.bytes.take(num_bytes)
+
+            return wait_time
+
+
+def acquire(stream_name, num_records, num_bytes):
+    """Take write capacity of `stream_name` for `num_records` of `num_bytes`.
+
+    Return 0 if the write is admitted, and otherwise the number of seconds to
+    wait before trying again. Writes to streams whose shard count is unknown
+    are always admitted.
+
+    Each process keeps its own limiters, so with several processes writing to
+    the same stream this only catches the producers that would exceed the
+    stream's capacity on their own.
+    """
+    limiter = _stream_limiter(stream_name)
+    if limiter is None:
+        return 0
+    return limiter.acquire(num_records, num_bytes)
+
+
+def _stream_limiter(stream_name):
+    limiter = _limiters.get(stream_name, _MISSING)
+    if limiter is _MISSING:
+        shard_count = _shard_count(stream_name)
+        limiter = StreamLimiter(shard_count) if shard_count else None
+        _limiters.set(stream_name, limiter)
+    return limiter
+
+
+def _shard_count(stream_name):
+    try:
+        response = get_kinesis_client().describe_stream_summary(StreamName=stream_name)
+    except ClientError as e:
+        log_add(describe_stream_error=e.response["Error"]["Code"])
+        return None
+
+    return response["StreamDescriptionSummary"]["OpenShardCount"]
@@ -0,0 +1,116 @@
+import hashlib
+
+from services.partition_key import random_partition_key
+
+# Kinesis Producer Library aggregation format:
+# https://github.com/awslabs/amazon-kinesis-producer/blob/master/aggregation-format.md
+MAGIC = b"\xf3\x89\x9a\xc2"
+DIGEST_SIZE = 16
+
+# The KPL's default `AggregationMaxSize`. Keeps a batch of aggregated records
+# well within the payload limit of the Lambda functions consuming the stream.
+AGGREGATION_MAX_BYTES = 51200
+
+# Protobuf field keys, `(field_number << 3) | wire_type`.
+_PARTITION_KEY_TABLE = b"\x0a"  # AggregatedRecord.partition_key_table
+_RECORDS = b"\x1a"  # AggregatedRecord.records
+_PARTITION_KEY_INDEX = b"\x08"  # Record.partition_key_index
+_DATA = b"\x1a"  # Record.data
+
+
+def aggregate_records(records, random_keys=False, max_size=AGGREGATION_MAX_BYTES):
+    """Pack `records` into KPL aggregated records of at most `max_size` bytes.
+
+    Records are only packed together with records with the same partition key,
+    so that records with the same key still end up in order on the same shard.
+    With `random_keys`, the partition keys of `records` are taken to be random
+    and are replaced by a new random key for each aggregated record instead.
+
+    Returns a list of `(record, members)` tuples, where `members` are the
+    records packed into `record`. A record that ends up alone is passed on as
+    it is, which consumers handle like any other non-aggregated record.
+    """
+    open_aggregates = {}
+    aggregates = []
+
+    for record in records:
+        key = None if random_keys else record["PartitionKey"]
+        aggregate = open_aggregates.get(key)
+
+        if aggregate and not aggregate.fits(record["Data"], max_size):
+            aggregates.append(aggregate)
+            aggregate = None
+
+        if aggregate is None:
+            aggregate = _Aggregate(
+                random_partition_key() if random_keys else record["PartitionKey"]
+            )
+            open_aggregates[key] = aggregate
+
+        aggregate.add(record)
+
+    aggregates.extend(open_aggregates.values())
+
+    return [aggregate.record() for aggregate in aggregates]
+
+
+class _Aggregate:
+    def __init__(self, partition_key):
+        self.partition_key = partition_key
+        self.encoded_partition_key = partition_key.encode("utf-8")
+        self.members = []
+        self.entries = [
+            _PARTITION_KEY_TABLE + _length_delimited(self.encoded_partition_key)
+        ]
+        self.size = (
+            len(self.encoded_partition_key)
+            + len(MAGIC)
+            + len(self.entries[0])
+            + DIGEST_SIZE
+        )
+
+    def fits(self, data, max_size):
+        return not self.members or self.size + _entry_size(data) <= max_size
+
+    def add(self, record):
+        # Every record refers to the only entry in the partition key table.
+        message = (
+            _PARTITION_KEY_INDEX
+            + _varint(0)
+            + _DATA
+            + _length_delimited(record["Data"])
+        )
+        entry = _RECORDS + _length_delimited(message)
+        self.members.append(record)
+        self.entries.append(entry)
+        self.size += len(entry)
+
+    def record(self):
+        if len(self.members) == 1:
+            return self.members[0], self.members
+
+        message = b"".join(self.entries)
+        data = MAGIC + message + hashlib.md5(message).digest()
+        return {"Data": data, "PartitionKey": self.partition_key}, self.members
+
+
+def _entry_size(data):
+    message_size = 2 + 1 + _varint_size(len(data)) + len(data)
+    return 1 + _varint_size(message_size) + message_size
+
+
+def _length_delimited(value):
+    return _varint(len(value)) + value
+
+
+def _varint(value):
+    encoded = bytearray()
+    while value > 0x7F:
+        encoded.append((value & 0x7F) | 0x80)
+        value >>= 7
+    encoded.append(value)
+    return bytes(encoded)
+
+
+def _varint_size(value):
+    return len(_varint(value))
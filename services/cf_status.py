@@ -1,4 +1,5 @@
 from database import EventStreamsTable, CfStackType
+from services.service import invalidate_stream_target
 
 
 class CfStatusService:
@@ -15,6 +16,7 @@ class CfStatusService:
         if cf_stack_type == CfStackType.EVENT_STREAM:
             event_stream.cf_status = cf_status
             self.event_streams_table.put_event_stream(event_stream)
+            invalidate_stream_target(event_stream_id)
 
         elif cf_stack_type == CfStackType.SUBSCRIBABLE:
             event_stream.subscribable.cf_status = cf_status
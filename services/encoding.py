@@ -0,0 +1,36 @@
+import json
+
+try:
+    import orjson
+except ImportError:
+    orjson = None  # type: ignore
+
+_json_encoder = json.JSONEncoder(ensure_ascii=False, separators=(",", ":"))
+
+
+def encode_events(events):
+    """Encode `events` as newline terminated lines of compact JSON.
+
+    Returns a list with the encoded bytes of each event. The encoded events are
+    passed on as Kinesis record data as is, so their sizes are simply their
+    lengths.
+    """
+    if orjson is None:
+        return [_encode_json(event) for event in events]
+
+    dumps = orjson.dumps
+    option = orjson.OPT_APPEND_NEWLINE
+    encoded = []
+
+    for event in events:
+        try:
+            encoded.append(dumps(event, option=option))
+        except orjson.JSONEncodeError:
+            # E.g. integers beyond 64 bits, which orjson refuses to encode.
+            encoded.append(_encode_json(event))
+
+    return encoded
+
+
+def _encode_json(event):
+    return (_json_encoder.encode(event) + "\n").encode("utf-8")
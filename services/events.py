@@ -4,6 +4,7 @@ import math
 from elasticsearch_dsl import Search
 from okdata.sdk.data.dataset import Dataset
 
+import metrics
 from database import ElasticsearchConnection
 from util import CONFIDENTIALITY_MAP
 
@@ -37,7 +38,9 @@ class ElasticsearchDataService:
 
         logger.info(f"search: {s.to_dict()}")
 
-        response = s.execute()
+        response = metrics.log_duration(
+            s.execute, "es_query_duration", dataset_id=dataset_id
+        )
 
         if not response:
             logger.warning("Could not get a response from ES")
@@ -69,7 +72,9 @@ class ElasticsearchDataService:
             },
         }
         s = Search(using=alias, index=index).update_from_dict(body)
-        response = s.execute()
+        response = metrics.log_duration(
+            s.execute, "es_query_duration", dataset_id=dataset_id
+        )
 
         count = response["aggregations"]["count_events"]["buckets"][0]["doc_count"]
 
@@ -31,3 +31,46 @@ class PutRecordsError(Exception):
                 "s" if len(records) > 1 else "",
             )
         )
+
+
+class ThroughputExceededError(PutRecordsError):
+    def __init__(self, records, retry_after):
+        self.records = records
+        self.retry_after = retry_after
+        Exception.__init__(
+            self,
+            "Write throughput of the stream exceeded, retry after {:.1f} "
+            "seconds".format(retry_after),
+        )
+
+
+class InvalidEventsError(Exception):
+    def __init__(self, invalid_records):
+        self.invalid_records = invalid_records
+        super().__init__(
+            "Element{} at index {} {} not match the dataset schema".format(
+                "s" if len(invalid_records) > 1 else "",
+                ", ".join(str(record["index"]) for record in invalid_records),
+                "do" if len(invalid_records) > 1 else "does",
+            )
+        )
+
+
+class RecordsTooLargeError(Exception):
+    def __init__(self, indices):
+        self.indices = indices
+        super().__init__(
+            "Element{} at index {} exceed{} the maximum record size".format(
+                "s" if len(indices) > 1 else "",
+                ", ".join(str(i) for i in indices),
+                "" if len(indices) > 1 else "s",
+            )
+        )
+
+
+class IdempotencyKeyInProgress(Exception):
+    pass
+
+
+class IdempotencyKeyReused(Exception):
+    pass
@@ -0,0 +1,99 @@
+import hashlib
+import os
+import time
+from typing import Any, NamedTuple, Optional
+
+from okdata.aws.logging import log_add
+
+from cache import TTLCache
+from database import IdempotencyKeysTable
+from services.exceptions import IdempotencyKeyInProgress, IdempotencyKeyReused
+
+# How long the result of a request is kept for retries with the same key.
+IDEMPOTENCY_KEY_TTL = int(os.environ.get("IDEMPOTENCY_KEY_TTL", 24 * 60 * 60))
+IDEMPOTENCY_CACHE_SIZE = int(os.environ.get("IDEMPOTENCY_CACHE_SIZE", 1024))
+
+# How long a key stays reserved for a request in progress. It's well above the
+# API's timeout, so that only requests that died half way through leave a
+# reservation behind for this long.
+IDEMPOTENCY_RESERVATION_TTL = int(os.environ.get("IDEMPOTENCY_RESERVATION_TTL", 300))
+
+# Results of recent requests, so that hot retries hitting the same process
+# don't need a round trip to DynamoDB.
+_recent_results = TTLCache(IDEMPOTENCY_CACHE_SIZE, IDEMPOTENCY_KEY_TTL)
+
+
+class IdempotentResult(NamedTuple):
+    result: Any
+    expires_at: int
+    request_hash: str
+
+
+def request_hash(body: bytes) -> str:
+    return hashlib.sha256(body).hexdigest()
+
+
+class IdempotencyService:
+    def __init__(self):
+        self.idempotency_keys_table = IdempotencyKeysTable()
+
+    def reserve(self, key: str, request_hash: str) -> Optional[IdempotentResult]:
+        """Reserve `key` for a request with a body hashing to `request_hash`.
+
+        Return the stored result when a request with the same key and body has
+        already completed, and None when the key is now reserved for this
+        request, which must then either `put_result` or `release` it.
+
+        Raise `IdempotencyKeyInProgress` when another request with the key is
+        still in progress, and `IdempotencyKeyReused` when the key was used
+        for a request with a different body.
+        """
+        stored = _recent_results.get(key)
+        if stored is not None:
+            log_add(idempotency_key_found="cache")
+            return self._check_hash(stored, request_hash)
+
+        expires_at = int(time.time()) + IDEMPOTENCY_RESERVATION_TTL
+        if self.idempotency_keys_table.reserve(key, request_hash, expires_at):
+            log_add(idempotency_key_found=None)
+            return None
+
+        item = self.idempotency_keys_table.get(key)
+        if item is None:
+            # The other request released the key meanwhile; try again.
+            return self.reserve(key, request_hash)
+
+        if "result" not in item:
+            log_add(idempotency_key_found="in_progress")
+            if item.get("request_hash") != request_hash:
+                raise IdempotencyKeyReused
+            raise IdempotencyKeyInProgress
+
+        log_add(idempotency_key_found="table")
+        stored = IdempotentResult(
+            item["result"], item["expires_at"], item.get("request_hash", "")
+        )
+        _recent_results.set(key, stored, ttl=stored.expires_at - time.time())
+        return self._check_hash(stored, request_hash)
+
+    def put_result(self, key: str, request_hash: str, result: Any) -> IdempotentResult:
+        """Store `result` as the result of the request reserving `key`."""
+        stored = IdempotentResult(
+            result, int(time.time()) + IDEMPOTENCY_KEY_TTL, request_hash
+        )
+        self.idempotency_keys_table.put_result(
+            key, request_hash, result, stored.expires_at
+        )
+        _recent_results.set(key, stored)
+        return stored
+
+    def release(self, key: str) -> None:
+        """Give up the reservation of `key`, letting the request be retried."""
+        self.idempotency_keys_table.delete(key)
+
+    @staticmethod
+    def _check_hash(stored: IdempotentResult, request_hash: str) -> IdempotentResult:
+        # Results stored before request hashes were kept have none to compare.
+        if stored.request_hash and stored.request_hash != request_hash:
+            raise IdempotencyKeyReused
+        return stored
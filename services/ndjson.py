@@ -0,0 +1,141 @@
+import json
+
+try:
+    import orjson
+except ImportError:
+    orjson = None  # type: ignore
+
+from services.partition_key import random_partition_key
+from services.service import (
+    PUT_RECORDS_MAX_BYTES,
+    PUT_RECORDS_MAX_RECORDS,
+    RECORD_MAX_BYTES,
+)
+
+
+class NdjsonChunker:
+    """Split newline delimited JSON into chunks of Kinesis records.
+
+    Data is fed to the chunker as it arrives, and every chunk is handed back
+    as soon as it is full, so that it can be sent while the rest of the data is
+    still arriving. Each line is used as record data as it is, but it's always
+    decoded first so that malformed JSON is never sent on.
+
+    Lines that are not JSON objects, that don't match the schema checked by
+    `validator`, or that exceed the maximum record size, are skipped and their
+    (1-based) line numbers recorded.
+    """
+
+    def __init__(
+        self,
+        partition_key=random_partition_key,
+        max_records=PUT_RECORDS_MAX_RECORDS,
+        max_bytes=PUT_RECORDS_MAX_BYTES,
+        validator=None,
+    ):
+        self.partition_key = partition_key
+        self.validator = validator
+        self.max_records = max_records
+        self.max_bytes = max_bytes
+
+        self.num_events = 0
+        self.num_bytes = 0
+        self.invalid_lines = []
+        self.too_large_lines = []
+
+        self._buffer = b""
+        self._oversized = False
+        self._line_number = 0
+        self._records = []
+        self._size = 0
+
+    def feed(self, data):
+        """Add `data` and return the chunks of records it completed."""
+        chunks = []
+        lines = (self._buffer + data).split(b"\n")
+        self._buffer = lines.pop()
+
+        for line in lines:
+            self._add_line(line, chunks)
+
+        if len(self._buffer) > RECORD_MAX_BYTES:
+            # Don't keep buffering a line that is going to be skipped anyway.
+            self._oversized = True
+            self._buffer = b""
+
+        return chunks
+
+    def finish(self):
+        """Return the remaining chunks of records once all data is fed."""
+        chunks = []
+
+        if self._buffer or self._oversized:
+            self._add_line(self._buffer, chunks)
+            self._buffer = b""
+
+        if self._records:
+            chunks.append(self._take_chunk())
+
+        return chunks
+
+    def _add_line(self, line, chunks):
+        self._line_number += 1
+
+        if self._oversized:
+            self._oversized = False
+            self.too_large_lines.append(self._line_number)
+            return
+
+        line = line.strip()
+        if not line:
+            return
+
+        if not (line.startswith(b"{") and line.endswith(b"}")):
+            self.invalid_lines.append(self._line_number)
+            return
+
+        try:
+            if (
+                orjson is not None
+                and self.partition_key is random_partition_key
+                and self.validator is None
+            ):
+                # The event is only checked to be valid JSON here, so the
+                # faster parser can be used even though it reads very large
+                # integers as floats.
+                event = orjson.loads(line)
+            else:
+                event = json.loads(line)
+        except ValueError:
+            self.invalid_lines.append(self._line_number)
+            return
+
+        if self.validator is not None and not self.validator.is_valid(event):
+            self.invalid_lines.append(self._line_number)
+            return
+
+        partition_key = self.partition_key(event)
+
+        record = {"Data": line + b"\n", "PartitionKey": partition_key}
+        record_size = len(record["Data"]) + len(partition_key.encode("utf-8"))
+
+        if record_size > RECORD_MAX_BYTES:
+            self.too_large_lines.append(self._line_number)
+            return
+
+        if self._records and (
+            len(self._records) == self.max_records
+            or self._size + record_size > self.max_bytes
+        ):
+            chunks.append(self._take_chunk())
+
+        self._records.append(record)
+        self._size += record_size
+        self.num_events += 1
+        self.num_bytes += len(record["Data"])
+
+    def _take_chunk(self):
+        chunk = self._records
+        self._records = []
+        self._size = 0
+        return chunk
@@ -0,0 +1,346 @@
+import abc
+import base64
+import contextlib
+import functools
+import json
+import os
+import time
+import uuid
+from typing import Dict, List, Optional
+
+import boto3
+from botocore.exceptions import BotoCoreError, ClientError
+from okdata.aws.logging import log_add
+
+from database import IdempotencyKeysTable
+from services.exceptions import PutRecordsError
+
+# Extra time a drain leases a batch for, beyond the time it may spend sending
+# it, to cover reading, rewriting and deleting the batch.
+OVERFLOW_LEASE_MARGIN = 30
+
+
+class OverflowStore(abc.ABC):
+    """Durable storage for records that couldn't be sent to their stream.
+
+    Records are stored in batches. Batch IDs start with the name of the
+    stream the records belong to, and sort in the order the batches were
+    stored.
+    """
+
+    def put(self, stream_name: str, records: List[dict]) -> str:
+        """Store `records` for `stream_name` as a new batch, returning its ID."""
+        batch_id = f"{stream_name}/{time.time_ns():020d}-{uuid.uuid4().hex}"
+        self._write(batch_id, _encode_records(records))
+        return batch_id
+
+    def get(self, batch_id: str) -> List[dict]:
+        """Return the records of batch `batch_id`, raising KeyError if it's
+        gone."""
+        return _decode_records(self._read(batch_id))
+
+    def replace(self, batch_id: str, records: List[dict]) -> None:
+        """Replace the records of batch `batch_id`, e.g. with the ones left
+        after a partial drain."""
+        self._write(batch_id, _encode_records(records))
+
+    @abc.abstractmethod
+    def batches(self) -> List[str]:
+        """Return the IDs of all stored batches, oldest first."""
+
+    @abc.abstractmethod
+    def delete(self, batch_id: str) -> None:
+        ...
+
+    @abc.abstractmethod
+    def lease(self, batch_id: str, seconds: float) -> bool:
+        """Lease batch `batch_id` for `seconds`, so that no other drain
+        replays it meanwhile.
+
+        Return False when the batch is already leased.
+        """
+
+    @abc.abstractmethod
+    def release(self, batch_id: str) -> None:
+        """Give up the lease of batch `batch_id`."""
+
+    @abc.abstractmethod
+    def _write(self, batch_id: str, body: bytes) -> None:
+        ...
+
+    @abc.abstractmethod
+    def _read(self, batch_id: str) -> bytes:
+        ...
+
+
+class LocalOverflowStore(OverflowStore):
+    """Overflow store keeping batches as files below `directory`."""
+
+    def __init__(self, directory: str):
+        self.directory = directory
+
+    def batches(self) -> List[str]:
+        batch_ids = []
+        for root, _, files in os.walk(self.directory):
+            for name in files:
+                if name.endswith(".json"):
+                    path = os.path.relpath(os.path.join(root, name), self.directory)
+                    batch_ids.append(path[: -len(".json")].replace(os.sep, "/"))
+        return sorted(batch_ids, key=_batch_sort_key)
+
+    def delete(self, batch_id: str) -> None:
+        os.remove(self._path(batch_id))
+
+    def lease(self, batch_id: str, seconds: float) -> bool:
+        path = self._path(batch_id) + ".lease"
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+
+        # The lease is written to a file of its own first and then linked into
+        # place, which fails if the lease file exists already.
+        tmp_path = f"{path}.{uuid.uuid4().hex}"
+        with open(tmp_path, "w") as f:
+            f.write(str(time.time() + seconds))
+        try:
+            for _ in range(2):
+                try:
+                    os.link(tmp_path, path)
+                    return True
+                except FileExistsError:
+                    if not _lease_expired(path):
+                        return False
+                    # Break the lease of a drain that died, then try again.
+                    with contextlib.suppress(FileNotFoundError):
+                        os.remove(path)
+            return False
+        finally:
+            os.remove(tmp_path)
+
+    def release(self, batch_id: str) -> None:
+        with contextlib.suppress(FileNotFoundError):
+            os.remove(self._path(batch_id) + ".lease")
+
+    def _write(self, batch_id: str, body: bytes) -> None:
+        path = self._path(batch_id)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+
+        # Write to a temporary file first, so that a crash never leaves a
+        # partially written batch behind.
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(body)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+
+    def _read(self, batch_id: str) -> bytes:
+        try:
+            with open(self._path(batch_id), "rb") as f:
+                return f.read()
+        except FileNotFoundError:
+            raise KeyError(batch_id)
+
+    def _path(self, batch_id: str) -> str:
+        return os.path.join(self.directory, *batch_id.split("/")) + ".json"
+
+
+class S3OverflowStore(OverflowStore):
+    """Overflow store keeping batches as objects in an S3 bucket.
+
+    S3 can't write objects conditionally, so batches are leased with
+    conditional writes to `lease_table` instead, by default the idempotency
+    keys table.
+    """
+
+    def __init__(
+        self,
+        bucket: str,
+        prefix: str = "overflow/",
+        s3_client=None,
+        lease_table=None,
+    ):
+        self.bucket = bucket
+        self.prefix = prefix
+        self.s3_client = s3_client or boto3.client("s3", region_name="eu-west-1")
+        self.lease_table = lease_table or IdempotencyKeysTable()
+
+    def batches(self) -> List[str]:
+        batch_ids = []
+        paginator = self.s3_client.get_paginator("list_objects_v2")
+        for page in paginator.paginate(Bucket=self.bucket, Prefix=self.prefix):
+            for obj in page.get("Contents", []):
+                key = obj["Key"]
+                if key.endswith(".json"):
+                    batch_ids.append(key[len(self.prefix) : -len(".json")])
+        return sorted(batch_ids, key=_batch_sort_key)
+
+    def delete(self, batch_id: str) -> None:
+        self.s3_client.delete_object(Bucket=self.bucket, Key=self._key(batch_id))
+
+    def lease(self, batch_id: str, seconds: float) -> bool:
+        return self.lease_table.reserve(
+            self._lease_key(batch_id), "overflow-drain", int(time.time() + seconds)
+        )
+
+    def release(self, batch_id: str) -> None:
+        self.lease_table.delete(self._lease_key(batch_id))
+
+    def _write(self, batch_id: str, body: bytes) -> None:
+        self.s3_client.put_object(
+            Bucket=self.bucket,
+            Key=self._key(batch_id),
+            Body=body,
+            ServerSideEncryption="AES256",
+        )
+
+    def _read(self, batch_id: str) -> bytes:
+        try:
+            response = self.s3_client.get_object(
+                Bucket=self.bucket, Key=self._key(batch_id)
+            )
+        except self.s3_client.exceptions.NoSuchKey:
+            raise KeyError(batch_id)
+        return response["Body"].read()
+
+    def _key(self, batch_id: str) -> str:
+        return f"{self.prefix}{batch_id}.json"
+
+    def _lease_key(self, batch_id: str) -> str:
+        return f"overflow-lease/{self.bucket}/{self._key(batch_id)}"
+
+
+@functools.lru_cache(maxsize=None)
+def get_overflow_store() -> Optional[OverflowStore]:
+    """Return the configured overflow store of the process, if any.
+
+    Records go to the S3 bucket `OVERFLOW_BUCKET` when set, and otherwise to
+    the directory `OVERFLOW_DIRECTORY` when that is set.
+    """
+    if os.environ.get("OVERFLOW_BUCKET"):
+        return S3OverflowStore(os.environ["OVERFLOW_BUCKET"])
+    if os.environ.get("OVERFLOW_DIRECTORY"):
+        return LocalOverflowStore(os.environ["OVERFLOW_DIRECTORY"])
+    return None
+
+
+def drain(
+    store: OverflowStore, event_service, retries=3, deadline=None, errors=None
+) -> Dict[str, int]:
+    """Replay the batches in `store` into their streams, oldest first.
+
+    Batches are deleted once all of their records are accepted. When some
+    records of a batch still fail, the batch is left with just those, and the
+    remaining batches of that stream are left for a later drain, so that
+    records are replayed in the order they were stored. The same goes for
+    batches leased by another drain running at the same time.
+
+    With a `deadline` (a `time.monotonic()` value), no batch is started
+    unless it can be given the whole retry time budget of `event_service`
+    before the deadline.
+
+    Batches that can't be replayed at all because of an error from Kinesis
+    (other than records failing) have the error appended to `errors`, if
+    given.
+
+    Return the number of records replayed per stream.
+    """
+    replayed: Dict[str, int] = {}
+    blocked = set()
+    batch_time = event_service.retry_strategy.time_budget
+
+    for batch_id in store.batches():
+        stream_name = batch_id.rsplit("/", 1)[0]
+        if stream_name in blocked:
+            continue
+
+        if deadline is not None and time.monotonic() + batch_time > deadline:
+            log_add(overflow_drain_out_of_time=True)
+            break
+
+        if not store.lease(batch_id, batch_time + OVERFLOW_LEASE_MARGIN):
+            blocked.add(stream_name)
+            continue
+
+        try:
+            replayed[stream_name] = replayed.get(stream_name, 0) + _replay(
+                store, batch_id, stream_name, event_service, retries, blocked, errors
+            )
+        finally:
+            store.release(batch_id)
+
+    log_add(
+        overflow_replayed_records=sum(replayed.values()),
+        overflow_blocked_streams=sorted(blocked),
+    )
+    return replayed
+
+
+def _replay(
+    store, batch_id, stream_name, event_service, retries, blocked, errors
+) -> int:
+    """Replay batch `batch_id`, returning the number of records accepted."""
+    try:
+        records = store.get(batch_id)
+    except KeyError:
+        # Already replayed by another drain since the batches were listed.
+        return 0
+
+    remaining = []
+    try:
+        event_service.replay_records(records, stream_name, retries)
+    except PutRecordsError as e:
+        failed = {id(record) for record in e.records}
+        remaining = [record for record in records if id(record) in failed]
+    except (BotoCoreError, ClientError) as e:
+        log_add(overflow_drain_error=str(e))
+        if errors is not None:
+            errors.append(e)
+        remaining = records
+
+    if remaining:
+        if len(remaining) < len(records):
+            store.replace(batch_id, remaining)
+        blocked.add(stream_name)
+    else:
+        store.delete(batch_id)
+
+    return len(records) - len(remaining)
+
+
+def _lease_expired(path: str) -> bool:
+    try:
+        with open(path) as f:
+            return float(f.read()) <= time.time()
+    except (FileNotFoundError, ValueError):
+        return True
+
+
+def _batch_sort_key(batch_id: str):
+    stream_name, name = batch_id.rsplit("/", 1)
+    return name, stream_name
+
+
+def _encode_records(records: List[dict]) -> bytes:
+    lines = []
+    for record in records:
+        data = record["Data"]
+        if isinstance(data, str):
+            data = data.encode("utf-8")
+        lines.append(
+            json.dumps(
+                {
+                    "PartitionKey": record["PartitionKey"],
+                    "Data": base64.b64encode(data).decode("ascii"),
+                }
+            )
+        )
+    return "\n".join(lines).encode("utf-8")
+
+
+def _decode_records(body: bytes) -> List[dict]:
+    records = []
+    for line in body.decode("utf-8").splitlines():
+        if line:
+            record = json.loads(line)
+            record["Data"] = base64.b64decode(record["Data"])
+            records.append(record)
+    return records
@@ -0,0 +1,57 @@
+import hashlib
+import json
+from random import getrandbits
+
+from database import PartitionKey, PartitionKeyType
+
+# https://docs.aws.amazon.com/kinesis/latest/APIReference/API_PutRecordsRequestEntry.html
+MAX_PARTITION_KEY_LENGTH = 256
+
+
+def random_partition_key(event=None):
+    # Kinesis hashes the partition key anyway, so 64 random bits spread events
+    # over the shards as well as a UUID does, for a fraction of the cost.
+    return "%016x" % getrandbits(64)
+
+
+def partition_key_function(partition_key: PartitionKey):
+    """Return a function mapping an event to its partition key.
+
+    Events missing the configured values get a random partition key.
+    """
+    partition_key_type = PartitionKeyType(partition_key.type)
+
+    if partition_key_type == PartitionKeyType.PATH:
+        path = (partition_key.path or "").split(".")
+
+        def path_partition_key(event):
+            value = lookup(event, path)
+            if value is None or value == "":
+                return random_partition_key()
+            return str(value)[:MAX_PARTITION_KEY_LENGTH]
+
+        return path_partition_key
+
+    if partition_key_type == PartitionKeyType.HASH:
+        paths = [field.split(".") for field in partition_key.fields]
+
+        def hash_partition_key(event):
+            values = [lookup(event, path) for path in paths]
+            if all(value is None for value in values):
+                return random_partition_key()
+            encoded = json.dumps(values, sort_keys=True, default=str).encode("utf-8")
+            return hashlib.md5(encoded).hexdigest()
+
+        return hash_partition_key
+
+    return random_partition_key
+
+
+def lookup(event, path):
+    """Return the value at `path` (a list of keys) in `event`, or None."""
+    value = event
+    for key in path:
+        if not isinstance(value, dict):
+            return None
+        value = value.get(key)
+    return value
@@ -0,0 +1,49 @@
+import random
+import time
+from dataclasses import dataclass, field
+
+# Record level error codes from PutRecords that mean the shard (or the KMS key
+# encrypting it) is over its limits:
+# https://docs.aws.amazon.com/kinesis/latest/APIReference/API_PutRecordsResultEntry.html
+THROTTLING_ERROR_CODES = frozenset(
+    ["ProvisionedThroughputExceededException", "KMSThrottlingException"]
+)
+
+
+@dataclass
+class RetryStrategy:
+    """Backoff between retries of records that PutRecords failed to write.
+
+    Delays use decorrelated jitter, see
+    https://aws.amazon.com/blogs/architecture/exponential-backoff-and-jitter/.
+    Throttled records wait for the per-second shard limits to free up, so they
+    start from a longer delay than records that failed with an internal error.
+    """
+
+    base_delay: float = 0.02
+    throttling_base_delay: float = 0.1
+    max_delay: float = 2.0
+    # Total time one batch may spend on retries. Keep it well within the 29 s
+    # Lambda (and API Gateway) timeout.
+    time_budget: float = 20.0
+    rng: random.Random = field(default_factory=random.Random)
+
+    def delay(self, previous_delay, error_codes):
+        """Return the number of seconds to wait before the next attempt.
+
+        `previous_delay` is the delay before the previous attempt (0 before
+        the first retry), and `error_codes` the error codes of the records
+        that failed.
+        """
+        base = (
+            self.throttling_base_delay if is_throttled(error_codes) else self.base_delay
+        )
+        upper = max(base, previous_delay * 3)
+        return min(self.max_delay, self.rng.uniform(base, upper))
+
+    def sleep(self, delay):
+        time.sleep(delay)
+
+
+def is_throttled(error_codes):
+    return not THROTTLING_ERROR_CODES.isdisjoint(error_codes)
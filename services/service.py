@@ -1,26 +1,74 @@
-import json
-import uuid
+import asyncio
+import functools
+import os
+import time
+from typing import Callable, NamedTuple, Optional
 
-import boto3
-import botocore
-from okdata.aws.logging import log_add, log_duration
+from botocore.exceptions import BotoCoreError, ClientError
+from okdata.aws.logging import log_add
 from okdata.sdk.data.dataset import Dataset
 
-from clients import CloudformationClient
-from database import EventStreamsTable, EventStream
-from services import PutRecordsError, datetime_utils
+import metrics
+from cache import TTLCache
+from clients import CloudformationClient, get_kinesis_client
+from database import EventStreamsTable, EventStream, HashKeyDistribution
+from services import (
+    PutRecordsError,
+    RecordsTooLargeError,
+    ThroughputExceededError,
+    admission,
+    datetime_utils,
+    shard_map,
+)
+from services.aggregation import aggregate_records
+from services.encoding import encode_events
+from services.overflow import OverflowStore
+from services.partition_key import partition_key_function, random_partition_key
+from services.retry import RetryStrategy
 from util import get_confidentiality
 
-RETRY_CONFIG = botocore.config.Config(
-    connect_timeout=3,
-    read_timeout=3,
-    retries={"max_attempts": 3, "mode": "standard"},
-)
+# Limits for a single PutRecords request:
+# https://docs.aws.amazon.com/kinesis/latest/APIReference/API_PutRecords.html
+PUT_RECORDS_MAX_RECORDS = 500
+PUT_RECORDS_MAX_BYTES = 5 * 1024 * 1024
+# Limit for the data blob and partition key of a single record.
+RECORD_MAX_BYTES = 1024 * 1024
+
+# Number of PutRecords requests that may be in flight at the same time for a
+# single batch of events.
+PUT_RECORDS_MAX_WORKERS = int(os.environ.get("PUT_RECORDS_MAX_WORKERS", 4))
+
+# How long (in seconds) the stream target of a dataset version is cached, to
+# save looking up the dataset and its event stream on every ingest request.
+STREAM_TARGET_CACHE_TTL = int(os.environ.get("STREAM_TARGET_CACHE_TTL", 60))
+
+_stream_targets = TTLCache(maxsize=1024, ttl=STREAM_TARGET_CACHE_TTL)
+
+
+class StreamTarget(NamedTuple):
+    """The stream events for a dataset version go to, and how they're sent."""
+
+    stream_name: str
+    partition_key: Callable[..., str]
+    aggregate: bool
+    hash_key_distribution: Optional[HashKeyDistribution] = None
+
+    @property
+    def ordered(self) -> bool:
+        """Whether records with the same partition key must arrive in order."""
+        return self.partition_key is not random_partition_key
 
 
 class EventService:
-    def __init__(self, dataset_client: Dataset):
+    def __init__(
+        self,
+        dataset_client: Dataset,
+        retry_strategy: Optional[RetryStrategy] = None,
+        overflow_store: Optional[OverflowStore] = None,
+    ):
         self.dataset_client = dataset_client
+        self.retry_strategy = retry_strategy or RetryStrategy()
+        self.overflow_store = overflow_store
         self.cloudformation_client = CloudformationClient()
         self.event_streams_table = EventStreamsTable()
 
@@ -33,65 +81,635 @@ class EventService:
         event_stream.updated_by = updated_by
         event_stream.updated_at = datetime_utils.utc_now_with_timezone()
         self.event_streams_table.put_event_stream(event_stream)
+        invalidate_stream_target(event_stream.id)
+
+    async def send_events_async(
+        self,
+        dataset_id,
+        version,
+        events,
+        retries=3,
+        aggregate=None,
+        per_record=False,
+    ):
+        """Send `events` to the stream of dataset `dataset_id` version `version`.
+
+        The dataset and its event stream are looked up concurrently, and the
+        PutRecords requests for the chunks of events are in flight together.
+        The blocking calls to AWS and the metadata API run in the default
+        executor, so the event loop is free while they wait, but each of them
+        still occupies a thread.
+
+        With `aggregate`, events are packed into KPL aggregated records. It
+        defaults to the `aggregate_records` setting of the event stream.
 
-    def send_events(self, dataset, version, events, retries=3):
+        By default a `PutRecordsError` is raised if any of the events couldn't
+        be sent. With `per_record`, the status of each event is returned
+        instead; see `_record_status`.
+        """
         log_add(num_events=len(events))
 
+        target = await self.stream_target_async(dataset_id, version)
+        if aggregate is not None:
+            target = target._replace(aggregate=aggregate)
+        records, record_sizes = await _run_in_thread(
+            self._event_records, events, target.partition_key, dataset_id
+        )
+        results = {} if per_record else None
+
+        start_time = time.perf_counter_ns()
+        try:
+            await self.send_records_async(
+                target, records, retries, results, record_sizes
+            )
+        except PutRecordsError:
+            if not per_record:
+                raise
+        finally:
+            metrics.record_duration(
+                "kinesis_put_records_duration", start_time, dataset_id=dataset_id
+            )
+
+        if per_record:
+            return _record_statuses(records, results)
+
+    async def stream_target_async(self, dataset_id, version):
+        """Look up the stream target of dataset `dataset_id` version `version`.
+
+        The dataset (for its confidentiality) and the event stream are fetched
+        concurrently, unless the target is already cached.
+        """
+        event_stream_id = f"{dataset_id}/{version}"
+        target = _cached_stream_target(event_stream_id)
+        if target:
+            return target
+
+        dataset, event_stream = await asyncio.gather(
+            _run_in_thread(self.dataset_client.get_dataset, dataset_id),
+            _run_in_thread(self._lookup_event_stream, dataset_id, version),
+        )
         confidentiality = get_confidentiality(dataset)
-        stream_name = self._stream_name(dataset["Id"], version, confidentiality)
+        stream_name = _format_stream_name(
+            dataset_id, version, confidentiality, event_stream
+        )
+        return self._stream_target(
+            event_stream_id, stream_name, confidentiality, event_stream
+        )
+
+    def _stream_target(
+        self, event_stream_id, stream_name, confidentiality, event_stream
+    ):
         log_add(confidentiality=confidentiality, stream_name=stream_name)
 
-        log_duration(
-            lambda: self._put_records_to_kinesis(
-                self._event_records(events), stream_name, retries
-            ),
-            "kinesis_put_records_duration",
+        if event_stream is None:
+            target = StreamTarget(stream_name, random_partition_key, False)
+        else:
+            target = StreamTarget(
+                stream_name,
+                partition_key_function(event_stream.partition_key),
+                event_stream.aggregate_records,
+                event_stream.hash_key_distribution,
+            )
+
+        _stream_targets.set(event_stream_id, target)
+        return target
+
+    def replay_records(self, records, stream_name, retries=3):
+        """Send records spilled from `stream_name` back to it.
+
+        Unlike `send_records_async`, records that still can't be sent are never
+        spilled again, but raised in a `PutRecordsError` for the caller to
+        keep. The records are sent in order, as the partition key strategy of
+        the stream isn't known here.
+        """
+        asyncio.run(
+            self._put_records_async(records, stream_name, retries, ordered=True)
         )
 
-    def _stream_name(self, dataset_id, version, confidentiality):
-        stage = "incoming"
-        event_stream = log_duration(
+    async def send_records_async(
+        self, target: StreamTarget, records, retries=3, results=None, record_sizes=None
+    ):
+        """Send encoded `records` to `target`.
+
+        When a `results` dict is given, the final PutRecords result entry of
+        each record is stored in it, keyed by the `id()` of the record.
+
+        The `record_sizes` of the records are computed when not given; see
+        `_record_size`.
+
+        With an overflow store, records that can't be sent are spilled to it
+        instead of failing; see `_spill`.
+        """
+        if self.overflow_store is None:
+            await self._send_records_async(
+                target, records, retries, results, record_sizes
+            )
+            return
+
+        results = {} if results is None else results
+        try:
+            await self._send_records_async(
+                target, records, retries, results, record_sizes
+            )
+        except (PutRecordsError, BotoCoreError, ClientError) as e:
+            await _run_in_thread(self._spill, target.stream_name, records, results, e)
+
+    async def _send_records_async(
+        self, target: StreamTarget, records, retries, results, record_sizes
+    ):
+        log_add(aggregate_records=target.aggregate)
+
+        if not target.aggregate:
+            await self._put_records_async(
+                records,
+                target.stream_name,
+                retries,
+                results,
+                target.hash_key_distribution,
+                ordered=target.ordered,
+                record_sizes=record_sizes,
+            )
+            return
+
+        aggregated, members = self._aggregate_records(
+            records, random_keys=target.partition_key is random_partition_key
+        )
+        try:
+            await self._put_records_async(
+                aggregated,
+                target.stream_name,
+                retries,
+                results,
+                target.hash_key_distribution,
+                ordered=target.ordered,
+            )
+        except PutRecordsError as e:
+            raise _member_records_error(e, members)
+        finally:
+            _member_results(results, members)
+
+    def _spill(self, stream_name, records, results, error):
+        """Store the `records` that weren't accepted by `stream_name` in the
+        overflow store, to be replayed by `overflow.drain` later.
+
+        Spilled records get a `Spilled` result. The original `error` is raised
+        again if the records can't be stored either.
+        """
+        unsent = [
+            record
+            for record in records
+            if "SequenceNumber" not in results.get(id(record), {})
+        ]
+        try:
+            self.overflow_store.put(stream_name, unsent)
+        except Exception as e:
+            log_add(overflow_spill_error=str(e))
+            raise error
+
+        log_add(overflow_spilled_records=len(unsent))
+        metrics.registry.count(
+            "overflow_spilled_records", len(unsent), stream_name=stream_name
+        )
+        for record in unsent:
+            results[id(record)] = {"Spilled": True}
+
+    def _lookup_event_stream(self, dataset_id, version):
+        return metrics.log_duration(
             lambda: self.get_event_stream(dataset_id, version),
             "get_event_stream_duration",
+            dataset_id=dataset_id,
         )
-        if event_stream:
-            stage = "raw"
 
-        return f"dp.{confidentiality}.{dataset_id}.{stage}.{version}.json"
+    def _event_records(
+        self, events, partition_key=random_partition_key, dataset_id=None
+    ):
+        """Return Kinesis records with `events` encoded as lines of JSON, and
+        their sizes.
 
-    def _event_records(self, events):
-        return [
-            {
-                "Data": f"{json.dumps(event)}\n",
-                "PartitionKey": str(uuid.uuid4()),
-            }
-            for event in events
+        The sizes are passed on for chunking and admission, so that they're
+        only computed once. Raise `RecordsTooLargeError` if any of the records
+        would exceed the maximum record size.
+        """
+        records = [
+            {"Data": data, "PartitionKey": partition_key(event)}
+            for data, event in zip(encode_events(events), events)
         ]
+        record_sizes = [self._record_size(record) for record in records]
+        log_add(num_bytes=sum(record_sizes))
+        record_batch_metrics(len(records), sum(record_sizes), dataset_id)
+
+        too_large = [
+            i for i, size in enumerate(record_sizes) if size > RECORD_MAX_BYTES
+        ]
+        if too_large:
+            raise RecordsTooLargeError(too_large)
+
+        return records, record_sizes
+
+    async def _put_records_async(
+        self,
+        records,
+        stream_name,
+        retries=3,
+        results=None,
+        hash_key_distribution=None,
+        ordered=False,
+        record_sizes=None,
+    ):
+        """Send `records` to `stream_name` in as many requests as needed.
 
-    def _put_records_to_kinesis(self, records, stream_name, retries=3):
-        client = boto3.client("kinesis", region_name="eu-west-1", config=RETRY_CONFIG)
-        response = client.put_records(StreamName=stream_name, Records=records)
+        The records are split into chunks that respect the PutRecords limits,
+        and up to `PUT_RECORDS_MAX_WORKERS` chunks are in flight at the same
+        time. Records that still fail after `retries` retries are collected
+        from every chunk and raised together in a single `PutRecordsError`.
 
-        if "Error" in response:
-            log_add(kinesis_error=response["Error"])
+        With a `hash_key_distribution`, the records are given explicit hash
+        keys spreading them over the open shards of the stream.
+
+        With `ordered`, the chunks are sent one at a time instead, so that
+        records with the same partition key reach the stream in order. Once a
+        chunk fails for good, the chunks after it are held back and their
+        records reported as failed too, rather than overtaking the failed
+        records. Within a chunk, retried records may still land after later
+        records with the same key, as Kinesis doesn't keep the records of a
+        PutRecords request in order when some of them fail.
+        """
+        if record_sizes is None:
+            record_sizes = [self._record_size(record) for record in records]
+        chunks = self._chunk_records(records, record_sizes)
+        log_add(kinesis_put_records_chunks=len(chunks))
+
+        if not chunks:
+            return
+
+        await _run_in_thread(
+            self._admit, records, sum(record_sizes), stream_name, results
+        )
+        if hash_key_distribution:
+            await _run_in_thread(
+                self._assign_hash_keys, records, stream_name, hash_key_distribution
+            )
+        deadline = time.monotonic() + self.retry_strategy.time_budget
+        semaphore = asyncio.Semaphore(PUT_RECORDS_MAX_WORKERS)
+
+        # The chunks are sent from worker threads, where `log_add` isn't safe
+        # to call, so their attempts are collected and logged from here.
+        chunk_attempts = [[] for _ in chunks]
+
+        async def put_chunk(chunk, attempts):
+            async with semaphore:
+                await _run_in_thread(
+                    self._put_records_to_kinesis,
+                    chunk,
+                    stream_name,
+                    retries,
+                    deadline,
+                    results,
+                    attempts,
+                )
+
+        failed_records = []
+        try:
+            if ordered:
+                for i, chunk in enumerate(chunks):
+                    try:
+                        await put_chunk(chunk, chunk_attempts[i])
+                    except PutRecordsError as e:
+                        held_back = [record for c in chunks[i + 1 :] for record in c]
+                        _held_back_results(results, held_back)
+                        log_add(kinesis_held_back_record_count=len(held_back))
+                        failed_records = e.records + held_back
+                        break
+            else:
+                outcomes = await asyncio.gather(
+                    *[
+                        put_chunk(chunk, attempts)
+                        for chunk, attempts in zip(chunks, chunk_attempts)
+                    ],
+                    return_exceptions=True,
+                )
+                for outcome in outcomes:
+                    if isinstance(outcome, PutRecordsError):
+                        failed_records.extend(outcome.records)
+                    elif isinstance(outcome, BaseException):
+                        raise outcome
+        finally:
+            _log_attempts(stream_name, chunk_attempts)
+
+        if failed_records:
+            raise PutRecordsError(failed_records)
+
+    def _admit(self, records, num_bytes, stream_name, results=None):
+        """Raise `ThroughputExceededError` if `records`, of `num_bytes` in
+        total, would exceed the write capacity of `stream_name`.
+
+        Rejected records get the same result as records throttled by Kinesis,
+        along with when to send them again.
+        """
+        retry_after = admission.acquire(stream_name, len(records), num_bytes)
+        if not retry_after:
+            return
+
+        log_add(admission_retry_after=retry_after)
+        metrics.registry.count(
+            "admission_rejected_records", len(records), stream_name=stream_name
+        )
+        if results is not None:
+            for record in records:
+                results[id(record)] = {
+                    "ErrorCode": "ProvisionedThroughputExceededException",
+                    "ErrorMessage": f"Rate exceeded for stream {stream_name}",
+                    "RetryAfter": retry_after,
+                }
+        raise ThroughputExceededError(records, retry_after)
 
-        response_metadata = response["ResponseMetadata"]
-        log_add(kinesis_retry_attempts=response_metadata.get("RetryAttempts"))
-        log_add(kinesis_remaining_retries=retries)
+    def _assign_hash_keys(
+        self, records, stream_name, hash_key_distribution: HashKeyDistribution
+    ):
+        """Give `records` explicit hash keys according to `hash_key_distribution`.
+
+        The records are left to be placed by their partition keys when the
+        shards of the stream can't be listed.
+        """
+        stream_shard_map = shard_map.shard_map(stream_name)
+        if stream_shard_map is None:
+            log_add(explicit_hash_keys=False)
+            return
+
+        log_add(explicit_hash_keys=True)
+        hash_keys = stream_shard_map.hash_keys(
+            len(records), hash_key_distribution.shard_weights
+        )
+        for record, hash_key in zip(records, hash_keys):
+            record["ExplicitHashKey"] = hash_key
+
+    def _aggregate_records(self, records, random_keys=False):
+        """Return `records` packed into aggregated records, and their members.
+
+        Failed records are handed back as the very same objects that were
+        sent, so the members are keyed by the identity of each aggregated
+        record.
+        """
+        aggregated = aggregate_records(records, random_keys)
+        log_add(num_aggregated_records=len(aggregated))
+
+        members = {id(record): member_records for record, member_records in aggregated}
+        return [record for record, _ in aggregated], members
+
+    def _chunk_records(self, records, record_sizes):
+        """Split `records` into chunks that each fit in one PutRecords request.
+
+        Both the data blob and the partition key count towards the request
+        size limit, as they do in the `record_sizes` of the records.
+        """
+        chunks = []
+        chunk = []
+        chunk_size = 0
+
+        for record, record_size in zip(records, record_sizes):
+            if chunk and (
+                len(chunk) == PUT_RECORDS_MAX_RECORDS
+                or chunk_size + record_size > PUT_RECORDS_MAX_BYTES
+            ):
+                chunks.append(chunk)
+                chunk = []
+                chunk_size = 0
+
+            chunk.append(record)
+            chunk_size += record_size
+
+        if chunk:
+            chunks.append(chunk)
+
+        return chunks
+
+    def _record_size(self, record):
+        data = record["Data"]
+        if isinstance(data, str):
+            data = data.encode("utf-8")
+        return len(data) + len(record["PartitionKey"].encode("utf-8"))
+
+    def _put_records_to_kinesis(
+        self,
+        records,
+        stream_name,
+        retries=3,
+        deadline=None,
+        results=None,
+        attempts=None,
+    ):
+        """Put `records` to `stream_name`, retrying records that fail.
+
+        Failed records are retried at most `retries` times, with a delay
+        between attempts given by the retry strategy. Retrying stops early
+        when the next attempt wouldn't start before `deadline` (a
+        `time.monotonic()` value), which defaults to the strategy's time
+        budget from now.
+
+        When a `results` dict is given, the result entry of the last attempt
+        for each record is stored in it, keyed by the `id()` of the record.
+
+        A summary of each attempt is appended to the `attempts` list, for the
+        caller to log with `_log_attempts` once every chunk is done. Without
+        one, the attempts are logged before returning.
+        """
+        if attempts is None:
+            attempts = []
+            try:
+                return self._put_records_to_kinesis(
+                    records, stream_name, retries, deadline, results, attempts
+                )
+            finally:
+                _log_attempts(stream_name, [attempts])
+
+        if deadline is None:
+            deadline = time.monotonic() + self.retry_strategy.time_budget
+
+        delay = 0
 
         # Applying retry-strategy:
         # https://docs.aws.amazon.com/streams/latest/dev/developing-producers-with-sdk.html
-        if response["FailedRecordCount"] > 0:
+        while True:
+            response = get_kinesis_client().put_records(
+                StreamName=stream_name, Records=records
+            )
+            attempt = {
+                "records": len(records),
+                "failed_record_count": response["FailedRecordCount"],
+                "sdk_retry_attempts": response["ResponseMetadata"].get(
+                    "RetryAttempts", 0
+                ),
+                "remaining_retries": retries,
+            }
+            attempts.append(attempt)
+
+            if "Error" in response:
+                attempt["error"] = response["Error"]
+
+            if results is not None:
+                for record, result in zip(records, response["Records"]):
+                    results[id(record)] = result
+
+            if "ExplicitHashKey" in records[0] and not shard_map.check_placement(
+                stream_name, records, response["Records"]
+            ):
+                attempt["shard_map_stale"] = True
+
+            if response["FailedRecordCount"] == 0:
+                return response
+
             failed_records = self._failed_records(records, response["Records"])
-            if retries > 0:
-                return self._put_records_to_kinesis(
-                    failed_records, stream_name, retries - 1
-                )
-            raise PutRecordsError(failed_records)
+            error_codes = self._error_codes(response["Records"])
+            attempt["error_codes"] = sorted(error_codes)
 
-        return response
+            if retries <= 0:
+                raise PutRecordsError(failed_records)
+
+            delay = self.retry_strategy.delay(delay, error_codes)
+
+            if time.monotonic() + delay > deadline:
+                attempt["retry_budget_exhausted"] = True
+                raise PutRecordsError(failed_records)
+
+            attempt["backoff_ms"] = delay * 1000
+            self.retry_strategy.sleep(delay)
+
+            records = failed_records
+            retries -= 1
 
     def _failed_records(self, records, responses):
         return [
             record for i, record in enumerate(records) if "ErrorCode" in responses[i]
         ]
+
+    def _error_codes(self, responses):
+        return {
+            response["ErrorCode"] for response in responses if "ErrorCode" in response
+        }
+
+
+def record_batch_metrics(num_records, num_bytes, dataset_id=None):
+    metrics.registry.histogram(
+        "records_per_batch", num_records, metrics.COUNT, dataset_id=dataset_id
+    )
+    metrics.registry.histogram(
+        "bytes_per_batch", num_bytes, metrics.BYTES, dataset_id=dataset_id
+    )
+
+
+def _log_attempts(stream_name, chunk_attempts):
+    """Log the PutRecords attempts of each chunk of a batch, as collected by
+    `_put_records_to_kinesis`.
+
+    Counts are summed over the chunks, and every attempt is logged too.
+    """
+    attempts = [
+        dict(attempt, chunk=i, attempt=n)
+        for i, chunk in enumerate(chunk_attempts)
+        for n, attempt in enumerate(chunk, 1)
+    ]
+    if not attempts:
+        return
+
+    log_add(
+        kinesis_put_records_attempts=len(attempts),
+        kinesis_failed_record_count=sum(
+            chunk[-1]["failed_record_count"] for chunk in chunk_attempts if chunk
+        ),
+        kinesis_retry_attempts=sum(a["sdk_retry_attempts"] for a in attempts),
+        kinesis_error_codes=sorted(
+            {code for a in attempts for code in a.get("error_codes", [])}
+        ),
+        kinesis_backoff_ms=sum(a.get("backoff_ms", 0) for a in attempts),
+        kinesis_attempts=attempts,
+    )
+    errors = [a["error"] for a in attempts if "error" in a]
+    if errors:
+        log_add(kinesis_error=errors)
+    if any(a.get("retry_budget_exhausted") for a in attempts):
+        log_add(kinesis_retry_budget_exhausted=True)
+    if any(a.get("shard_map_stale") for a in attempts):
+        log_add(shard_map_stale=stream_name)
+
+
+def invalidate_stream_target(event_stream_id):
+    """Forget the cached stream target of the event stream `event_stream_id`.
+
+    Only the cache of the current process is affected; other processes pick
+    up the change when their cached target expires.
+    """
+    _stream_targets.delete(event_stream_id)
+
+
+def _cached_stream_target(event_stream_id):
+    target = _stream_targets.get(event_stream_id)
+    log_add(
+        stream_target_cache="hit" if target else "miss",
+        stream_target_cache_hits=_stream_targets.hits,
+        stream_target_cache_misses=_stream_targets.misses,
+    )
+    if target:
+        log_add(stream_name=target.stream_name)
+    return target
+
+
+def _format_stream_name(dataset_id, version, confidentiality, event_stream):
+    stage = "raw" if event_stream else "incoming"
+    return f"dp.{confidentiality}.{dataset_id}.{stage}.{version}.json"
+
+
+def _member_records_error(error: PutRecordsError, members):
+    records = [member for record in error.records for member in members[id(record)]]
+    if isinstance(error, ThroughputExceededError):
+        return ThroughputExceededError(records, error.retry_after)
+    return PutRecordsError(records)
+
+
+def _member_results(results, members):
+    """Give each member record the result of its aggregated record."""
+    if results is None:
+        return
+    for record_id, member_records in members.items():
+        if record_id in results:
+            for member in member_records:
+                results[id(member)] = results[record_id]
+
+
+def _held_back_results(results, records):
+    """Give `records` that were never sent, to keep them behind records that
+    failed, a result saying so."""
+    if results is None:
+        return
+    for record in records:
+        results[id(record)] = {
+            "ErrorCode": "HeldBack",
+            "ErrorMessage": "Not sent, as earlier records failed",
+        }
+
+
+def _record_status(result):
+    """Return the status of a record from its PutRecords result entry."""
+    if result.get("Spilled"):
+        return {"spilled": True}
+    if "ErrorCode" in result:
+        status = {
+            "error_code": result["ErrorCode"],
+            "error_message": result.get("ErrorMessage"),
+        }
+        if "RetryAfter" in result:
+            status["retry_after"] = result["RetryAfter"]
+        return status
+    return {"sequence_number": result["SequenceNumber"], "shard_id": result["ShardId"]}
+
+
+def _record_statuses(records, results):
+    statuses = [_record_status(results[id(record)]) for record in records]
+    log_add(
+        kinesis_failed_record_count=sum("error_code" in status for status in statuses)
+    )
+    return statuses
+
+
+async def _run_in_thread(func, *args):
+    loop = asyncio.get_event_loop()
+    return await loop.run_in_executor(None, functools.partial(func, *args))
@@ -0,0 +1,146 @@
+import bisect
+import os
+import threading
+from typing import Dict, List, NamedTuple, Optional
+
+from botocore.exceptions import ClientError
+from okdata.aws.logging import log_add
+
+from cache import TTLCache
+from clients import get_kinesis_client
+
+# How long (in seconds) the shards of a stream are trusted before they're
+# listed again. A stale map is also dropped as soon as Kinesis places a record
+# on a different shard than the one it was meant for.
+SHARD_MAP_CACHE_TTL = int(os.environ.get("SHARD_MAP_CACHE_TTL", 300))
+
+_shard_maps = TTLCache(maxsize=1024, ttl=SHARD_MAP_CACHE_TTL)
+_MISSING = object()
+
+
+class Shard(NamedTuple):
+    shard_id: str
+    starting_hash_key: int
+    ending_hash_key: int
+
+    @property
+    def hash_key(self) -> str:
+        """The explicit hash key used for records sent to this shard."""
+        return str((self.starting_hash_key + self.ending_hash_key) // 2)
+
+
+class ShardMap:
+    """The open shards of a stream and their hash key ranges.
+
+    Hash keys are handed out by smooth weighted round-robin, continuing where
+    the previous batch left off, so that even small batches spread evenly
+    over the shards.
+    """
+
+    def __init__(self, shards: List[Shard]):
+        self.shards = sorted(shards, key=lambda shard: shard.starting_hash_key)
+        self._starting_hash_keys = [shard.starting_hash_key for shard in self.shards]
+        self._current = [0.0] * len(self.shards)
+        self._lock = threading.Lock()
+
+    def shard_id(self, hash_key) -> Optional[str]:
+        """Return the ID of the shard owning `hash_key`, if it's known."""
+        hash_key = int(hash_key)
+        i = bisect.bisect_right(self._starting_hash_keys, hash_key) - 1
+        if i < 0 or hash_key > self.shards[i].ending_hash_key:
+            return None
+        return self.shards[i].shard_id
+
+    def hash_keys(
+        self, count: int, shard_weights: Optional[Dict[str, float]] = None
+    ) -> List[str]:
+        """Return explicit hash keys for `count` records.
+
+        The records are spread over the shards in proportion to their weight
+        in `shard_weights` (1 for shards not in it). When every shard has a
+        weight of 0 they're spread evenly instead.
+        """
+        weights = [(shard_weights or {}).get(s.shard_id, 1.0) for s in self.shards]
+        total = sum(weights)
+        if total <= 0:
+            weights = [1.0] * len(self.shards)
+            total = float(len(self.shards))
+
+        hash_keys = []
+        with self._lock:
+            current = self._current
+            for _ in range(count):
+                for i, weight in enumerate(weights):
+                    current[i] += weight
+                chosen = max(range(len(current)), key=current.__getitem__)
+                current[chosen] -= total
+                hash_keys.append(self.shards[chosen].hash_key)
+
+        return hash_keys
+
+
+def shard_map(stream_name) -> Optional[ShardMap]:
+    """Return the shard map of `stream_name`, or None if it can't be listed."""
+    cached = _shard_maps.get(stream_name, _MISSING)
+    if cached is not _MISSING:
+        return cached
+
+    shards = _list_open_shards(stream_name)
+    result = ShardMap(shards) if shards else None
+    _shard_maps.set(stream_name, result)
+    log_add(shard_map_refreshed=stream_name)
+    return result
+
+
+def invalidate_shard_map(stream_name) -> None:
+    _shard_maps.delete(stream_name)
+
+
+def check_placement(stream_name, records, responses) -> bool:
+    """Check that `records` sent with explicit hash keys ended up on the
+    shards the shard map of `stream_name` says they would.
+
+    The shard map is dropped when they didn't, e.g. after a reshard, so that
+    it's listed again for the next batch. Return whether the map was right;
+    this is called from worker threads, so it's left to the caller to log.
+    """
+    cached = _shard_maps.get(stream_name)
+    if cached is None:
+        return True
+
+    for record, response in zip(records, responses):
+        if "ShardId" not in response or "ExplicitHashKey" not in record:
+            continue
+        if cached.shard_id(record["ExplicitHashKey"]) != response["ShardId"]:
+            invalidate_shard_map(stream_name)
+            return False
+
+    return True
+
+
+def _list_open_shards(stream_name) -> List[Shard]:
+    kinesis_client = get_kinesis_client()
+    shards = []
+    kwargs = {"StreamName": stream_name}
+
+    try:
+        while True:
+            response = kinesis_client.list_shards(**kwargs)
+            shards.extend(response["Shards"])
+            if not response.get("NextToken"):
+                break
+            kwargs = {"NextToken": response["NextToken"]}
+    except ClientError as e:
+        log_add(list_shards_error=e.response["Error"]["Code"])
+        return []
+
+    return [
+        Shard(
+            shard["ShardId"],
+            int(shard["HashKeyRange"]["StartingHashKey"]),
+            int(shard["HashKeyRange"]["EndingHashKey"]),
+        )
+        for shard in shards
+        # Closed shards (parents of a reshard) have an ending sequence number.
+        if "EndingSequenceNumber" not in shard["SequenceNumberRange"]
+    ]
@@ -1,10 +1,13 @@
-from database import EventStream
+from typing import Optional
+
+from database import EventStream, HashKeyDistribution, PartitionKey
 from services import (
     EventService,
     ResourceConflict,
     ResourceNotFound,
     datetime_utils,
 )
+from services.service import invalidate_stream_target
 from services.template import EventStreamTemplate
 
 
@@ -44,6 +47,7 @@ class EventStreamService(EventService):
             tags=[{"Key": "created_by", "Value": updated_by}],
         )
         self.event_streams_table.put_event_stream(event_stream)
+        invalidate_stream_target(event_stream.id)
         return event_stream
 
     def delete_event_stream(self, dataset_id, version, updated_by):
@@ -62,6 +66,28 @@ class EventStreamService(EventService):
         self.cloudformation_client.delete_stack(event_stream.cf_stack_name)
         self.update_event_stream(event_stream, updated_by)
 
+    def update_event_stream_settings(
+        self,
+        dataset_id,
+        version,
+        updated_by,
+        partition_key: PartitionKey,
+        aggregate_records: bool = False,
+        hash_key_distribution: Optional[HashKeyDistribution] = None,
+    ):
+        event_stream = self.get_event_stream(dataset_id, version)
+
+        if event_stream is None:
+            raise ResourceNotFound
+        if event_stream.deleted:
+            raise ResourceNotFound
+
+        event_stream.partition_key = partition_key
+        event_stream.aggregate_records = aggregate_records
+        event_stream.hash_key_distribution = hash_key_distribution
+        self.update_event_stream(event_stream, updated_by)
+        return event_stream
+
 
 def sub_resources_exist(event_stream: EventStream):
     if event_stream.subscribable.cf_status != "INACTIVE":
@@ -0,0 +1,62 @@
+import functools
+import json
+import os
+
+import jsonschema
+from okdata.aws.logging import log_add
+
+from services.exceptions import InvalidEventsError
+
+# Number of compiled validators kept around. Validators are keyed by the
+# contents of their schema, so a changed schema simply gets a new validator.
+VALIDATOR_CACHE_SIZE = int(os.environ.get("VALIDATOR_CACHE_SIZE", 128))
+
+
+def event_validator(schema):
+    """Return a validator for events of a dataset version with `schema`.
+
+    Return None when there is no schema to validate against, or when the
+    schema itself is invalid.
+    """
+    if not schema:
+        return None
+    return _validator(json.dumps(schema, sort_keys=True))
+
+
+@functools.lru_cache(maxsize=VALIDATOR_CACHE_SIZE)
+def _validator(schema_json):
+    schema = json.loads(schema_json)
+    validator_class = jsonschema.validators.validator_for(schema)
+
+    try:
+        validator_class.check_schema(schema)
+    except jsonschema.SchemaError as e:
+        log_add(schema_error=e.message)
+        return None
+
+    return validator_class(schema, format_checker=jsonschema.FormatChecker())
+
+
+def validate_events(validator, events):
+    """Validate every event in `events` against `validator`.
+
+    Raise `InvalidEventsError` listing all events that don't match, with the
+    validation errors of each.
+    """
+    invalid_records = []
+
+    for i, event in enumerate(events):
+        errors = [_error_message(error) for error in validator.iter_errors(event)]
+        if errors:
+            invalid_records.append({"index": i, "errors": errors})
+
+    if invalid_records:
+        log_add(num_invalid_events=len(invalid_records))
+        raise InvalidEventsError(invalid_records)
+
+
+def _error_message(error):
+    if error.absolute_path:
+        path = "/".join(str(part) for part in error.absolute_path)
+        return f"{path}: {error.message}"
+    return error.message
@@ -17,14 +17,17 @@ setup(
         "boto3>=1.17",
         "elasticsearch-dsl==7.2.1",
         "fastapi>=0.65.2",
+        "jsonschema",
         "mangum==0.10.0",
         "okdata-aws>=1.0.0",
         "okdata-resource-auth",
         "okdata-sdk>=0.8.1",
+        "orjson",
         "pytz",
         "requests",
         "requests-aws4auth==1.0",
         "shortuuid",
         "simplejson",
+        "zstandard",
     ],
 )
@@ -0,0 +1,66 @@
+from types import SimpleNamespace
+
+from clients import jwks
+
+
+class KeycloakClient:
+    realm_name = "api-catalog"
+    connection = SimpleNamespace(base_url="https://keycloak.example.org/auth/")
+
+    def __init__(self, *key_sets):
+        self.key_sets = list(key_sets)
+        self.calls = 0
+
+    def certs(self):
+        keys = self.key_sets[min(self.calls, len(self.key_sets) - 1)]
+        self.calls += 1
+        return {"keys": keys}
+
+
+def key(kid, use="sig"):
+    return {"kid": kid, "kty": "RSA", "alg": "RS256", "use": use, "n": "n", "e": "e"}
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_issuer():
+    assert (
+        jwks.issuer(KeycloakClient())
+        == "https://keycloak.example.org/auth/realms/api-catalog"
+    )
+
+
+def test_signing_key_cached():
+    keycloak_client = KeycloakClient([key("a"), key("b")])
+
+    assert jwks.signing_key(keycloak_client, "a") == key("a")
+    assert jwks.signing_key(keycloak_client, "b") == key("b")
+    assert keycloak_client.calls == 1
+
+
+def test_signing_key_skips_encryption_keys():
+    keycloak_client = KeycloakClient([key("a", use="enc")])
+
+    assert jwks.signing_key(keycloak_client, "a") is None
+
+
+def test_signing_key_rotated(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(jwks.time, "monotonic", clock)
+    keycloak_client = KeycloakClient([key("a")], [key("a"), key("b")])
+    jwks.signing_key(keycloak_client, "a")
+
+    # Unknown keys are only looked for again after a while.
+    clock.now += jwks.JWKS_MIN_REFRESH_INTERVAL - 1
+    assert jwks.signing_key(keycloak_client, "b") is None
+    assert keycloak_client.calls == 1
+
+    clock.now += 1
+    assert jwks.signing_key(keycloak_client, "b") == key("b")
+    assert keycloak_client.calls == 2
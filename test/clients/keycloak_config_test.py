@@ -0,0 +1,67 @@
+from clients import keycloak_config
+from clients.keycloak_config import (
+    KeycloakConfig,
+    SSMClient,
+    get_keycloak_config,
+    refresh_keycloak_config,
+)
+
+
+class Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def mock_ssm_parameters(monkeypatch, secrets):
+    calls = []
+
+    def get_ssm_parameters(self, parameter_names, with_decryption=False):
+        calls.append(parameter_names)
+        return {
+            "/dataplatform/event-stream-api/keycloak-client-secret": secrets[
+                len(calls) - 1
+            ],
+            "/dataplatform/shared/keycloak-server-url": "https://keycloak.example.org",
+        }
+
+    monkeypatch.setattr(SSMClient, "__init__", lambda self: None)
+    monkeypatch.setattr(SSMClient, "get_ssm_parameters", get_ssm_parameters)
+    return calls
+
+
+def test_get_keycloak_config_is_cached(monkeypatch):
+    calls = mock_ssm_parameters(monkeypatch, ["secret"])
+
+    assert get_keycloak_config() == KeycloakConfig(
+        client_id="event-stream-api",
+        client_secret="secret",
+        server_url="https://keycloak.example.org",
+        realm_name="mock",
+    )
+    assert get_keycloak_config() is get_keycloak_config()
+    assert len(calls) == 1
+
+
+def test_get_keycloak_config_expires(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(keycloak_config._keycloak_config, "clock", clock)
+    calls = mock_ssm_parameters(monkeypatch, ["secret", "rotated"])
+
+    get_keycloak_config()
+    clock.now += keycloak_config.KEYCLOAK_CONFIG_TTL
+
+    assert get_keycloak_config().client_secret == "rotated"
+    assert len(calls) == 2
+
+
+def test_refresh_keycloak_config(monkeypatch):
+    calls = mock_ssm_parameters(monkeypatch, ["secret", "rotated"])
+
+    get_keycloak_config()
+
+    assert refresh_keycloak_config().client_secret == "rotated"
+    assert get_keycloak_config().client_secret == "rotated"
+    assert len(calls) == 2
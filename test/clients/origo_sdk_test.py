@@ -0,0 +1,85 @@
+import threading
+import time
+
+from jose import jwt
+from okdata.sdk.config import Config
+from okdata.sdk.data.dataset import Dataset
+
+from clients import get_keycloak_client, get_origo_sdk
+from clients.keycloak_config import KeycloakConfig
+from clients.origo_sdk import SERVICE_TOKEN_REFRESH_MARGIN, ServiceTokenAuth
+
+keycloak_config = KeycloakConfig("client", "secret", "https://example.org", "realm")
+rotated_config = KeycloakConfig("client", "rotated", "https://example.org", "realm")
+
+
+class TokenProvider:
+    def __init__(self, expires_in=300):
+        self.expires_in = expires_in
+        self.calls = 0
+
+    def new_token(self):
+        self.calls += 1
+        # Give other threads a chance to ask for a token meanwhile.
+        time.sleep(0.01)
+        access_token = jwt.encode(
+            {"exp": time.time() + self.expires_in, "n": self.calls}, "key"
+        )
+        return {"access_token": access_token}
+
+
+def service_token_auth(token_provider):
+    config = Config()
+    config.config["cacheCredentials"] = False
+    return ServiceTokenAuth(config, token_provider=token_provider)
+
+
+def test_get_keycloak_client():
+    keycloak_client = get_keycloak_client(keycloak_config)
+
+    assert get_keycloak_client(keycloak_config) is keycloak_client
+    assert get_keycloak_client(rotated_config) is not keycloak_client
+    assert get_keycloak_client(rotated_config).client_secret_key == "rotated"
+
+
+def test_get_origo_sdk():
+    sdk = get_origo_sdk(keycloak_config, Dataset)
+
+    assert isinstance(sdk, Dataset)
+    assert isinstance(sdk.auth, ServiceTokenAuth)
+    assert get_origo_sdk(keycloak_config, Dataset) is sdk
+    assert get_origo_sdk(rotated_config, Dataset) is not sdk
+
+
+def test_service_token_reused():
+    token_provider = TokenProvider()
+    auth = service_token_auth(token_provider)
+
+    assert auth.access_token == auth.access_token
+    assert token_provider.calls == 1
+
+
+def test_service_token_renewed_before_expiry():
+    token_provider = TokenProvider(expires_in=SERVICE_TOKEN_REFRESH_MARGIN - 1)
+    auth = service_token_auth(token_provider)
+
+    assert auth.access_token != auth.access_token
+    assert token_provider.calls == 2
+
+
+def test_service_token_shared_between_threads():
+    token_provider = TokenProvider()
+    auth = service_token_auth(token_provider)
+    tokens = []
+
+    threads = [
+        threading.Thread(target=lambda: tokens.append(auth.access_token))
+        for _ in range(8)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert token_provider.calls == 1
+    assert len(set(tokens)) == 1
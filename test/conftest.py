@@ -1,8 +1,40 @@
+import io
 import os
 import pytest
 import boto3
 from moto import mock_dynamodb2, mock_cloudformation, mock_sts, mock_ssm
-from clients import CloudformationClient
+import metrics
+from clients import (
+    CloudformationClient,
+    get_keycloak_client,
+    get_origo_sdk,
+    jwks,
+    keycloak_config,
+)
+from resources import authorizer, origo_clients
+from services import admission, service, shard_map
+
+
+@pytest.fixture(autouse=True)
+def clear_caches():
+    service._stream_targets.clear()
+    origo_clients._dataset_metadata.clear()
+    admission._limiters.clear()
+    shard_map._shard_maps.clear()
+    metrics.flush(io.StringIO())
+    keycloak_config._keycloak_config.clear()
+    authorizer._introspections.clear()
+    authorizer.flush_permission_cache()
+    jwks._jwks.clear()
+    get_keycloak_client.cache_clear()
+    get_origo_sdk.cache_clear()
+
+
+@pytest.fixture(autouse=True)
+def unknown_shard_counts(monkeypatch):
+    # Keep admission control from describing streams that only exist in tests
+    # mocking out Kinesis. Tests of admission control patch this themselves.
+    monkeypatch.setattr(admission, "_shard_count", lambda stream_name: None)
 
 
 @pytest.fixture
@@ -0,0 +1,331 @@
+import asyncio
+import threading
+import time
+from types import SimpleNamespace
+
+import pytest
+import rsa
+from fastapi.security import HTTPAuthorizationCredentials
+from jose import jwk, jwt
+from keycloak.exceptions import KeycloakAuthenticationError
+
+from resources import authorizer
+from resources.authorizer import AuthInfo
+from resources.errors import ErrorResponse
+
+
+ISSUER = "https://keycloak.example.org/auth/realms/api-catalog"
+
+
+def keypair(kid):
+    public_key, private_key = rsa.newkeys(1024)
+    public_jwk = jwk.construct(public_key.save_pkcs1().decode(), "RS256").to_dict()
+    return {**public_jwk, "kid": kid, "use": "sig"}, private_key.save_pkcs1().decode()
+
+
+class Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+signing_jwk, signing_key = keypair("key-1")
+other_jwk, other_key = keypair("key-2")
+
+
+class KeycloakClient:
+    realm_name = "api-catalog"
+    connection = SimpleNamespace(base_url="https://keycloak.example.org/auth/")
+
+    def __init__(self, reject=False):
+        self.reject = reject
+
+    def certs(self):
+        return {"keys": [signing_jwk]}
+
+    def introspect(self, token):
+        if self.reject:
+            raise KeycloakAuthenticationError(response_code=401)
+        return {"active": token == "valid-token", "username": "janedoe"}
+
+
+def credentials(token):
+    return HTTPAuthorizationCredentials(scheme="Bearer", credentials=token)
+
+
+def test_auth_info():
+    auth_info = AuthInfo(credentials("valid-token"), KeycloakClient())
+
+    assert auth_info.principal_id == "janedoe"
+    assert auth_info.bearer_token == "valid-token"
+
+
+def test_auth_info_inactive_token():
+    with pytest.raises(ErrorResponse) as e:
+        AuthInfo(credentials("expired-token"), KeycloakClient())
+
+    assert e.value.status_code == 401
+
+
+def test_auth_info_refreshes_rejected_credentials(monkeypatch):
+    refreshed = []
+    monkeypatch.setattr(
+        authorizer, "refresh_keycloak_config", lambda: refreshed.append(1)
+    )
+    monkeypatch.setattr(
+        authorizer, "get_keycloak_client", lambda config: KeycloakClient()
+    )
+
+    auth_info = AuthInfo(credentials("valid-token"), KeycloakClient(reject=True))
+
+    assert auth_info.principal_id == "janedoe"
+    assert refreshed == [1]
+
+
+class CountingKeycloakClient(KeycloakClient):
+    def __init__(self, exp=None):
+        super().__init__()
+        self.exp = exp
+        self.calls = 0
+
+    def introspect(self, token):
+        self.calls += 1
+        introspected = super().introspect(token)
+        if self.exp is not None:
+            introspected["exp"] = self.exp
+        return introspected
+
+
+def test_auth_info_caches_active_introspections():
+    keycloak_client = CountingKeycloakClient()
+
+    AuthInfo(credentials("valid-token"), keycloak_client)
+    auth_info = AuthInfo(credentials("valid-token"), keycloak_client)
+
+    assert auth_info.principal_id == "janedoe"
+    assert keycloak_client.calls == 1
+    # The token itself isn't kept in the cache.
+    assert "valid-token" not in authorizer._introspections._entries
+
+
+def test_auth_info_does_not_cache_inactive_introspections():
+    keycloak_client = CountingKeycloakClient()
+
+    for _ in range(2):
+        with pytest.raises(ErrorResponse):
+            AuthInfo(credentials("expired-token"), keycloak_client)
+
+    assert keycloak_client.calls == 2
+
+
+def test_introspection_cache_expires_with_token(monkeypatch):
+    monkeypatch.setattr(authorizer.time, "time", lambda: 1000.0)
+    monkeypatch.setattr(authorizer._introspections, "clock", lambda: 0.0)
+
+    expired = CountingKeycloakClient(exp=1000)
+    AuthInfo(credentials("valid-token"), expired)
+    AuthInfo(credentials("valid-token"), expired)
+    assert expired.calls == 2
+
+    expiring = CountingKeycloakClient(exp=1010)
+    AuthInfo(credentials("valid-token"), expiring)
+    [(_, expires_at)] = authorizer._introspections._entries.values()
+    assert expires_at == 10.0
+
+
+def test_introspection_cache_disabled(monkeypatch):
+    monkeypatch.setattr(authorizer, "INTROSPECTION_CACHE_TTL", 0)
+    keycloak_client = CountingKeycloakClient()
+
+    AuthInfo(credentials("valid-token"), keycloak_client)
+    AuthInfo(credentials("valid-token"), keycloak_client)
+
+    assert keycloak_client.calls == 2
+    assert len(authorizer._introspections) == 0
+
+
+def token(key=signing_key, kid="key-1", **claims):
+    claims = {
+        "iss": ISSUER,
+        "aud": "okdata-resource-server",
+        "exp": time.time() + 300,
+        "preferred_username": "janedoe",
+        **claims,
+    }
+    return jwt.encode(claims, key, algorithm="RS256", headers={"kid": kid})
+
+
+@pytest.fixture
+def jwt_mode(monkeypatch):
+    monkeypatch.setattr(authorizer, "AUTH_MODE", "jwt")
+    monkeypatch.setattr(authorizer, "JWT_AUDIENCE", "okdata-resource-server")
+
+
+def test_auth_info_jwt(jwt_mode):
+    keycloak_client = CountingKeycloakClient()
+
+    auth_info = AuthInfo(credentials(token()), keycloak_client)
+
+    assert auth_info.principal_id == "janedoe"
+    assert keycloak_client.calls == 0
+
+
+@pytest.mark.parametrize(
+    "bearer_token",
+    [
+        token(exp=time.time() - 10),
+        token(iss="https://keycloak.example.org/auth/realms/other"),
+        token(aud="someone-else"),
+        token(key=other_key),
+        token(key=other_key, kid="key-2"),
+    ],
+)
+def test_auth_info_jwt_invalid(jwt_mode, bearer_token):
+    keycloak_client = CountingKeycloakClient()
+
+    with pytest.raises(ErrorResponse) as e:
+        AuthInfo(credentials(bearer_token), keycloak_client)
+
+    assert e.value.status_code == 401
+    assert keycloak_client.calls == 0
+
+
+def test_auth_info_jwt_introspects_opaque_tokens(jwt_mode):
+    keycloak_client = CountingKeycloakClient()
+
+    auth_info = AuthInfo(credentials("valid-token"), keycloak_client)
+
+    assert auth_info.principal_id == "janedoe"
+    assert keycloak_client.calls == 1
+
+
+class ResourceAuthorizer:
+    def __init__(self, *decisions):
+        self.decisions = list(decisions)
+        self.calls = 0
+
+    def has_access(self, bearer_token, scope, resource_name):
+        decision = self.decisions[min(self.calls, len(self.decisions) - 1)]
+        self.calls += 1
+        return decision
+
+
+def auth_info(principal_id="janedoe"):
+    return SimpleNamespace(principal_id=principal_id, bearer_token="valid-token")
+
+
+def test_authorize_caches_decisions():
+    verify_permission = authorizer.authorize("okdata:dataset:write")
+    resource_authorizer = ResourceAuthorizer(True)
+
+    verify_permission("foo", auth_info(), resource_authorizer)
+    verify_permission("foo", auth_info(), resource_authorizer)
+    assert resource_authorizer.calls == 1
+
+    # Other principals, datasets and scopes are asked about separately.
+    verify_permission("foo", auth_info("johndoe"), resource_authorizer)
+    verify_permission("bar", auth_info(), resource_authorizer)
+    authorizer.authorize("okdata:dataset:read")("foo", auth_info(), resource_authorizer)
+    assert resource_authorizer.calls == 4
+
+    authorizer.flush_permission_cache()
+    verify_permission("foo", auth_info(), resource_authorizer)
+    assert resource_authorizer.calls == 5
+
+
+def test_authorize_caches_denials_briefly(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(authorizer._permissions, "clock", clock)
+    verify_permission = authorizer.authorize("okdata:dataset:write")
+    resource_authorizer = ResourceAuthorizer(False, True)
+
+    for _ in range(2):
+        with pytest.raises(ErrorResponse) as e:
+            verify_permission("foo", auth_info(), resource_authorizer)
+        assert e.value.status_code == 403
+    assert resource_authorizer.calls == 1
+
+    clock.now += authorizer.PERMISSION_CACHE_NEGATIVE_TTL
+    verify_permission("foo", auth_info(), resource_authorizer)
+    assert resource_authorizer.calls == 2
+
+
+def test_authorize_without_cache(monkeypatch):
+    monkeypatch.setattr(authorizer, "PERMISSION_CACHE_TTL", 0)
+    verify_permission = authorizer.authorize("okdata:dataset:write")
+    resource_authorizer = ResourceAuthorizer(True)
+
+    verify_permission("foo", auth_info(), resource_authorizer)
+    verify_permission("foo", auth_info(), resource_authorizer)
+
+    assert resource_authorizer.calls == 2
+
+
+class DatasetClient:
+    def __init__(self, versions=("1",), wait=None):
+        self.versions = versions
+        self.wait = wait
+
+    def get_versions(self, dataset_id, prefetch_dataset=False):
+        if self.wait:
+            self.wait()
+        return [{"version": version} for version in self.versions]
+
+
+def authorized_version(dataset_client, resource_authorizer, keycloak_client=None):
+    return asyncio.run(
+        authorizer.authorized_version("okdata:dataset:write")(
+            "foo",
+            "1",
+            credentials("valid-token"),
+            keycloak_client or KeycloakClient(),
+            resource_authorizer,
+            dataset_client,
+        )
+    )
+
+
+def test_authorized_version_runs_checks_concurrently():
+    # Each check waits for the other one to start.
+    barrier = threading.Barrier(2, timeout=5)
+
+    class WaitingKeycloakClient(KeycloakClient):
+        def introspect(self, token):
+            barrier.wait()
+            return super().introspect(token)
+
+    version = authorized_version(
+        DatasetClient(wait=barrier.wait),
+        ResourceAuthorizer(True),
+        WaitingKeycloakClient(),
+    )
+
+    assert version == authorizer.AuthorizedVersion({"version": "1"}, "janedoe")
+
+
+def test_authorized_version_fails_fast():
+    lookup_done = threading.Event()
+
+    with pytest.raises(ErrorResponse) as e:
+        authorized_version(
+            DatasetClient(wait=lambda: lookup_done.wait(5)), ResourceAuthorizer(False)
+        )
+    lookup_done.set()
+
+    assert e.value.status_code == 403
+
+
+def test_authorized_version_missing():
+    with pytest.raises(ErrorResponse) as e:
+        authorized_version(DatasetClient(versions=[]), ResourceAuthorizer(True))
+
+    assert e.value.status_code == 404
+
+
+def test_authorized_version_missing_without_access():
+    with pytest.raises(ErrorResponse) as e:
+        authorized_version(DatasetClient(versions=[]), ResourceAuthorizer(False))
+
+    assert e.value.status_code == 403
@@ -1,11 +1,23 @@
+import asyncio
+import base64
+import gzip
+import json
+
 import pytest
+import zstandard
+from botocore.exceptions import ClientError
+from keycloak import KeycloakOpenID
+from mangum import Mangum
 from moto import mock_kinesis
 from okdata.sdk.data.dataset import Dataset
 
 from .conftest import valid_token, valid_token_no_access
-from services import PutRecordsError
-from services.service import EventService
-from test.util import create_event_stream
+from app import app
+from resources import authorizer, compression
+from services import PutRecordsError, admission, idempotency
+from services.admission import StreamLimiter
+from services.service import EventService, StreamTarget
+from test.util import create_event_stream, create_idempotency_keys_table
 
 
 def test_get_event_history(
@@ -92,6 +104,47 @@ def test_post_events_failed_records(
     assert data["failed_records"] == ["foo"]
 
 
+def test_post_events_failed_kinesis_records(
+    mock_authorizer,
+    mock_client,
+    mock_dataset,
+    mock_dataset_versions,
+    mock_keycloak,
+    mock_stream_name,
+    monkeypatch,
+):
+    def put_records_to_kinesis(self, records, *args):
+        raise PutRecordsError(records)
+
+    monkeypatch.setattr(EventService, "_put_records_to_kinesis", put_records_to_kinesis)
+    res = mock_client.post(
+        "/foo/1/events",
+        headers={"Authorization": f"Bearer {valid_token}"},
+        json=[{"foo": "bar"}],
+    )
+    assert res.status_code == 500
+    assert res.json()["failed_records"][0]["Data"] == '{"foo":"bar"}\n'
+
+
+def test_post_events_too_large(
+    mock_authorizer,
+    mock_client,
+    mock_dataset,
+    mock_dataset_versions,
+    mock_keycloak,
+    mock_stream_name,
+):
+    res = mock_client.post(
+        "/foo/1/events",
+        headers={"Authorization": f"Bearer {valid_token}"},
+        json=[{"foo": "bar"}, {"foo": "x" * 1024 * 1024}],
+    )
+    assert res.status_code == 400
+    data = res.json()
+    assert data["message"] == "Element at index 1 exceeds the maximum record size"
+    assert data["too_large_records"] == [1]
+
+
 @mock_kinesis
 def test_post_events_validation_error(
     mock_authorizer,
@@ -110,6 +163,759 @@ def test_post_events_validation_error(
     assert res.status_code == 422
 
 
+def test_post_ndjson(
+    mock_authorizer,
+    mock_client,
+    mock_dataset,
+    mock_dataset_versions,
+    mock_keycloak,
+    mock_stream_name,
+    sent_records,
+):
+    res = mock_client.post(
+        "/foo/1/events/ndjson",
+        headers={
+            "Authorization": f"Bearer {valid_token}",
+            "Content-Type": "application/x-ndjson",
+        },
+        data=b"".join(b'{"n": %d}\n' % i for i in range(1200)),
+    )
+    assert res.status_code == 200
+    assert res.json() == {"num_events": 1200}
+    assert sorted(len(records) for _, records in sent_records) == [200, 500, 500]
+    assert {stream_name for stream_name, _ in sent_records} == {
+        "dp.green.foo.incoming.1.json"
+    }
+    assert sorted(
+        json.loads(record["Data"])["n"]
+        for _, records in sent_records
+        for record in records
+    ) == list(range(1200))
+
+
+def test_post_ndjson_unsupported_media_type(
+    mock_authorizer,
+    mock_client,
+    mock_dataset,
+    mock_dataset_versions,
+    mock_keycloak,
+    mock_stream_name,
+):
+    res = mock_client.post(
+        "/foo/1/events/ndjson",
+        headers={"Authorization": f"Bearer {valid_token}"},
+        json=[{"foo": "bar"}],
+    )
+    assert res.status_code == 415
+
+
+@mock_kinesis
+def test_post_ndjson_invalid_lines(
+    mock_authorizer,
+    mock_client,
+    mock_dataset,
+    mock_dataset_versions,
+    mock_keycloak,
+    mock_stream_name,
+):
+    create_event_stream("dp.green.foo.incoming.1.json")
+    res = mock_client.post(
+        "/foo/1/events/ndjson",
+        headers={
+            "Authorization": f"Bearer {valid_token}",
+            "Content-Type": "application/x-ndjson",
+        },
+        data=b'{"foo": "bar"}\nfoo\n{"foo": "baz"}\n',
+    )
+    assert res.status_code == 400
+    assert res.json() == {
+        "message": "1 line was not sent",
+        "num_events": 2,
+        "invalid_lines": [2],
+    }
+
+
+def test_post_ndjson_failed_records(
+    mock_authorizer,
+    mock_client,
+    mock_dataset,
+    mock_dataset_versions,
+    mock_keycloak,
+    mock_stream_name,
+    failed_records,
+):
+    res = mock_client.post(
+        "/foo/1/events/ndjson",
+        headers={
+            "Authorization": f"Bearer {valid_token}",
+            "Content-Type": "application/x-ndjson",
+        },
+        data=b'{"foo": "bar"}\n',
+    )
+    assert res.status_code == 500
+    data = res.json()
+    assert data["message"] == "Request failed for 1 element"
+    assert data["failed_records"] == ["foo"]
+
+
+def test_post_ndjson_client_error_cancels_chunks(
+    mock_authorizer,
+    mock_client,
+    mock_dataset,
+    mock_dataset_versions,
+    mock_keycloak,
+    mock_stream_name,
+    monkeypatch,
+):
+    cancelled = []
+
+    async def send_records_async(self, target, records, *args, **kwargs):
+        if json.loads(records[0]["Data"])["n"] == 0:
+            raise ClientError({"Error": {"Code": "InternalFailure"}}, "PutRecords")
+        try:
+            await asyncio.sleep(10)
+        except asyncio.CancelledError:
+            cancelled.append(len(records))
+            raise
+
+    monkeypatch.setattr(EventService, "send_records_async", send_records_async)
+
+    res = mock_client.post(
+        "/foo/1/events/ndjson",
+        headers={
+            "Authorization": f"Bearer {valid_token}",
+            "Content-Type": "application/x-ndjson",
+        },
+        data=b"".join(b'{"n": %d}\n' % i for i in range(1200)),
+    )
+    assert res.status_code == 500
+    assert sorted(cancelled) == [200, 500]
+
+
+def test_post_ndjson_ordered_partition_key(
+    mock_authorizer,
+    mock_client,
+    mock_dataset,
+    mock_dataset_versions,
+    mock_keycloak,
+    monkeypatch,
+):
+    sent = []
+    active = []
+
+    async def stream_target_async(self, dataset_id, version):
+        return StreamTarget("foo", lambda event: str(event["id"]), False)
+
+    async def send_records_async(self, target, records, *args, **kwargs):
+        active.append(records)
+        assert len(active) == 1
+        await asyncio.sleep(0.01)
+        active.remove(records)
+        sent.append(json.loads(records[0]["Data"])["n"])
+
+    monkeypatch.setattr(EventService, "stream_target_async", stream_target_async)
+    monkeypatch.setattr(EventService, "send_records_async", send_records_async)
+
+    res = mock_client.post(
+        "/foo/1/events/ndjson",
+        headers={
+            "Authorization": f"Bearer {valid_token}",
+            "Content-Type": "application/x-ndjson",
+        },
+        data=b"".join(b'{"id": 1, "n": %d}\n' % i for i in range(1200)),
+    )
+    assert res.status_code == 200
+    assert sent == [0, 500, 1000]
+
+
+def test_post_ndjson_ordered_partition_key_holds_back_after_failure(
+    mock_authorizer,
+    mock_client,
+    mock_dataset,
+    mock_dataset_versions,
+    mock_keycloak,
+    monkeypatch,
+):
+    sent = []
+
+    async def stream_target_async(self, dataset_id, version):
+        return StreamTarget("foo", lambda event: str(event["id"]), False)
+
+    async def send_records_async(self, target, records, *args, **kwargs):
+        sent.append(json.loads(records[0]["Data"])["n"])
+        raise PutRecordsError(records)
+
+    monkeypatch.setattr(EventService, "stream_target_async", stream_target_async)
+    monkeypatch.setattr(EventService, "send_records_async", send_records_async)
+
+    res = mock_client.post(
+        "/foo/1/events/ndjson",
+        headers={
+            "Authorization": f"Bearer {valid_token}",
+            "Content-Type": "application/x-ndjson",
+        },
+        data=b"".join(b'{"id": 1, "n": %d}\n' % i for i in range(1200)),
+    )
+    assert res.status_code == 500
+    assert sent == [0]
+    failed = [
+        json.loads(record["Data"])["n"] for record in res.json()["failed_records"]
+    ]
+    assert failed == list(range(1200))
+
+
+@pytest.mark.parametrize("content_encoding", ["gzip", "zstd"])
+def test_post_events_compressed(
+    mock_authorizer,
+    mock_client,
+    mock_dataset,
+    mock_dataset_versions,
+    mock_keycloak,
+    mock_stream_name,
+    sent_records,
+    content_encoding,
+):
+    events = [{"n": i} for i in range(10)]
+    res = mock_client.post(
+        "/foo/1/events",
+        headers={
+            "Authorization": f"Bearer {valid_token}",
+            "Content-Type": "application/json",
+            "Content-Encoding": content_encoding,
+        },
+        data=compress(json.dumps(events).encode(), content_encoding),
+    )
+    assert res.status_code == 200
+    _, records = sent_records[0]
+    assert [json.loads(record["Data"]) for record in records] == events
+
+
+@pytest.mark.parametrize("content_encoding", ["gzip", "zstd"])
+def test_post_ndjson_compressed(
+    mock_authorizer,
+    mock_client,
+    mock_dataset,
+    mock_dataset_versions,
+    mock_keycloak,
+    mock_stream_name,
+    sent_records,
+    content_encoding,
+):
+    data = b"".join(b'{"n": %d}\n' % i for i in range(600))
+    res = mock_client.post(
+        "/foo/1/events/ndjson",
+        headers={
+            "Authorization": f"Bearer {valid_token}",
+            "Content-Type": "application/x-ndjson",
+            "Content-Encoding": content_encoding,
+        },
+        data=compress(data, content_encoding),
+    )
+    assert res.status_code == 200
+    assert res.json() == {"num_events": 600}
+    assert sorted(len(records) for _, records in sent_records) == [100, 500]
+
+
+def test_post_ndjson_compressed_through_api_gateway(
+    mock_authorizer,
+    mock_boto,
+    mock_dataset,
+    mock_dataset_versions,
+    mock_keycloak,
+    mock_stream_name,
+    sent_records,
+):
+    # With binary media types enabled, API Gateway hands compressed bodies to
+    # the Lambda function base64 encoded.
+    data = b"".join(b'{"n": %d}\n' % i for i in range(10))
+    handler = Mangum(app=app, api_gateway_base_path="/streams", lifespan="off")
+    res = handler(
+        {
+            "httpMethod": "POST",
+            "path": "/streams/foo/1/events/ndjson",
+            "headers": {
+                "Authorization": f"Bearer {valid_token}",
+                "Content-Type": "application/x-ndjson",
+                "Content-Encoding": "gzip",
+            },
+            "multiValueQueryStringParameters": None,
+            "requestContext": {"identity": {"sourceIp": "127.0.0.1"}},
+            "body": base64.b64encode(gzip.compress(data)).decode(),
+            "isBase64Encoded": True,
+        },
+        {},
+    )
+    assert res["statusCode"] == 200
+    assert json.loads(res["body"]) == {"num_events": 10}
+    _, records = sent_records[0]
+    assert [json.loads(record["Data"]) for record in records] == [
+        {"n": i} for i in range(10)
+    ]
+
+
+@pytest.mark.parametrize("path", ["", "/ndjson"])
+def test_post_events_decompressed_too_large(
+    mock_authorizer,
+    mock_client,
+    mock_dataset,
+    mock_dataset_versions,
+    mock_keycloak,
+    mock_stream_name,
+    sent_records,
+    monkeypatch,
+    path,
+):
+    monkeypatch.setattr(compression, "MAX_DECOMPRESSED_BODY_BYTES", 1000)
+    data = b"".join(b'{"n": %d}\n' % i for i in range(1000))
+    res = mock_client.post(
+        f"/foo/1/events{path}",
+        headers={
+            "Authorization": f"Bearer {valid_token}",
+            "Content-Type": "application/x-ndjson" if path else "application/json",
+            "Content-Encoding": "gzip",
+        },
+        data=gzip.compress(data),
+    )
+    assert res.status_code == 413
+    assert res.json()["message"] == "Decompressed request body exceeds 1000 bytes"
+
+
+def test_post_events_invalid_gzip(
+    mock_authorizer,
+    mock_client,
+    mock_dataset,
+    mock_dataset_versions,
+    mock_keycloak,
+    mock_stream_name,
+):
+    res = mock_client.post(
+        "/foo/1/events",
+        headers={
+            "Authorization": f"Bearer {valid_token}",
+            "Content-Type": "application/json",
+            "Content-Encoding": "gzip",
+        },
+        data=b'[{"foo": "bar"}]',
+    )
+    assert res.status_code == 400
+    assert res.json()["message"] == "Invalid gzip data"
+
+
+def test_post_events_truncated_gzip(
+    mock_authorizer,
+    mock_client,
+    mock_dataset,
+    mock_dataset_versions,
+    mock_keycloak,
+    mock_stream_name,
+):
+    res = mock_client.post(
+        "/foo/1/events",
+        headers={
+            "Authorization": f"Bearer {valid_token}",
+            "Content-Type": "application/json",
+            "Content-Encoding": "gzip",
+        },
+        data=gzip.compress(b'[{"foo": "bar"}]')[:-4],
+    )
+    assert res.status_code == 400
+    assert res.json()["message"] == "Truncated gzip data"
+
+
+def test_post_events_unsupported_encoding(
+    mock_authorizer,
+    mock_client,
+    mock_dataset,
+    mock_dataset_versions,
+    mock_keycloak,
+    mock_stream_name,
+):
+    res = mock_client.post(
+        "/foo/1/events",
+        headers={
+            "Authorization": f"Bearer {valid_token}",
+            "Content-Type": "application/json",
+            "Content-Encoding": "br",
+        },
+        data=b'[{"foo": "bar"}]',
+    )
+    assert res.status_code == 415
+    assert res.json()["message"] == "Unsupported content encoding: br"
+
+
+def test_post_events_idempotency_key(
+    mock_authorizer,
+    mock_client,
+    mock_dataset,
+    mock_dataset_versions,
+    mock_keycloak,
+    mock_stream_name,
+    sent_records,
+    idempotency_keys_table,
+):
+    headers = {"Authorization": f"Bearer {valid_token}", "Idempotency-Key": "abc"}
+
+    res = mock_client.post("/foo/1/events", headers=headers, json=[{"foo": "bar"}])
+    assert res.status_code == 200
+    assert "Idempotent-Replayed" not in res.headers
+    assert len(sent_records) == 1
+
+    # A hot retry is answered from the in-process cache...
+    res = mock_client.post("/foo/1/events", headers=headers, json=[{"foo": "bar"}])
+    assert res.status_code == 200
+    assert res.headers["Idempotent-Replayed"] == "true"
+    assert len(sent_records) == 1
+
+    # ...and a retry hitting another process from the table.
+    idempotency._recent_results.clear()
+    res = mock_client.post("/foo/1/events", headers=headers, json=[{"foo": "bar"}])
+    assert res.status_code == 200
+    assert res.headers["Idempotent-Replayed"] == "true"
+    assert len(sent_records) == 1
+
+    headers["Idempotency-Key"] = "def"
+    res = mock_client.post("/foo/1/events", headers=headers, json=[{"foo": "bar"}])
+    assert res.status_code == 200
+    assert "Idempotent-Replayed" not in res.headers
+    assert len(sent_records) == 2
+
+    # Reusing a key for different events is an error.
+    headers["Idempotency-Key"] = "abc"
+    res = mock_client.post("/foo/1/events", headers=headers, json=[{"foo": "baz"}])
+    assert res.status_code == 422
+    assert len(sent_records) == 2
+
+
+def test_post_events_idempotency_key_per_caller(
+    mock_authorizer,
+    mock_client,
+    mock_dataset,
+    mock_dataset_versions,
+    mock_keycloak,
+    mock_stream_name,
+    sent_records,
+    idempotency_keys_table,
+    monkeypatch,
+):
+    headers = {"Authorization": f"Bearer {valid_token}", "Idempotency-Key": "abc"}
+
+    res = mock_client.post("/foo/1/events", headers=headers, json=[{"foo": "bar"}])
+    assert res.status_code == 200
+    assert len(sent_records) == 1
+
+    # Another caller using the same key gets its events sent, not the first
+    # caller's response.
+    monkeypatch.setattr(
+        KeycloakOpenID,
+        "introspect",
+        lambda self, token: {"active": True, "username": "johndoe"},
+    )
+    authorizer._introspections.clear()
+    res = mock_client.post("/foo/1/events", headers=headers, json=[{"foo": "bar"}])
+    assert res.status_code == 200
+    assert "Idempotent-Replayed" not in res.headers
+    assert len(sent_records) == 2
+
+
+def test_post_events_idempotency_key_in_progress(
+    mock_authorizer,
+    mock_client,
+    mock_dataset,
+    mock_dataset_versions,
+    mock_keycloak,
+    mock_stream_name,
+    sent_records,
+    idempotency_keys_table,
+):
+    headers = {"Authorization": f"Bearer {valid_token}", "Idempotency-Key": "abc"}
+    body = b'[{"foo": "bar"}]'
+    # The first request is still sending its events.
+    idempotency.IdempotencyService().reserve(
+        "foo/1/janedoe/abc", idempotency.request_hash(body)
+    )
+
+    res = mock_client.post(
+        "/foo/1/events",
+        headers={**headers, "Content-Type": "application/json"},
+        data=body,
+    )
+
+    assert res.status_code == 409
+    assert res.headers["Retry-After"] == "1"
+    assert len(sent_records) == 0
+
+
+def test_post_events_idempotency_key_failed_records(
+    mock_authorizer,
+    mock_client,
+    mock_dataset,
+    mock_dataset_versions,
+    mock_keycloak,
+    mock_stream_name,
+    failed_records,
+    idempotency_keys_table,
+):
+    headers = {"Authorization": f"Bearer {valid_token}", "Idempotency-Key": "abc"}
+
+    res = mock_client.post("/foo/1/events", headers=headers, json=[{"foo": "bar"}])
+    assert res.status_code == 500
+
+    assert "Item" not in idempotency_keys_table.get_item(
+        Key={"id": "foo/1/janedoe/abc"}
+    )
+
+
+@pytest.mark.parametrize(
+    "error_code,status_code,failed_record_count", [(None, 200, 0), ("Oops", 207, 1)]
+)
+def test_post_events_per_record_status(
+    mock_authorizer,
+    mock_client,
+    mock_dataset,
+    mock_dataset_versions,
+    mock_keycloak,
+    mock_stream_name,
+    monkeypatch,
+    error_code,
+    status_code,
+    failed_record_count,
+):
+    def put_records_to_kinesis(
+        self, records, stream_name, retries, deadline, results, *args
+    ):
+        results[id(records[0])] = {"SequenceNumber": "1", "ShardId": "shardId-0"}
+        if error_code:
+            results[id(records[1])] = {"ErrorCode": error_code, "ErrorMessage": "!"}
+            raise PutRecordsError(records[1:])
+        results[id(records[1])] = {"SequenceNumber": "2", "ShardId": "shardId-0"}
+
+    monkeypatch.setattr(EventService, "_put_records_to_kinesis", put_records_to_kinesis)
+    res = mock_client.post(
+        "/foo/1/events?per_record_status=true",
+        headers={"Authorization": f"Bearer {valid_token}"},
+        json=[{"foo": "bar"}, {"foo": "baz"}],
+    )
+    assert res.status_code == status_code
+    assert res.json() == {
+        "failed_record_count": failed_record_count,
+        "records": [
+            {"sequence_number": "1", "shard_id": "shardId-0"},
+            {"error_code": "Oops", "error_message": "!"}
+            if error_code
+            else {"sequence_number": "2", "shard_id": "shardId-0"},
+        ],
+    }
+
+
+def test_post_events_dataset_metadata_cached(
+    mock_authorizer,
+    mock_client,
+    mock_keycloak,
+    mock_stream_name,
+    sent_records,
+    monkeypatch,
+):
+    calls = []
+
+    def get_dataset(self, dataset_id, *args, **kwargs):
+        calls.append("get_dataset")
+        return {"Id": dataset_id, "accessRights": "public"}
+
+    def get_versions(self, dataset_id):
+        calls.append("get_versions")
+        return [{"id": f"{dataset_id}/1", "version": "1"}]
+
+    monkeypatch.setattr(Dataset, "get_dataset", get_dataset)
+    monkeypatch.setattr(Dataset, "get_versions", get_versions)
+
+    for _ in range(2):
+        res = mock_client.post(
+            "/foo/1/events",
+            headers={"Authorization": f"Bearer {valid_token}"},
+            json=[{"foo": "bar"}],
+        )
+        assert res.status_code == 200
+
+    assert sorted(calls) == ["get_dataset", "get_versions"]
+    assert len(sent_records) == 2
+
+
+def test_post_events_invalid(
+    mock_authorizer,
+    mock_client,
+    mock_dataset,
+    mock_dataset_versions_with_schema,
+    mock_keycloak,
+    mock_stream_name,
+    sent_records,
+):
+    res = mock_client.post(
+        "/foo/1/events",
+        headers={"Authorization": f"Bearer {valid_token}"},
+        json=[{"id": "a"}, {"id": 1}, {}],
+    )
+    assert res.status_code == 400
+    assert res.json() == {
+        "message": "Elements at index 1, 2 do not match the dataset schema",
+        "invalid_records": [
+            {"index": 1, "errors": ["id: 1 is not of type 'string'"]},
+            {"index": 2, "errors": ["'id' is a required property"]},
+        ],
+    }
+    assert sent_records == []
+
+
+def test_post_events_valid(
+    mock_authorizer,
+    mock_client,
+    mock_dataset,
+    mock_dataset_versions_with_schema,
+    mock_keycloak,
+    mock_stream_name,
+    sent_records,
+):
+    res = mock_client.post(
+        "/foo/1/events",
+        headers={"Authorization": f"Bearer {valid_token}"},
+        json=[{"id": "a"}, {"id": "b"}],
+    )
+    assert res.status_code == 200
+    assert len(sent_records[0][1]) == 2
+
+
+def test_post_ndjson_invalid(
+    mock_authorizer,
+    mock_client,
+    mock_dataset,
+    mock_dataset_versions_with_schema,
+    mock_keycloak,
+    mock_stream_name,
+    sent_records,
+):
+    res = mock_client.post(
+        "/foo/1/events/ndjson",
+        headers={
+            "Authorization": f"Bearer {valid_token}",
+            "Content-Type": "application/x-ndjson",
+        },
+        data=b'{"id": "a"}\n{"id": 1}\n',
+    )
+    assert res.status_code == 400
+    assert res.json() == {
+        "message": "1 line was not sent",
+        "num_events": 1,
+        "invalid_lines": [2],
+    }
+
+
+def test_post_events_throughput_exceeded(
+    mock_authorizer,
+    mock_client,
+    mock_dataset,
+    mock_dataset_versions,
+    mock_keycloak,
+    mock_stream_name,
+    sent_records,
+    monkeypatch,
+):
+    admission._limiters.set(
+        "dp.green.foo.incoming.1.json", StreamLimiter(1, clock=lambda: 0.0)
+    )
+    events = [{"n": i} for i in range(600)]
+
+    res = mock_client.post(
+        "/foo/1/events",
+        headers={"Authorization": f"Bearer {valid_token}"},
+        json=events,
+    )
+    assert res.status_code == 200
+
+    res = mock_client.post(
+        "/foo/1/events",
+        headers={"Authorization": f"Bearer {valid_token}"},
+        json=events,
+    )
+    assert res.status_code == 429
+    assert res.headers["Retry-After"] == "1"
+    assert res.json()["message"].startswith("Write throughput of the stream exceeded")
+    assert len(sent_records) == 2
+
+
+def test_post_events_throughput_exceeded_per_record_status(
+    mock_authorizer,
+    mock_client,
+    mock_dataset,
+    mock_dataset_versions,
+    mock_keycloak,
+    mock_stream_name,
+    sent_records,
+):
+    admission._limiters.set(
+        "dp.green.foo.incoming.1.json", StreamLimiter(1, clock=lambda: 0.0)
+    )
+    events = [{"n": i} for i in range(600)]
+
+    res = mock_client.post(
+        "/foo/1/events",
+        headers={"Authorization": f"Bearer {valid_token}"},
+        json=events,
+    )
+    assert res.status_code == 200
+
+    res = mock_client.post(
+        "/foo/1/events?per_record_status=true",
+        headers={"Authorization": f"Bearer {valid_token}"},
+        json=events,
+    )
+    assert res.status_code == 207
+    assert res.headers["Retry-After"] == "1"
+    data = res.json()
+    assert data["failed_record_count"] == 600
+    assert data["records"][0]["retry_after"] == pytest.approx(0.2)
+
+
+def compress(data, content_encoding):
+    if content_encoding == "zstd":
+        return zstandard.ZstdCompressor().compress(data)
+    return gzip.compress(data)
+
+
+@pytest.fixture()
+def sent_records(monkeypatch):
+    sent = []
+
+    def put_records_to_kinesis(self, records, stream_name, *args, **kwargs):
+        sent.append((stream_name, records))
+
+    monkeypatch.setattr(EventService, "_put_records_to_kinesis", put_records_to_kinesis)
+    return sent
+
+
+@pytest.fixture()
+def idempotency_keys_table(mock_client):
+    idempotency._recent_results.clear()
+    yield create_idempotency_keys_table()
+    idempotency._recent_results.clear()
+
+
+@pytest.fixture()
+def mock_dataset_versions_with_schema(monkeypatch):
+    def get_versions(self, dataset_id):
+        return [
+            {
+                "id": f"{dataset_id}/1",
+                "version": "1",
+                "schema": {
+                    "type": "object",
+                    "properties": {"id": {"type": "string"}},
+                    "required": ["id"],
+                },
+            }
+        ]
+
+    monkeypatch.setattr(Dataset, "get_versions", get_versions)
+
+
 @pytest.fixture()
 def failed_records(monkeypatch):
     def put_records_to_kinesis(*args, **kwargs):
@@ -124,10 +930,10 @@ def failed_records(monkeypatch):
 
 @pytest.fixture()
 def mock_stream_name(monkeypatch):
-    def stream_name(self, dataset_id, version, confidentiality):
-        return f"dp.{confidentiality}.{dataset_id}.incoming.{version}.json"
+    def get_event_stream(self, dataset_id, version):
+        return None
 
-    monkeypatch.setattr(EventService, "_stream_name", stream_name)
+    monkeypatch.setattr(EventService, "get_event_stream", get_event_stream)
 
 
 @pytest.fixture()
@@ -0,0 +1,123 @@
+import threading
+
+import pytest
+from keycloak.exceptions import KeycloakAuthenticationError
+
+from resources import origo_clients
+from resources.origo_clients import CachedDatasetClient
+
+
+class DatasetClient:
+    def __init__(self):
+        self.calls = []
+
+    def get_dataset(self, dataset_id):
+        self.calls.append(("get_dataset", dataset_id))
+        return {"Id": dataset_id, "source": {"type": "event"}}
+
+    def get_versions(self, dataset_id):
+        self.calls.append(("get_versions", dataset_id))
+        return [{"version": "1"}]
+
+    def get_latest_version(self, dataset_id):
+        return {"version": "1"}
+
+
+def test_calls_are_deduplicated_within_a_request():
+    client = DatasetClient()
+    cached_client = CachedDatasetClient(client)
+
+    assert cached_client.get_dataset("foo") == {
+        "Id": "foo",
+        "source": {"type": "event"},
+    }
+    assert cached_client.get_dataset("foo") is cached_client.get_dataset("foo")
+    assert cached_client.get_versions("foo") == [{"version": "1"}]
+    assert cached_client.get_versions("foo") == [{"version": "1"}]
+    assert client.calls == [("get_dataset", "foo"), ("get_versions", "foo")]
+    assert cached_client.api_calls == 2
+
+
+def test_calls_are_cached_between_requests():
+    client = DatasetClient()
+
+    CachedDatasetClient(client).get_dataset("foo")
+    CachedDatasetClient(client).get_dataset("foo")
+    CachedDatasetClient(client).get_dataset("bar")
+    assert client.calls == [("get_dataset", "foo"), ("get_dataset", "bar")]
+
+    origo_clients._dataset_metadata.clear()
+    CachedDatasetClient(client).get_dataset("foo")
+    assert client.calls[-1] == ("get_dataset", "foo")
+    assert len(client.calls) == 3
+
+
+def test_requests_get_their_own_copy():
+    client = DatasetClient()
+
+    dataset = CachedDatasetClient(client).get_dataset("foo")
+    dataset["source"]["type"] = "file"
+
+    assert CachedDatasetClient(client).get_dataset("foo")["source"]["type"] == "event"
+
+
+def test_other_methods_are_passed_through():
+    assert CachedDatasetClient(DatasetClient()).get_latest_version("foo") == {
+        "version": "1"
+    }
+
+
+def test_credentials_are_refreshed_when_rejected(monkeypatch):
+    class RejectingDatasetClient(DatasetClient):
+        def get_dataset(self, dataset_id):
+            raise KeycloakAuthenticationError(response_code=401)
+
+    fresh_client = DatasetClient()
+    monkeypatch.setattr(origo_clients, "refresh_keycloak_config", lambda: "config")
+    monkeypatch.setattr(
+        origo_clients, "get_origo_sdk", lambda config, sdk: fresh_client
+    )
+    cached_client = CachedDatasetClient(RejectingDatasetClient())
+
+    assert cached_client.get_dataset("foo")["Id"] == "foo"
+    assert fresh_client.calls == [("get_dataset", "foo")]
+
+
+def test_dataset_is_prefetched_with_versions():
+    barrier = threading.Barrier(2, timeout=5)
+
+    class ConcurrentDatasetClient(DatasetClient):
+        def get_dataset(self, dataset_id):
+            # Both lookups must be in flight at the same time to get past here.
+            barrier.wait()
+            return super().get_dataset(dataset_id)
+
+        def get_versions(self, dataset_id):
+            barrier.wait()
+            return super().get_versions(dataset_id)
+
+    client = ConcurrentDatasetClient()
+    cached_client = CachedDatasetClient(client)
+
+    assert cached_client.get_versions("foo", prefetch_dataset=True) == [
+        {"version": "1"}
+    ]
+    assert cached_client.get_dataset("foo")["Id"] == "foo"
+    assert cached_client.api_calls == 2
+    assert sorted(client.calls) == [("get_dataset", "foo"), ("get_versions", "foo")]
+
+
+def test_prefetch_errors_are_left_to_get_dataset():
+    class MissingDatasetClient(DatasetClient):
+        def get_dataset(self, dataset_id):
+            self.calls.append(("get_dataset", dataset_id))
+            raise ValueError("Not found")
+
+    client = MissingDatasetClient()
+    cached_client = CachedDatasetClient(client)
+
+    assert cached_client.get_versions("foo", prefetch_dataset=True) == [
+        {"version": "1"}
+    ]
+    with pytest.raises(ValueError):
+        cached_client.get_dataset("foo")
@@ -6,7 +6,7 @@ from okdata.sdk.data.dataset import Dataset
 from services import ResourceConflict, EventStreamService, ResourceNotFound
 import test.test_data.stream as test_data
 from .conftest import username, valid_token, valid_token_no_access
-from database.models import EventStream
+from database.models import EventStream, HashKeyDistribution, PartitionKey
 
 
 dataset_id = test_data.dataset_id
@@ -34,6 +34,9 @@ class TestPostStreamResource:
             "updated_at": test_data.event_stream.updated_at.isoformat(),
             "deleted": test_data.event_stream.deleted,
             "status": test_data.event_stream.cf_status,
+            "partition_key": {"type": "random", "path": None, "fields": []},
+            "aggregate_records": False,
+            "hash_key_distribution": None,
         }
 
         EventStreamService.create_event_stream.assert_called_once_with(
@@ -232,6 +235,141 @@ class TestDeleteStreamResource:
         assert response.json() == {"message": "Server error"}
 
 
+class TestPutStreamResource:
+    def test_put_200(
+        self,
+        mock_client,
+        mock_event_stream_service,
+        mock_keycloak,
+        mock_authorizer,
+        mock_dataset_versions,
+    ):
+        response = mock_client.put(
+            f"/{dataset_id}/{version}",
+            json={
+                "partition_key": {"type": "path", "path": "vehicleId"},
+                "aggregate_records": True,
+            },
+            headers=auth_header,
+        )
+
+        assert response.status_code == 200
+        assert response.json()["aggregate_records"] is True
+        assert response.json()["partition_key"] == {
+            "type": "path",
+            "path": "vehicleId",
+            "fields": [],
+        }
+        EventStreamService.update_event_stream_settings.assert_called_once_with(
+            self=ANY,
+            dataset_id=dataset_id,
+            version=version,
+            updated_by=username,
+            partition_key=PartitionKey(type="path", path="vehicleId"),
+            aggregate_records=True,
+            hash_key_distribution=None,
+        )
+
+    def test_put_404(
+        self,
+        mock_client,
+        mock_event_stream_service_resource_not_found,
+        mock_keycloak,
+        mock_authorizer,
+        mock_dataset_versions,
+    ):
+        response = mock_client.put(
+            f"/{dataset_id}/{version}",
+            json={"partition_key": {"type": "random"}},
+            headers=auth_header,
+        )
+
+        assert response.status_code == 404
+        assert response.json() == {
+            "message": f"Event stream with id {dataset_id}/{version} does not exist"
+        }
+
+    def test_put_422_invalid_partition_key(
+        self,
+        mock_client,
+        mock_event_stream_service,
+        mock_keycloak,
+        mock_authorizer,
+        mock_dataset_versions,
+    ):
+        response = mock_client.put(
+            f"/{dataset_id}/{version}",
+            json={"partition_key": {"type": "hash"}},
+            headers=auth_header,
+        )
+
+        assert response.status_code == 422
+        assert EventStreamService.update_event_stream_settings.call_count == 0
+
+    def test_put_hash_key_distribution(
+        self,
+        mock_client,
+        mock_event_stream_service,
+        mock_keycloak,
+        mock_authorizer,
+        mock_dataset_versions,
+    ):
+        response = mock_client.put(
+            f"/{dataset_id}/{version}",
+            json={
+                "hash_key_distribution": {
+                    "type": "weighted",
+                    "shard_weights": {"shardId-000000000001": 0},
+                }
+            },
+            headers=auth_header,
+        )
+
+        assert response.status_code == 200
+        assert response.json()["hash_key_distribution"] == {
+            "type": "weighted",
+            "shard_weights": {"shardId-000000000001": 0},
+        }
+        EventStreamService.update_event_stream_settings.assert_called_once_with(
+            self=ANY,
+            dataset_id=dataset_id,
+            version=version,
+            updated_by=username,
+            partition_key=PartitionKey(),
+            aggregate_records=False,
+            hash_key_distribution=HashKeyDistribution(
+                type="weighted", shard_weights={"shardId-000000000001": 0}
+            ),
+        )
+
+    @pytest.mark.parametrize(
+        "body",
+        [
+            {"hash_key_distribution": {"type": "weighted"}},
+            {"hash_key_distribution": {"shard_weights": {"shardId-000000000001": -1}}},
+            {
+                "partition_key": {"type": "path", "path": "vehicleId"},
+                "hash_key_distribution": {"type": "round_robin"},
+            },
+        ],
+    )
+    def test_put_422_invalid_hash_key_distribution(
+        self,
+        body,
+        mock_client,
+        mock_event_stream_service,
+        mock_keycloak,
+        mock_authorizer,
+        mock_dataset_versions,
+    ):
+        response = mock_client.put(
+            f"/{dataset_id}/{version}", json=body, headers=auth_header
+        )
+
+        assert response.status_code == 422
+        assert EventStreamService.update_event_stream_settings.call_count == 0
+
+
 class TestGetStreamResource:
     def test_get_200(
         self,
@@ -292,11 +430,32 @@ def mock_event_stream_service(monkeypatch, mocker):
     def delete_event_stream(self, dataset_id, version, updated_by):
         return
 
+    def update_event_stream_settings(
+        self,
+        dataset_id,
+        version,
+        updated_by,
+        partition_key,
+        aggregate_records,
+        hash_key_distribution,
+    ):
+        return test_data.event_stream.copy(
+            update={
+                "partition_key": partition_key,
+                "aggregate_records": aggregate_records,
+                "hash_key_distribution": hash_key_distribution,
+            }
+        )
+
     monkeypatch.setattr(EventStreamService, "create_event_stream", create_event_stream)
     monkeypatch.setattr(EventStreamService, "delete_event_stream", delete_event_stream)
+    monkeypatch.setattr(
+        EventStreamService, "update_event_stream_settings", update_event_stream_settings
+    )
 
     mocker.spy(EventStreamService, "create_event_stream")
     mocker.spy(EventStreamService, "delete_event_stream")
+    mocker.spy(EventStreamService, "update_event_stream_settings")
 
 
 @pytest.fixture()
@@ -316,7 +475,21 @@ def mock_event_stream_service_resource_not_found(monkeypatch):
     def delete_event_stream(self, dataset_id, version, updated_by):
         raise ResourceNotFound
 
+    def update_event_stream_settings(
+        self,
+        dataset_id,
+        version,
+        updated_by,
+        partition_key,
+        aggregate_records,
+        hash_key_distribution,
+    ):
+        raise ResourceNotFound
+
     monkeypatch.setattr(EventStreamService, "delete_event_stream", delete_event_stream)
+    monkeypatch.setattr(
+        EventStreamService, "update_event_stream_settings", update_event_stream_settings
+    )
 
 
 @pytest.fixture()
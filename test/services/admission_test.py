@@ -0,0 +1,78 @@
+import pytest
+from moto import mock_kinesis
+
+from services import admission
+from services.admission import (
+    SHARD_MAX_BYTES_PER_SECOND,
+    StreamLimiter,
+    _shard_count as shard_count,
+)
+from test.util import create_event_stream
+
+
+class Clock:
+    def __init__(self):
+        self.now = 100.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_stream_limiter_records():
+    clock = Clock()
+    limiter = StreamLimiter(2, clock)
+
+    assert limiter.acquire(1500, 100) == 0
+    assert limiter.acquire(500, 100) == 0
+    assert limiter.acquire(500, 100) == pytest.approx(0.25)
+
+    clock.now += 0.25
+    assert limiter.acquire(500, 100) == 0
+
+
+def test_stream_limiter_bytes():
+    clock = Clock()
+    limiter = StreamLimiter(1, clock)
+
+    assert limiter.acquire(1, SHARD_MAX_BYTES_PER_SECOND // 2) == 0
+    assert limiter.acquire(1, SHARD_MAX_BYTES_PER_SECOND) == pytest.approx(0.5)
+    # A rejected request doesn't use up any capacity.
+    assert limiter.acquire(1, SHARD_MAX_BYTES_PER_SECOND // 2) == 0
+
+
+def test_stream_limiter_more_than_capacity():
+    clock = Clock()
+    limiter = StreamLimiter(1, clock)
+
+    # Batches larger than a second's worth of capacity get through when the
+    # bucket is full, and then have to be paid back.
+    assert limiter.acquire(1, 3 * SHARD_MAX_BYTES_PER_SECOND) == 0
+    assert limiter.acquire(1, 1) == pytest.approx(2.0, abs=0.01)
+
+    clock.now += 3
+    assert limiter.acquire(1, 1) == 0
+
+
+def test_acquire(monkeypatch):
+    shard_counts = {"foo": 1, "bar": None}
+    lookups = []
+
+    def _shard_count(stream_name):
+        lookups.append(stream_name)
+        return shard_counts[stream_name]
+
+    monkeypatch.setattr(admission, "_shard_count", _shard_count)
+
+    assert admission.acquire("foo", 1000, 100) == 0
+    assert admission.acquire("foo", 1000, 100) > 0
+    assert admission.acquire("bar", 5000, 100) == 0
+    assert admission.acquire("bar", 5000, 100) == 0
+    assert lookups == ["foo", "bar"]
+
+
+@mock_kinesis
+def test_shard_count():
+    create_event_stream("foo")
+
+    assert shard_count("foo") == 1
+    assert shard_count("missing") is None
@@ -0,0 +1,138 @@
+import hashlib
+
+from services.aggregation import MAGIC, aggregate_records
+
+
+def read_varint(data, pos):
+    value = shift = 0
+    while True:
+        byte = data[pos]
+        pos += 1
+        value |= (byte & 0x7F) << shift
+        shift += 7
+        if not byte & 0x80:
+            return value, pos
+
+
+def read_fields(data):
+    pos = 0
+    while pos < len(data):
+        key, pos = read_varint(data, pos)
+        field_number, wire_type = key >> 3, key & 0x7
+        if wire_type == 0:
+            value, pos = read_varint(data, pos)
+        else:
+            length, pos = read_varint(data, pos)
+            value, pos = data[pos : pos + length], pos + length
+        yield field_number, value
+
+
+def deaggregate(record):
+    """Return the (partition key, data) pairs packed into `record`."""
+    data = record["Data"]
+    if not data.startswith(MAGIC):
+        return [(record["PartitionKey"], data)]
+
+    message, digest = data[len(MAGIC) : -16], data[-16:]
+    assert hashlib.md5(message).digest() == digest
+
+    partition_keys = []
+    records = []
+    for field_number, value in read_fields(message):
+        if field_number == 1:
+            partition_keys.append(value.decode("utf-8"))
+        elif field_number == 3:
+            fields = dict(read_fields(value))
+            records.append((partition_keys[fields[1]], fields[3]))
+    return records
+
+
+def records(*keys):
+    return [
+        {"Data": f'{{"n":{i}}}\n'.encode(), "PartitionKey": key}
+        for i, key in enumerate(keys)
+    ]
+
+
+def test_aggregate_records_round_trip():
+    record_list = records(*["a"] * 100)
+
+    aggregated = aggregate_records(record_list)
+
+    assert len(aggregated) == 1
+    record, members = aggregated[0]
+    assert record["PartitionKey"] == "a"
+    assert members == record_list
+    assert deaggregate(record) == [(r["PartitionKey"], r["Data"]) for r in record_list]
+
+
+def test_aggregate_records_groups_by_partition_key():
+    record_list = records("a", "b", "a", "c", "b", "a")
+
+    aggregated = aggregate_records(record_list)
+
+    by_key = {record["PartitionKey"]: members for record, members in aggregated}
+    assert by_key["a"] == [record_list[0], record_list[2], record_list[5]]
+    assert by_key["b"] == [record_list[1], record_list[4]]
+    assert by_key["c"] == [record_list[3]]
+
+
+def test_aggregate_records_single_record_passed_on():
+    record_list = records("a", "b")
+
+    aggregated = aggregate_records(record_list)
+
+    assert aggregated == [
+        (record_list[0], [record_list[0]]),
+        (record_list[1], [record_list[1]]),
+    ]
+
+
+def test_aggregate_records_random_keys():
+    record_list = records("a", "b", "c", "d")
+
+    aggregated = aggregate_records(record_list, random_keys=True)
+
+    assert len(aggregated) == 1
+    record, members = aggregated[0]
+    assert record["PartitionKey"] not in "abcd"
+    assert members == record_list
+    assert {key for key, _ in deaggregate(record)} == {record["PartitionKey"]}
+
+
+def test_aggregate_records_max_size():
+    record_list = [
+        {"Data": b"x" * 1000 + b"\n", "PartitionKey": "a"} for _ in range(200)
+    ]
+
+    aggregated = aggregate_records(record_list, max_size=10000)
+
+    assert len(aggregated) > 1
+    assert all(
+        len(record["Data"]) + len(record["PartitionKey"]) <= 10000
+        for record, _ in aggregated
+    )
+    assert [member for _, members in aggregated for member in members] == record_list
+    assert [data for record, _ in aggregated for _, data in deaggregate(record)] == [
+        record["Data"] for record in record_list
+    ]
+
+
+def test_aggregate_records_oversized_record():
+    record_list = [
+        {"Data": b"x" * 100, "PartitionKey": "a"},
+        {"Data": b"x" * 20000, "PartitionKey": "a"},
+        {"Data": b"x" * 100, "PartitionKey": "a"},
+    ]
+
+    aggregated = aggregate_records(record_list, max_size=10000)
+
+    assert [members for _, members in aggregated] == [
+        [record_list[0]],
+        [record_list[1]],
+        [record_list[2]],
+    ]
+
+
+def test_aggregate_records_empty():
+    assert aggregate_records([]) == []
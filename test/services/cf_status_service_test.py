@@ -1,6 +1,8 @@
 import json
 from services.cf_status import resolve_cf_stack_type, resolve_event_stream_id
-from services import CfStatusService
+from services import CfStatusService, service
+from services.partition_key import random_partition_key
+from services.service import StreamTarget
 from database import CfStackType
 from test import test_utils
 import test.test_data.cf_status as test_data
@@ -49,6 +51,18 @@ def test_update_status(mock_boto):
     assert event_sink.cf_status == "ACTIVE"
 
 
+def test_update_status_invalidates_stream_target(mock_boto):
+    test_utils.create_event_streams_table(
+        item_list=[json.loads(test_data.event_stream.json())]
+    )
+    target = StreamTarget("foo", random_partition_key, False)
+    service._stream_targets.set(test_data.event_stream_id, target)
+
+    CfStatusService().update_status(test_data.event_stream_stack_name, "ACTIVE")
+
+    assert service._stream_targets.get(test_data.event_stream_id) is None
+
+
 def test_resolve_event_stream_id():
 
     assert (
@@ -0,0 +1,45 @@
+import json
+
+import pytest
+
+from services import encoding
+from services.encoding import encode_events
+
+events = [
+    {"foo": "bar", "n": 1},
+    {"nested": {"list": [1, 2.5, None, True]}},
+    {"text": "blåbærsyltetøy"},
+    {"big": 2**70},
+]
+
+
+@pytest.fixture(params=["orjson", "json"])
+def encoder(request, monkeypatch):
+    if request.param == "json":
+        monkeypatch.setattr(encoding, "orjson", None)
+    elif encoding.orjson is None:
+        pytest.skip("orjson is not installed")
+
+
+def test_encode_events(encoder):
+    encoded = encode_events(events)
+
+    assert all(isinstance(data, bytes) for data in encoded)
+    assert all(data.endswith(b"\n") and data.count(b"\n") == 1 for data in encoded)
+    assert [json.loads(data) for data in encoded] == events
+
+
+def test_encode_events_compact(encoder):
+    assert encode_events([{"foo": "bar", "baz": [1, 2]}]) == [
+        b'{"foo":"bar","baz":[1,2]}\n'
+    ]
+
+
+def test_encode_events_utf8(encoder):
+    assert encode_events([{"text": "blåbær"}]) == [
+        '{"text":"blåbær"}\n'.encode("utf-8")
+    ]
+
+
+def test_encode_events_empty(encoder):
+    assert encode_events([]) == []
@@ -3,6 +3,7 @@ import dateutil.parser as date_parser
 from freezegun import freeze_time
 from okdata.sdk.data.dataset import Dataset
 
+from database import HashKeyDistribution, PartitionKey
 from services import EventStreamService, ResourceConflict, ResourceNotFound
 
 from clients import setup_origo_sdk, CloudformationClient
@@ -118,6 +119,63 @@ def test_delete_fails_if_subresources_exist(mock_boto):
         )
 
 
+def test_update_event_stream_settings(mock_boto):
+    test_utils.create_event_streams_table()
+
+    event_stream_service = EventStreamService(
+        setup_origo_sdk(test_data.ssm_parameters, Dataset)
+    )
+    partition_key = PartitionKey(type="hash", fields=["vehicleId", "tripId"])
+
+    with pytest.raises(ResourceNotFound):
+        event_stream_service.update_event_stream_settings(
+            test_data.dataset_id, test_data.version, test_data.updated_by, partition_key
+        )
+
+    event_stream_service.event_streams_table.put_event_stream(test_data.event_stream)
+
+    event_stream_service.update_event_stream_settings(
+        test_data.dataset_id,
+        test_data.version,
+        "someone-else",
+        partition_key,
+        aggregate_records=True,
+    )
+
+    event_stream = event_stream_service.get_event_stream(
+        test_data.dataset_id, test_data.version
+    )
+    assert event_stream.partition_key == partition_key
+    assert event_stream.aggregate_records
+    assert event_stream.config_version == 2
+    assert event_stream.updated_by == "someone-else"
+
+
+def test_update_event_stream_settings_hash_key_distribution(mock_boto):
+    test_utils.create_event_streams_table()
+
+    event_stream_service = EventStreamService(
+        setup_origo_sdk(test_data.ssm_parameters, Dataset)
+    )
+    event_stream_service.event_streams_table.put_event_stream(test_data.event_stream)
+    hash_key_distribution = HashKeyDistribution(
+        type="weighted", shard_weights={"shardId-000000000000": 0.5}
+    )
+
+    event_stream_service.update_event_stream_settings(
+        test_data.dataset_id,
+        test_data.version,
+        test_data.updated_by,
+        PartitionKey(),
+        hash_key_distribution=hash_key_distribution,
+    )
+
+    event_stream = event_stream_service.get_event_stream(
+        test_data.dataset_id, test_data.version
+    )
+    assert event_stream.hash_key_distribution == hash_key_distribution
+
+
 @pytest.fixture()
 def mock_dataset(monkeypatch):
     def get_dataset(self, id):
@@ -0,0 +1,90 @@
+import time
+
+import pytest
+
+from services import IdempotencyKeyInProgress, IdempotencyKeyReused, IdempotencyService
+from services import idempotency
+from test.util import create_idempotency_keys_table
+
+
+@pytest.fixture
+def idempotency_keys_table(mock_dynamodb):
+    return create_idempotency_keys_table()
+
+
+@pytest.fixture(autouse=True)
+def clear_recent_results():
+    idempotency._recent_results.clear()
+
+
+def test_reserve_and_put_result(idempotency_keys_table):
+    service = IdempotencyService()
+
+    assert service.reserve("foo/1/abc", "hash") is None
+    item = idempotency_keys_table.get_item(Key={"id": "foo/1/abc"})["Item"]
+    assert item["status"] == "in_progress"
+
+    stored = service.put_result("foo/1/abc", "hash", {"foo": "bar"})
+    assert stored.result == {"foo": "bar"}
+    assert service.reserve("foo/1/abc", "hash") == stored
+
+    item = idempotency_keys_table.get_item(Key={"id": "foo/1/abc"})["Item"]
+    assert item["status"] == "done"
+    assert item["expires_at"] == stored.expires_at
+    assert stored.expires_at > time.time() + idempotency.IDEMPOTENCY_KEY_TTL - 10
+
+
+def test_reserve_in_progress(idempotency_keys_table):
+    IdempotencyService().reserve("foo/1/abc", "hash")
+
+    with pytest.raises(IdempotencyKeyInProgress):
+        IdempotencyService().reserve("foo/1/abc", "hash")
+
+
+def test_reserve_released(idempotency_keys_table):
+    service = IdempotencyService()
+    service.reserve("foo/1/abc", "hash")
+    service.release("foo/1/abc")
+
+    assert service.reserve("foo/1/abc", "hash") is None
+
+
+def test_reserve_other_request(idempotency_keys_table):
+    service = IdempotencyService()
+    service.reserve("foo/1/abc", "hash")
+
+    with pytest.raises(IdempotencyKeyReused):
+        service.reserve("foo/1/abc", "other-hash")
+
+    service.put_result("foo/1/abc", "hash", None)
+    with pytest.raises(IdempotencyKeyReused):
+        service.reserve("foo/1/abc", "other-hash")
+
+    idempotency._recent_results.clear()
+    with pytest.raises(IdempotencyKeyReused):
+        service.reserve("foo/1/abc", "other-hash")
+
+
+def test_reserve_result_is_cached(idempotency_keys_table):
+    service = IdempotencyService()
+    service.reserve("foo/1/abc", "hash")
+    service.put_result("foo/1/abc", "hash", None)
+    idempotency._recent_results.clear()
+
+    assert service.reserve("foo/1/abc", "hash").result is None
+
+    idempotency_keys_table.delete_item(Key={"id": "foo/1/abc"})
+    assert service.reserve("foo/1/abc", "hash").result is None
+
+
+def test_reserve_expired(idempotency_keys_table):
+    idempotency_keys_table.put_item(
+        Item={
+            "id": "foo/1/abc",
+            "status": "in_progress",
+            "request_hash": "hash",
+            "expires_at": int(time.time()) - 1,
+        }
+    )
+
+    assert IdempotencyService().reserve("foo/1/abc", "other-hash") is None
@@ -0,0 +1,113 @@
+import json
+
+from services.ndjson import NdjsonChunker
+from services.partition_key import random_partition_key
+from services.service import RECORD_MAX_BYTES
+from services.validation import event_validator
+
+
+def ndjson(events):
+    return b"".join(json.dumps(event).encode() + b"\n" for event in events)
+
+
+def chunk_all(chunker, data, piece_size):
+    chunks = []
+    for i in range(0, len(data), piece_size):
+        chunks.extend(chunker.feed(data[i : i + piece_size]))
+    chunks.extend(chunker.finish())
+    return chunks
+
+
+def test_chunks_lines_as_they_arrive():
+    events = [{"n": i} for i in range(1200)]
+    chunker = NdjsonChunker()
+
+    chunks = chunk_all(chunker, ndjson(events), 1000)
+
+    assert [len(chunk) for chunk in chunks] == [500, 500, 200]
+    assert [
+        json.loads(record["Data"]) for chunk in chunks for record in chunk
+    ] == events
+    assert all(record["Data"].endswith(b"\n") for record in chunks[0])
+    assert chunker.num_events == 1200
+    assert chunker.num_bytes == len(ndjson(events))
+
+
+def test_chunks_by_size():
+    line = b'{"x": "' + b"x" * 100000 + b'"}\n'
+    chunker = NdjsonChunker()
+
+    chunks = chunk_all(chunker, line * 110, 65536)
+
+    assert [len(chunk) for chunk in chunks] == [52, 52, 6]
+
+
+def test_full_chunk_returned_early():
+    chunker = NdjsonChunker(max_records=2)
+
+    assert chunker.feed(b'{"a": 1}\n{"a": 2}\n') == []
+    assert len(chunker.feed(b'{"a": 3}\n')) == 1
+    assert len(chunker.finish()) == 1
+
+
+def test_last_line_without_newline():
+    chunker = NdjsonChunker()
+
+    chunks = chunk_all(chunker, b'{"a": 1}\r\n\n{"a": 2}', 3)
+
+    assert [record["Data"] for record in chunks[0]] == [b'{"a": 1}\n', b'{"a": 2}\n']
+
+
+def test_invalid_lines():
+    chunker = NdjsonChunker()
+
+    chunks = chunk_all(chunker, b'{"a": 1}\n[1, 2]\n\nfoo\n{"a": 2}\n', 7)
+
+    assert len(chunks[0]) == 2
+    assert chunker.invalid_lines == [2, 4]
+
+
+def test_too_large_lines():
+    large = b'{"x": "' + b"x" * RECORD_MAX_BYTES + b'"}'
+    chunker = NdjsonChunker()
+
+    chunks = chunk_all(chunker, b'{"a": 1}\n' + large + b'\n{"a": 2}\n' + large, 4096)
+
+    assert [record["Data"] for record in chunks[0]] == [b'{"a": 1}\n', b'{"a": 2}\n']
+    assert chunker.too_large_lines == [2, 4]
+
+
+def test_random_partition_key():
+    chunker = NdjsonChunker(random_partition_key)
+
+    chunks = chunk_all(chunker, b'{"a": 1}\n{"a": 2}\n', 100)
+
+    assert len({record["PartitionKey"] for record in chunks[0]}) == 2
+
+
+def test_partition_key_from_event():
+    chunker = NdjsonChunker(lambda event: event["id"])
+
+    chunks = chunk_all(chunker, b'{"id": "a"}\n{"id": "b"}\n{"id": }\n', 100)
+
+    assert [record["PartitionKey"] for record in chunks[0]] == ["a", "b"]
+    assert chunker.invalid_lines == [3]
+
+
+def test_lines_not_matching_schema():
+    validator = event_validator({"type": "object", "required": ["id"]})
+    chunker = NdjsonChunker(validator=validator)
+
+    chunks = chunk_all(chunker, b'{"id": "a"}\n{"foo": "b"}\n{"id": "c"}\n', 100)
+
+    assert [json.loads(record["Data"])["id"] for record in chunks[0]] == ["a", "c"]
+    assert chunker.invalid_lines == [2]
+
+
+def test_malformed_json_with_random_partition_key():
+    chunker = NdjsonChunker()
+
+    chunks = chunk_all(chunker, b'{"a": 1}\n{"a": }\n{foo}\n{"a": 2}\n', 100)
+
+    assert [record["Data"] for record in chunks[0]] == [b'{"a": 1}\n', b'{"a": 2}\n']
+    assert chunker.invalid_lines == [2, 3]
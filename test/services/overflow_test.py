@@ -0,0 +1,191 @@
+import time
+
+import boto3
+import pytest
+from botocore.exceptions import ClientError
+from moto import mock_s3
+
+from database import IdempotencyKeysTable
+from services import PutRecordsError, RetryStrategy
+from services.overflow import LocalOverflowStore, S3OverflowStore, drain
+from test.util import create_idempotency_keys_table
+
+records = [
+    {"PartitionKey": "a", "Data": b'{"n": 1}\n'},
+    {"PartitionKey": "b", "Data": '{"n": 2}\n'},
+]
+
+
+class FakeEventService:
+    """Accepts every record, except for the streams told to fail."""
+
+    def __init__(self, failures=None):
+        self.failures = failures or {}
+        self.sent = []
+        self.retry_strategy = RetryStrategy(time_budget=1.0)
+
+    def replay_records(self, records, stream_name, retries=3):
+        failure = self.failures.get(stream_name)
+        if isinstance(failure, Exception):
+            raise failure
+        if failure:
+            raise PutRecordsError(failure(records))
+        self.sent.append((stream_name, [record["Data"] for record in records]))
+
+
+@pytest.fixture
+def local_store(tmp_path):
+    return LocalOverflowStore(str(tmp_path))
+
+
+@pytest.fixture
+def s3_store(mock_dynamodb):
+    create_idempotency_keys_table()
+    with mock_s3():
+        s3 = boto3.client("s3", region_name="eu-west-1")
+        s3.create_bucket(
+            Bucket="overflow",
+            CreateBucketConfiguration={"LocationConstraint": "eu-west-1"},
+        )
+        yield S3OverflowStore(
+            "overflow", s3_client=s3, lease_table=IdempotencyKeysTable()
+        )
+
+
+@pytest.fixture(params=["local_store", "s3_store"])
+def store(request):
+    return request.getfixturevalue(request.param)
+
+
+def test_store_roundtrip(store):
+    batch_id = store.put("dp.green.foo.incoming.1.json", records)
+
+    assert batch_id.startswith("dp.green.foo.incoming.1.json/")
+    assert store.batches() == [batch_id]
+    assert store.get(batch_id) == [
+        {"PartitionKey": "a", "Data": b'{"n": 1}\n'},
+        {"PartitionKey": "b", "Data": b'{"n": 2}\n'},
+    ]
+
+    store.replace(batch_id, records[1:])
+    assert [record["PartitionKey"] for record in store.get(batch_id)] == ["b"]
+
+    store.delete(batch_id)
+    assert store.batches() == []
+
+
+def test_store_get_missing(store):
+    batch_id = store.put("foo", records)
+    store.delete(batch_id)
+
+    with pytest.raises(KeyError):
+        store.get(batch_id)
+
+
+def test_store_lease(store):
+    batch_id = store.put("foo", records)
+
+    assert store.lease(batch_id, 60)
+    assert not store.lease(batch_id, 60)
+    assert store.batches() == [batch_id]
+
+    store.release(batch_id)
+    assert store.lease(batch_id, 60)
+
+
+def test_store_lease_expired(store):
+    batch_id = store.put("foo", records)
+
+    assert store.lease(batch_id, -1)
+    assert store.lease(batch_id, 60)
+
+
+def test_store_batches_oldest_first(store):
+    batch_ids = [
+        store.put("bar", records),
+        store.put("foo", records),
+        store.put("bar", records),
+    ]
+
+    assert store.batches() == batch_ids
+
+
+def test_drain(local_store):
+    local_store.put("foo", records[:1])
+    local_store.put("bar", records)
+    local_store.put("foo", records[1:])
+    event_service = FakeEventService()
+
+    assert drain(local_store, event_service) == {"foo": 2, "bar": 2}
+    assert event_service.sent == [
+        ("foo", [b'{"n": 1}\n']),
+        ("bar", [b'{"n": 1}\n', b'{"n": 2}\n']),
+        ("foo", [b'{"n": 2}\n']),
+    ]
+    assert local_store.batches() == []
+
+
+def test_drain_keeps_order_on_failure(local_store):
+    first = local_store.put("foo", records)
+    second = local_store.put("foo", records)
+    local_store.put("bar", records)
+    # The second record of each batch sent to foo fails.
+    event_service = FakeEventService({"foo": lambda records: records[1:]})
+
+    assert drain(local_store, event_service) == {"foo": 1, "bar": 2}
+    # The rest of foo is left for the next drain, starting with what failed.
+    assert local_store.batches() == [first, second]
+    assert [record["PartitionKey"] for record in local_store.get(first)] == ["b"]
+    assert len(local_store.get(second)) == 2
+
+
+def test_drain_stream_unavailable(local_store):
+    batch_id = local_store.put("foo", records)
+    error = ClientError({"Error": {"Code": "ResourceNotFoundException"}}, "PutRecords")
+
+    errors = []
+
+    assert drain(local_store, FakeEventService({"foo": error}), errors=errors) == {
+        "foo": 0
+    }
+    assert errors == [error]
+    assert local_store.batches() == [batch_id]
+    assert len(local_store.get(batch_id)) == 2
+
+
+def test_drain_skips_leased_streams(local_store):
+    leased = local_store.put("foo", records)
+    local_store.put("foo", records)
+    local_store.put("bar", records)
+    local_store.lease(leased, 60)
+    event_service = FakeEventService()
+
+    # Another drain is replaying foo, so its later batches must wait too.
+    assert drain(local_store, event_service) == {"bar": 2}
+    assert [stream_name for stream_name, _ in event_service.sent] == ["bar"]
+    assert len(local_store.batches()) == 2
+
+
+def test_drain_releases_leases(local_store):
+    batch_id = local_store.put("foo", records)
+    local_store.put("foo", records)
+    event_service = FakeEventService({"foo": lambda records: records})
+
+    drain(local_store, event_service)
+
+    assert local_store.lease(batch_id, 60)
+
+
+def test_drain_deadline(local_store):
+    local_store.put("foo", records)
+    local_store.put("bar", records)
+    event_service = FakeEventService()
+
+    # Too little time left to replay a batch within the retry time budget.
+    assert drain(local_store, event_service, deadline=time.monotonic() + 0.5) == {}
+    assert len(local_store.batches()) == 2
+
+    assert drain(local_store, event_service, deadline=time.monotonic() + 10) == {
+        "foo": 2,
+        "bar": 2,
+    }
@@ -0,0 +1,83 @@
+import pytest
+from pydantic import ValidationError
+
+from database import PartitionKey
+from services.partition_key import (
+    MAX_PARTITION_KEY_LENGTH,
+    partition_key_function,
+    random_partition_key,
+)
+
+
+def test_random_partition_key():
+    keys = {random_partition_key() for _ in range(100)}
+
+    assert len(keys) == 100
+    assert all(len(key) == 16 for key in keys)
+
+
+def test_default_is_random():
+    partition_key = partition_key_function(PartitionKey())
+
+    assert partition_key is random_partition_key
+
+
+def test_path_partition_key():
+    partition_key = partition_key_function(PartitionKey(type="path", path="vehicleId"))
+
+    assert partition_key({"vehicleId": "bus-42", "speed": 30}) == "bus-42"
+    assert partition_key({"vehicleId": 42}) == "42"
+
+
+def test_nested_path_partition_key():
+    partition_key = partition_key_function(PartitionKey(type="path", path="vehicle.id"))
+
+    assert partition_key({"vehicle": {"id": "bus-42"}}) == "bus-42"
+
+
+def test_path_partition_key_missing_value():
+    partition_key = partition_key_function(PartitionKey(type="path", path="vehicle.id"))
+
+    assert len(partition_key({"vehicle": "bus-42"})) == 16
+    assert len(partition_key({})) == 16
+    assert len(partition_key({"vehicle": {"id": ""}})) == 16
+
+
+def test_path_partition_key_truncated():
+    partition_key = partition_key_function(PartitionKey(type="path", path="id"))
+
+    assert len(partition_key({"id": "x" * 1000})) == MAX_PARTITION_KEY_LENGTH
+
+
+def test_hash_partition_key():
+    partition_key = partition_key_function(
+        PartitionKey(type="hash", fields=["vehicleId", "trip.id"])
+    )
+
+    key = partition_key({"vehicleId": "bus-42", "trip": {"id": 1}, "speed": 30})
+
+    assert len(key) == 32
+    assert key == partition_key({"trip": {"id": 1}, "vehicleId": "bus-42"})
+    assert key != partition_key({"vehicleId": "bus-42", "trip": {"id": 2}})
+
+
+def test_hash_partition_key_missing_values():
+    partition_key = partition_key_function(
+        PartitionKey(type="hash", fields=["vehicleId"])
+    )
+
+    assert len(partition_key({"speed": 30})) == 16
+
+
+@pytest.mark.parametrize(
+    "options",
+    [
+        {"type": "unknown"},
+        {"type": "path"},
+        {"type": "hash"},
+        {"type": "hash", "fields": []},
+    ],
+)
+def test_invalid_partition_key(options):
+    with pytest.raises(ValidationError):
+        PartitionKey(**options)
@@ -0,0 +1,37 @@
+import random
+
+from services.retry import RetryStrategy, is_throttled
+
+
+def test_is_throttled():
+    assert is_throttled({"ProvisionedThroughputExceededException"})
+    assert is_throttled({"InternalFailure", "KMSThrottlingException"})
+    assert not is_throttled({"InternalFailure"})
+    assert not is_throttled(set())
+
+
+def test_delay_first_retry():
+    strategy = RetryStrategy(rng=random.Random(0))
+
+    assert strategy.delay(0, {"InternalFailure"}) == strategy.base_delay
+    assert (
+        strategy.delay(0, {"ProvisionedThroughputExceededException"})
+        == strategy.throttling_base_delay
+    )
+
+
+def test_delay_decorrelated_jitter():
+    strategy = RetryStrategy(rng=random.Random(0))
+    delay = 0
+
+    for _ in range(100):
+        previous_delay = delay
+        delay = strategy.delay(previous_delay, {"InternalFailure"})
+        assert strategy.base_delay <= delay <= strategy.max_delay
+        assert delay <= max(strategy.base_delay, previous_delay * 3)
+
+
+def test_delay_capped():
+    strategy = RetryStrategy(max_delay=0.5, rng=random.Random(0))
+
+    assert strategy.delay(10, {"ProvisionedThroughputExceededException"}) == 0.5
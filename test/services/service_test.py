@@ -1,23 +1,106 @@
+import asyncio
+import io
+import json
+import random
+import threading
+import time
+
+import pytest
 from aws_xray_sdk.core import xray_recorder
+from botocore.exceptions import EndpointConnectionError
 from moto import mock_kinesis
 
+import metrics
+from clients import get_kinesis_client, reset_kinesis_client
+from database import EventStream, HashKeyDistribution
 from resources.events import event_service
+from services import (
+    EventService,
+    PutRecordsError,
+    RecordsTooLargeError,
+    RetryStrategy,
+    ThroughputExceededError,
+    admission,
+    shard_map,
+)
+from services.partition_key import random_partition_key
+from services.admission import StreamLimiter
+from services.service import StreamTarget, _record_status
+from services.overflow import LocalOverflowStore
+from services.shard_map import Shard, ShardMap
+from test.services.aggregation_test import deaggregate
 from test.util import create_event_stream
 
 xray_recorder.begin_segment("Test")
 
 
+class DatasetClient:
+    def get_dataset(self, dataset_id):
+        return {"Id": dataset_id, "accessRights": "public"}
+
+
+def send_events(service, events, **kwargs):
+    return asyncio.run(service.send_events_async("foo", "1", events, **kwargs))
+
+
+def put_records(service, records, stream_name, **kwargs):
+    asyncio.run(service._put_records_async(records, stream_name, **kwargs))
+
+
+def stream_name(service):
+    return asyncio.run(service.stream_target_async("foo", "1")).stream_name
+
+
 def test_stream_name(event_streams_table):
-    stream_name = event_service()._stream_name("foo", "1", "green")
-    assert stream_name == "dp.green.foo.incoming.1.json"
+    assert stream_name(EventService(DatasetClient())) == (
+        "dp.green.foo.incoming.1.json"
+    )
 
 
 def test_stream_name_raw(event_streams_table):
     event_streams_table.put_item(
         Item={"id": "foo/1", "config_version": 2, "create_raw": True}
     )
-    stream_name = event_service()._stream_name("foo", "1", "green")
-    assert stream_name == "dp.green.foo.raw.1.json"
+    assert stream_name(EventService(DatasetClient())) == "dp.green.foo.raw.1.json"
+
+
+def test_stream_target_cached(event_streams_table, monkeypatch):
+    lookups = []
+    get_event_stream = EventService.get_event_stream
+
+    def counting_get_event_stream(self, dataset_id, version):
+        lookups.append((dataset_id, version))
+        return get_event_stream(self, dataset_id, version)
+
+    monkeypatch.setattr(EventService, "get_event_stream", counting_get_event_stream)
+    service = EventService(DatasetClient())
+
+    assert stream_name(service) == "dp.green.foo.incoming.1.json"
+    assert stream_name(service) == "dp.green.foo.incoming.1.json"
+    assert lookups == [("foo", "1")]
+
+    event_stream = EventStream(id="foo/1", create_raw=True)
+    service.update_event_stream(event_stream, "me")
+
+    assert stream_name(service) == "dp.green.foo.raw.1.json"
+    assert lookups == [("foo", "1"), ("foo", "1")]
+
+
+def test_stream_target_async_cached(monkeypatch):
+    class CountingDatasetClient:
+        def get_dataset(self, dataset_id):
+            lookups.append(dataset_id)
+            return {"Id": dataset_id, "accessRights": "public"}
+
+    lookups = []
+    monkeypatch.setattr(EventService, "get_event_stream", lambda *args: None)
+    service = EventService(CountingDatasetClient())
+
+    first = asyncio.run(service.stream_target_async("foo", "1"))
+    second = asyncio.run(service.stream_target_async("foo", "1"))
+
+    assert first is second
+    assert lookups == ["foo"]
 
 
 def test_event_records():
@@ -28,15 +111,61 @@ def test_event_records():
         {"key30": "value30", "key31": "value31"},
     ]
     expected = [
-        {"PartitionKey": "aa-bb", "Data": '{"key00": "value00", "key01": "value01"}\n'},
-        {"PartitionKey": "aa-bb", "Data": '{"key10": "value10", "key11": "value11"}\n'},
-        {"PartitionKey": "aa-bb", "Data": '{"key20": "value20", "key21": "value21"}\n'},
-        {"PartitionKey": "aa-bb", "Data": '{"key30": "value30", "key31": "value31"}\n'},
+        {"PartitionKey": "aa-bb", "Data": b'{"key00":"value00","key01":"value01"}\n'},
+        {"PartitionKey": "aa-bb", "Data": b'{"key10":"value10","key11":"value11"}\n'},
+        {"PartitionKey": "aa-bb", "Data": b'{"key20":"value20","key21":"value21"}\n'},
+        {"PartitionKey": "aa-bb", "Data": b'{"key30":"value30","key31":"value31"}\n'},
     ]
 
-    records = event_service()._event_records(event_body)
+    records, record_sizes = event_service()._event_records(event_body)
 
     assert all(x["Data"] == y["Data"] for x, y in zip(records, expected))
+    assert record_sizes == [len(record["Data"]) + 16 for record in records]
+
+
+def test_event_records_too_large():
+    event_body = [{"a": "b"}, {"a": "x" * 1024 * 1024}, {"a": "b"}]
+
+    with pytest.raises(RecordsTooLargeError) as e:
+        event_service()._event_records(event_body)
+
+    assert e.value.indices == [1]
+
+
+def test_event_records_partition_key():
+    event_body = [{"vehicleId": "a"}, {"vehicleId": "b"}, {"vehicleId": "a"}]
+
+    records, _ = event_service()._event_records(
+        event_body, lambda event: event["vehicleId"]
+    )
+
+    assert [record["PartitionKey"] for record in records] == ["a", "b", "a"]
+
+
+@mock_kinesis
+def test_send_events_partition_key(event_streams_table):
+    kinesis = create_event_stream("dp.green.foo.raw.1.json")
+    event_streams_table.put_item(
+        Item={
+            "id": "foo/1",
+            "config_version": 1,
+            "create_raw": True,
+            "partition_key": {"type": "path", "path": "vehicle.id"},
+        }
+    )
+
+    send_events(
+        EventService(DatasetClient()),
+        [{"vehicle": {"id": "v1"}}, {"vehicle": {"id": "v2"}}],
+    )
+
+    shard_iterator = kinesis.get_shard_iterator(
+        StreamName="dp.green.foo.raw.1.json",
+        ShardId="shardId-000000000000",
+        ShardIteratorType="TRIM_HORIZON",
+    )["ShardIterator"]
+    records = kinesis.get_records(ShardIterator=shard_iterator)["Records"]
+    assert [record["PartitionKey"] for record in records] == ["v1", "v2"]
 
 
 @mock_kinesis
@@ -90,3 +219,589 @@ def test_failed_records():
     )
 
     assert failed_records_list == expected
+
+
+def test_chunk_records_by_count():
+    record_list = [{"PartitionKey": "aa-bb", "Data": "{}\n"}] * 1201
+
+    chunks = event_service()._chunk_records(record_list, [8] * 1201)
+
+    assert [len(chunk) for chunk in chunks] == [500, 500, 201]
+
+
+def test_chunk_records_by_size():
+    data = "x" * (1024 * 1024 - 5)
+    record_list = [{"PartitionKey": "aa-bb", "Data": data}] * 11
+
+    chunks = event_service()._chunk_records(record_list, [1024 * 1024] * 11)
+
+    assert [len(chunk) for chunk in chunks] == [5, 5, 1]
+
+
+def test_chunk_records_empty():
+    assert event_service()._chunk_records([], []) == []
+
+
+def test_put_records_chunked(monkeypatch):
+    sent = []
+
+    def put_records_to_kinesis(self, records, *args):
+        sent.append(len(records))
+
+    monkeypatch.setattr(EventService, "_put_records_to_kinesis", put_records_to_kinesis)
+    record_list = [{"PartitionKey": "aa-bb", "Data": '{"foo": "bar"}\n'}] * 1234
+
+    put_records(event_service(), record_list, "foo")
+
+    assert sorted(sent) == [234, 500, 500]
+
+
+def test_stream_target_async_looks_up_concurrently(monkeypatch):
+    # Each lookup waits for the other one to start, so they only finish if
+    # they run at the same time.
+    barrier = threading.Barrier(2, timeout=5)
+
+    class DatasetClient:
+        def get_dataset(self, dataset_id):
+            barrier.wait()
+            return {"Id": dataset_id, "accessRights": "public"}
+
+    def get_event_stream(self, dataset_id, version):
+        barrier.wait()
+        return None
+
+    monkeypatch.setattr(EventService, "get_event_stream", get_event_stream)
+
+    target = asyncio.run(EventService(DatasetClient()).stream_target_async("foo", "1"))
+
+    assert target.stream_name == "dp.green.foo.incoming.1.json"
+    assert target.partition_key is random_partition_key
+    assert not target.aggregate
+
+
+def test_send_events_async(monkeypatch):
+    sent = []
+    barrier = threading.Barrier(3, timeout=5)
+
+    def put_records_to_kinesis(self, records, stream_name, *args):
+        # All three chunks have to be in flight at once to get past this.
+        barrier.wait()
+        sent.append((stream_name, len(records)))
+
+    monkeypatch.setattr(EventService, "get_event_stream", lambda *args: None)
+    monkeypatch.setattr(EventService, "_put_records_to_kinesis", put_records_to_kinesis)
+
+    events = [{"n": i} for i in range(1234)]
+    send_events(EventService(DatasetClient()), events)
+
+    assert sorted(sent) == [
+        ("dp.green.foo.incoming.1.json", 234),
+        ("dp.green.foo.incoming.1.json", 500),
+        ("dp.green.foo.incoming.1.json", 500),
+    ]
+
+
+def test_put_records_async_merges_failed_records(monkeypatch):
+    def put_records_to_kinesis(self, records, *args):
+        failed = [record for record in records if record["Data"] == "fail"]
+        if failed:
+            raise PutRecordsError(failed)
+
+    monkeypatch.setattr(EventService, "_put_records_to_kinesis", put_records_to_kinesis)
+    record_list = [
+        {"PartitionKey": "aa-bb", "Data": "fail" if i % 100 == 0 else "ok"}
+        for i in range(1200)
+    ]
+
+    with pytest.raises(PutRecordsError) as e:
+        asyncio.run(event_service()._put_records_async(record_list, "foo"))
+
+    assert len(e.value.records) == 12
+
+
+def test_send_records_async_aggregated_failed_records(monkeypatch):
+    def put_records_to_kinesis(self, records, *args):
+        raise PutRecordsError(records)
+
+    monkeypatch.setattr(EventService, "_put_records_to_kinesis", put_records_to_kinesis)
+    record_list = [{"PartitionKey": "aa-bb", "Data": b"{}\n"}] * 10
+    target = StreamTarget("foo", random_partition_key, True)
+
+    with pytest.raises(PutRecordsError) as e:
+        asyncio.run(event_service().send_records_async(target, record_list))
+
+    assert e.value.records == record_list
+
+
+def test_send_records_ordered(monkeypatch):
+    sent = []
+    active = []
+    lock = threading.Lock()
+
+    def put_records_to_kinesis(self, records, *args):
+        with lock:
+            active.append(records)
+            assert len(active) == 1
+        time.sleep(0.01)
+        with lock:
+            active.remove(records)
+        sent.append(records[0]["Data"])
+
+    monkeypatch.setattr(EventService, "_put_records_to_kinesis", put_records_to_kinesis)
+    record_list = [{"PartitionKey": "a", "Data": str(i)} for i in range(1234)]
+    target = StreamTarget("foo", lambda event: event["id"], False)
+
+    asyncio.run(event_service().send_records_async(target, record_list))
+
+    assert sent == ["0", "500", "1000"]
+
+
+def test_send_records_ordered_holds_back_after_failure(monkeypatch):
+    sent = []
+
+    def put_records_to_kinesis(self, records, *args):
+        sent.append(records[0]["Data"])
+        raise PutRecordsError(records)
+
+    monkeypatch.setattr(EventService, "_put_records_to_kinesis", put_records_to_kinesis)
+    record_list = [{"PartitionKey": "a", "Data": str(i)} for i in range(1234)]
+    target = StreamTarget("foo", lambda event: event["id"], False)
+    results = {}
+
+    with pytest.raises(PutRecordsError) as e:
+        asyncio.run(
+            event_service().send_records_async(target, record_list, results=results)
+        )
+
+    assert sent == ["0"]
+    assert e.value.records == record_list
+    assert [_record_status(results[id(record)]) for record in record_list[500:]] == [
+        {
+            "error_code": "HeldBack",
+            "error_message": "Not sent, as earlier records failed",
+        }
+    ] * 734
+
+
+def test_put_records_admission_control(monkeypatch):
+    sent = []
+
+    def put_records_to_kinesis(self, records, *args):
+        sent.append(len(records))
+
+    monkeypatch.setattr(EventService, "_put_records_to_kinesis", put_records_to_kinesis)
+    admission._limiters.set("foo", StreamLimiter(1, clock=lambda: 0.0))
+    record_list = [{"PartitionKey": "aa-bb", "Data": "{}"}] * 600
+
+    service = event_service()
+    put_records(service, record_list, "foo")
+
+    with pytest.raises(ThroughputExceededError) as e:
+        put_records(service, record_list, "foo")
+
+    assert e.value.records == record_list
+    assert e.value.retry_after == pytest.approx(0.2)
+    assert sorted(sent) == [100, 500]
+
+
+def test_put_records_async_admission_control_results(monkeypatch):
+    limiter = StreamLimiter(1, clock=lambda: 0.0)
+    limiter.acquire(1000, 0)
+    admission._limiters.set("foo", limiter)
+    record_list = [{"PartitionKey": "aa-bb", "Data": str(i)} for i in range(10)]
+    results = {}
+
+    with pytest.raises(ThroughputExceededError):
+        asyncio.run(event_service()._put_records_async(record_list, "foo", 3, results))
+
+    assert [_record_status(results[id(record)]) for record in record_list] == [
+        {
+            "error_code": "ProvisionedThroughputExceededException",
+            "error_message": "Rate exceeded for stream foo",
+            "retry_after": pytest.approx(0.01),
+        }
+    ] * 10
+
+
+def test_kinesis_client_is_reused():
+    reset_kinesis_client()
+    client = get_kinesis_client()
+
+    assert get_kinesis_client() is client
+
+    reset_kinesis_client()
+    assert get_kinesis_client() is not client
+
+
+class FakeKinesisClient:
+    def __init__(self, responses):
+        self.responses = responses
+        self.requests = []
+
+    def put_records(self, StreamName, Records):
+        self.requests.append(Records)
+        error_codes = self.responses.pop(0)
+        return {
+            "ResponseMetadata": {"RetryAttempts": 0},
+            "FailedRecordCount": sum(1 for code in error_codes if code),
+            "Records": [
+                {"ErrorCode": code, "ErrorMessage": "Oops"}
+                if code
+                else {"SequenceNumber": "1", "ShardId": "shardId-000000000000"}
+                for code in error_codes
+            ],
+        }
+
+
+@pytest.fixture
+def sleeps(monkeypatch):
+    sleeps = []
+    monkeypatch.setattr(
+        RetryStrategy, "sleep", lambda self, delay: sleeps.append(delay)
+    )
+    return sleeps
+
+
+def test_put_records_to_kinesis_backs_off(monkeypatch, sleeps):
+    throttled = "ProvisionedThroughputExceededException"
+    client = FakeKinesisClient(
+        [[None, throttled, throttled], [None, throttled], [None]]
+    )
+    monkeypatch.setattr("services.service.get_kinesis_client", lambda: client)
+    record_list = [{"PartitionKey": "aa-bb", "Data": str(i)} for i in range(3)]
+
+    service = event_service()
+    service.retry_strategy = RetryStrategy(rng=random.Random(1))
+    service._put_records_to_kinesis(record_list, "foo")
+
+    assert [len(records) for records in client.requests] == [3, 2, 1]
+    assert client.requests[2] == [record_list[2]]
+    assert len(sleeps) == 2
+    assert all(0.1 <= delay <= 2.0 for delay in sleeps)
+
+
+def test_send_events_per_record_status(monkeypatch, sleeps):
+    throttled = "ProvisionedThroughputExceededException"
+    client = FakeKinesisClient([[None, throttled, throttled], [None, throttled]])
+    monkeypatch.setattr("services.service.get_kinesis_client", lambda: client)
+    monkeypatch.setattr(EventService, "get_event_stream", lambda *args: None)
+    events = [{"n": i} for i in range(3)]
+
+    statuses = send_events(
+        EventService(DatasetClient()), events, retries=1, per_record=True
+    )
+
+    assert statuses == [
+        {"sequence_number": "1", "shard_id": "shardId-000000000000"},
+        {"sequence_number": "1", "shard_id": "shardId-000000000000"},
+        {"error_code": throttled, "error_message": "Oops"},
+    ]
+
+
+def test_send_events_per_record_status_aggregated(monkeypatch):
+    client = FakeKinesisClient([["InternalFailure"]])
+    monkeypatch.setattr("services.service.get_kinesis_client", lambda: client)
+    monkeypatch.setattr(EventService, "get_event_stream", lambda *args: None)
+    events = [{"n": i} for i in range(3)]
+
+    statuses = send_events(
+        EventService(DatasetClient()),
+        events,
+        retries=0,
+        aggregate=True,
+        per_record=True,
+    )
+
+    assert len(client.requests[0]) == 1
+    assert statuses == [{"error_code": "InternalFailure", "error_message": "Oops"}] * 3
+
+
+def test_send_events_async_per_record_status(monkeypatch):
+    client = FakeKinesisClient([[None, "InternalFailure"]])
+    monkeypatch.setattr("services.service.get_kinesis_client", lambda: client)
+    monkeypatch.setattr(EventService, "get_event_stream", lambda *args: None)
+    events = [{"n": i} for i in range(2)]
+
+    statuses = send_events(
+        EventService(DatasetClient()), events, retries=0, per_record=True
+    )
+
+    assert statuses == [
+        {"sequence_number": "1", "shard_id": "shardId-000000000000"},
+        {"error_code": "InternalFailure", "error_message": "Oops"},
+    ]
+
+
+def test_put_records_to_kinesis_retries_exhausted(monkeypatch, sleeps):
+    client = FakeKinesisClient([["InternalFailure"]] * 4)
+    monkeypatch.setattr("services.service.get_kinesis_client", lambda: client)
+    record_list = [{"PartitionKey": "aa-bb", "Data": "foo"}]
+
+    with pytest.raises(PutRecordsError) as e:
+        event_service()._put_records_to_kinesis(record_list, "foo", retries=3)
+
+    assert e.value.records == record_list
+    assert len(client.requests) == 4
+    assert len(sleeps) == 3
+
+
+def test_put_records_to_kinesis_time_budget(monkeypatch, sleeps):
+    client = FakeKinesisClient([["InternalFailure"]] * 4)
+    monkeypatch.setattr("services.service.get_kinesis_client", lambda: client)
+    record_list = [{"PartitionKey": "aa-bb", "Data": "foo"}]
+
+    service = event_service()
+    service.retry_strategy = RetryStrategy(time_budget=0)
+    with pytest.raises(PutRecordsError):
+        service._put_records_to_kinesis(record_list, "foo")
+
+    assert len(client.requests) == 1
+    assert sleeps == []
+
+
+@mock_kinesis
+def test_send_events_aggregated(event_streams_table):
+    kinesis = create_event_stream("dp.green.foo.raw.1.json")
+    event_streams_table.put_item(
+        Item={
+            "id": "foo/1",
+            "config_version": 1,
+            "create_raw": True,
+            "aggregate_records": True,
+        }
+    )
+    events = [{"n": i, "payload": "x" * 100} for i in range(1000)]
+
+    send_events(EventService(DatasetClient()), events)
+
+    shard_iterator = kinesis.get_shard_iterator(
+        StreamName="dp.green.foo.raw.1.json",
+        ShardId="shardId-000000000000",
+        ShardIteratorType="TRIM_HORIZON",
+    )["ShardIterator"]
+    records = kinesis.get_records(ShardIterator=shard_iterator)["Records"]
+    assert 1 < len(records) < 10
+    assert [
+        json.loads(data) for record in records for _, data in deaggregate(record)
+    ] == events
+
+
+def seed_shard_map(kinesis, stream_name):
+    # Moto doesn't implement ListShards.
+    shards = kinesis.describe_stream(StreamName=stream_name)["StreamDescription"][
+        "Shards"
+    ]
+    shard_map._shard_maps.set(
+        stream_name,
+        ShardMap(
+            [
+                Shard(
+                    shard["ShardId"],
+                    int(shard["HashKeyRange"]["StartingHashKey"]),
+                    int(shard["HashKeyRange"]["EndingHashKey"]),
+                )
+                for shard in shards
+            ]
+        ),
+    )
+
+
+@mock_kinesis
+def test_put_records_explicit_hash_keys():
+    kinesis = get_kinesis_client()
+    kinesis.create_stream(StreamName="foo", ShardCount=2)
+    seed_shard_map(kinesis, "foo")
+    record_list = [{"PartitionKey": "aa-bb", "Data": "{}"} for _ in range(4)]
+    results = {}
+
+    put_records(
+        event_service(),
+        record_list,
+        "foo",
+        results=results,
+        hash_key_distribution=HashKeyDistribution(),
+    )
+
+    assert [results[id(record)]["ShardId"] for record in record_list] == [
+        "shardId-000000000000",
+        "shardId-000000000001",
+        "shardId-000000000000",
+        "shardId-000000000001",
+    ]
+    assert shard_map._shard_maps.get("foo") is not None
+
+
+@mock_kinesis
+def test_send_records_async_weighted_hash_keys():
+    kinesis = get_kinesis_client()
+    kinesis.create_stream(StreamName="foo", ShardCount=2)
+    seed_shard_map(kinesis, "foo")
+    record_list = [{"PartitionKey": "aa-bb", "Data": "{}"} for _ in range(4)]
+    results = {}
+    target = StreamTarget(
+        "foo",
+        random_partition_key,
+        False,
+        HashKeyDistribution(type="weighted", shard_weights={"shardId-000000000000": 0}),
+    )
+
+    asyncio.run(event_service().send_records_async(target, record_list, 3, results))
+
+    assert {results[id(record)]["ShardId"] for record in record_list} == {
+        "shardId-000000000001"
+    }
+
+
+def test_put_records_stale_shard_map(monkeypatch):
+    client = FakeKinesisClient([[None, None]])
+    monkeypatch.setattr("services.service.get_kinesis_client", lambda: client)
+    # FakeKinesisClient puts every record on shard 0.
+    shard_map._shard_maps.set(
+        "foo",
+        ShardMap(
+            [Shard("shardId-000000000000", 0, 9), Shard("shardId-000000000001", 10, 19)]
+        ),
+    )
+    record_list = [{"PartitionKey": "aa-bb", "Data": "{}"} for _ in range(2)]
+
+    put_records(
+        event_service(), record_list, "foo", hash_key_distribution=HashKeyDistribution()
+    )
+
+    assert [record["ExplicitHashKey"] for record in record_list] == ["4", "14"]
+    assert len(shard_map._shard_maps) == 0
+
+
+def test_send_events_records_metrics(monkeypatch):
+    client = FakeKinesisClient([[None, None]])
+    monkeypatch.setattr("services.service.get_kinesis_client", lambda: client)
+    monkeypatch.setattr(EventService, "get_event_stream", lambda *args: None)
+
+    send_events(EventService(DatasetClient()), [{"n": 1}, {"n": 2}])
+
+    stream = io.StringIO()
+    metrics.flush(stream)
+    [document] = [json.loads(line) for line in stream.getvalue().splitlines()]
+    assert document["dataset_id"] == "foo"
+    assert document["records_per_batch"] == 2
+    assert document["bytes_per_batch"] > 0
+    assert document["get_event_stream_duration"] >= 0
+    assert document["kinesis_put_records_duration"] >= 0
+
+
+def test_send_events_spills_failed_records(monkeypatch, sleeps, tmp_path):
+    throttled = "ProvisionedThroughputExceededException"
+    client = FakeKinesisClient([[None, throttled, throttled], [None, throttled]])
+    monkeypatch.setattr("services.service.get_kinesis_client", lambda: client)
+    monkeypatch.setattr(EventService, "get_event_stream", lambda *args: None)
+    store = LocalOverflowStore(str(tmp_path))
+
+    statuses = send_events(
+        EventService(DatasetClient(), overflow_store=store),
+        [{"n": i} for i in range(3)],
+        retries=1,
+        per_record=True,
+    )
+
+    assert statuses == [
+        {"sequence_number": "1", "shard_id": "shardId-000000000000"},
+        {"sequence_number": "1", "shard_id": "shardId-000000000000"},
+        {"spilled": True},
+    ]
+    [batch_id] = store.batches()
+    assert batch_id.startswith("dp.green.foo.incoming.1.json/")
+    assert [record["Data"] for record in store.get(batch_id)] == [b'{"n":2}\n']
+
+
+def test_send_records_async_spills_when_unavailable(monkeypatch, tmp_path):
+    def put_records_to_kinesis(self, records, *args):
+        raise EndpointConnectionError(endpoint_url="https://kinesis")
+
+    monkeypatch.setattr(EventService, "_put_records_to_kinesis", put_records_to_kinesis)
+    store = LocalOverflowStore(str(tmp_path))
+    record_list = [{"PartitionKey": "aa-bb", "Data": b"{}\n"}] * 2
+
+    asyncio.run(
+        EventService(None, overflow_store=store).send_records_async(
+            StreamTarget("foo", random_partition_key, False), record_list
+        )
+    )
+
+    [batch_id] = store.batches()
+    assert len(store.get(batch_id)) == 2
+
+
+def test_send_records_spill_failure_raises(monkeypatch, tmp_path):
+    def put_records_to_kinesis(self, records, *args):
+        raise PutRecordsError(records)
+
+    monkeypatch.setattr(EventService, "_put_records_to_kinesis", put_records_to_kinesis)
+    store = LocalOverflowStore(str(tmp_path))
+
+    def put(stream_name, records):
+        raise OSError("No space left on device")
+
+    monkeypatch.setattr(store, "put", put)
+    record_list = [{"PartitionKey": "aa-bb", "Data": b"{}\n"}]
+
+    with pytest.raises(PutRecordsError):
+        asyncio.run(
+            EventService(None, overflow_store=store).send_records_async(
+                StreamTarget("foo", random_partition_key, False), record_list
+            )
+        )
+
+
+def test_replay_records(monkeypatch):
+    client = FakeKinesisClient([[None, "InternalFailure"]])
+    monkeypatch.setattr("services.service.get_kinesis_client", lambda: client)
+    record_list = [{"PartitionKey": "aa-bb", "Data": b"{}\n"} for _ in range(2)]
+
+    with pytest.raises(PutRecordsError) as e:
+        EventService(None).replay_records(record_list, "foo", retries=0)
+
+    assert e.value.records == [record_list[1]]
+
+
+def test_put_records_logs_attempts_of_all_chunks(monkeypatch, sleeps):
+    throttled = "ProvisionedThroughputExceededException"
+    client = FakeKinesisClient([[throttled] + [None] * 499, [None], [None] * 100])
+    monkeypatch.setattr("services.service.get_kinesis_client", lambda: client)
+    logged = {}
+    threads = set()
+
+    def log_add(**kwargs):
+        threads.add(threading.current_thread())
+        logged.update(kwargs)
+
+    monkeypatch.setattr("services.service.log_add", log_add)
+    record_list = [{"PartitionKey": "a", "Data": str(i)} for i in range(600)]
+
+    put_records(event_service(), record_list, "foo", ordered=True)
+
+    assert threads == {threading.main_thread()}
+    assert logged["kinesis_put_records_attempts"] == 3
+    assert logged["kinesis_failed_record_count"] == 0
+    assert logged["kinesis_error_codes"] == [throttled]
+    assert [
+        (attempt["chunk"], attempt["attempt"], attempt["records"])
+        for attempt in logged["kinesis_attempts"]
+    ] == [(0, 1, 500), (0, 2, 1), (1, 1, 100)]
+
+
+def test_send_events_sizes_records_once(monkeypatch):
+    client = FakeKinesisClient([[None] * 10])
+    monkeypatch.setattr("services.service.get_kinesis_client", lambda: client)
+    monkeypatch.setattr(EventService, "get_event_stream", lambda *args: None)
+    sized = []
+    record_size = EventService._record_size
+
+    def counting_record_size(self, record):
+        sized.append(record)
+        return record_size(self, record)
+
+    monkeypatch.setattr(EventService, "_record_size", counting_record_size)
+
+    send_events(EventService(DatasetClient()), [{"n": i} for i in range(10)])
+
+    assert len(sized) == 10
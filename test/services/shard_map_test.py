@@ -0,0 +1,127 @@
+from collections import Counter
+
+import pytest
+from botocore.exceptions import ClientError
+
+from services import shard_map
+from services.shard_map import Shard, ShardMap
+
+shards = [
+    Shard("shardId-000000000001", 100, 199),
+    Shard("shardId-000000000000", 0, 99),
+    Shard("shardId-000000000002", 200, 299),
+]
+
+
+class FakeKinesisClient:
+    def __init__(self, pages):
+        self.pages = pages
+        self.requests = []
+
+    def list_shards(self, **kwargs):
+        self.requests.append(kwargs)
+        if isinstance(self.pages, Exception):
+            raise self.pages
+        return self.pages.pop(0)
+
+
+def list_shards_entry(shard_id, start, end, closed=False):
+    sequence_number_range = {"StartingSequenceNumber": "1"}
+    if closed:
+        sequence_number_range["EndingSequenceNumber"] = "2"
+    return {
+        "ShardId": shard_id,
+        "HashKeyRange": {"StartingHashKey": str(start), "EndingHashKey": str(end)},
+        "SequenceNumberRange": sequence_number_range,
+    }
+
+
+def test_shard_id():
+    m = ShardMap(shards)
+
+    assert m.shard_id("0") == "shardId-000000000000"
+    assert m.shard_id("150") == "shardId-000000000001"
+    assert m.shard_id(299) == "shardId-000000000002"
+    assert m.shard_id("300") is None
+
+
+def test_hash_keys_round_robin():
+    m = ShardMap(shards)
+
+    assert m.hash_keys(4) == ["49", "149", "249", "49"]
+    # The next batch continues where the previous one left off.
+    assert m.hash_keys(2) == ["149", "249"]
+
+
+def test_hash_keys_weighted():
+    m = ShardMap(shards)
+
+    hash_keys = m.hash_keys(40, {"shardId-000000000000": 3, "shardId-000000000002": 0})
+
+    assert Counter(hash_keys) == {"49": 30, "149": 10}
+    # Smooth weighted round-robin doesn't send long runs to one shard.
+    assert hash_keys[:4] == ["49", "49", "149", "49"]
+
+
+def test_hash_keys_all_drained():
+    m = ShardMap(shards)
+
+    hash_keys = m.hash_keys(3, {shard.shard_id: 0 for shard in shards})
+
+    assert sorted(hash_keys) == ["149", "249", "49"]
+
+
+def test_shard_map_lists_open_shards(monkeypatch):
+    client = FakeKinesisClient(
+        [
+            {
+                "Shards": [
+                    list_shards_entry("shardId-000000000000", 0, 199, closed=True),
+                    list_shards_entry("shardId-000000000001", 0, 99),
+                ],
+                "NextToken": "next",
+            },
+            {"Shards": [list_shards_entry("shardId-000000000002", 100, 199)]},
+        ]
+    )
+    monkeypatch.setattr(shard_map, "get_kinesis_client", lambda: client)
+
+    m = shard_map.shard_map("foo")
+
+    assert m.shards == [
+        Shard("shardId-000000000001", 0, 99),
+        Shard("shardId-000000000002", 100, 199),
+    ]
+    assert client.requests == [{"StreamName": "foo"}, {"NextToken": "next"}]
+
+    # Cached from now on.
+    assert shard_map.shard_map("foo") is m
+    assert len(client.requests) == 2
+
+
+def test_shard_map_unknown_stream(monkeypatch):
+    error = ClientError({"Error": {"Code": "ResourceNotFoundException"}}, "ListShards")
+    monkeypatch.setattr(
+        shard_map, "get_kinesis_client", lambda: FakeKinesisClient(error)
+    )
+
+    assert shard_map.shard_map("foo") is None
+
+
+@pytest.mark.parametrize(
+    "shard_id,placed_as_expected",
+    [("shardId-000000000001", True), ("shardId-000000000003", False)],
+)
+def test_check_placement(shard_id, placed_as_expected):
+    shard_map._shard_maps.set("foo", ShardMap(shards))
+    records = [
+        {"PartitionKey": "a", "Data": "{}", "ExplicitHashKey": "49"},
+        {"PartitionKey": "b", "Data": "{}", "ExplicitHashKey": "149"},
+    ]
+    responses = [
+        {"SequenceNumber": "1", "ShardId": "shardId-000000000000"},
+        {"SequenceNumber": "2", "ShardId": shard_id},
+    ]
+
+    assert shard_map.check_placement("foo", records, responses) is placed_as_expected
+    assert (len(shard_map._shard_maps) == 1) is placed_as_expected
@@ -0,0 +1,56 @@
+import pytest
+
+from services import InvalidEventsError
+from services.validation import event_validator, validate_events
+
+schema = {
+    "type": "object",
+    "properties": {
+        "id": {"type": "string"},
+        "position": {
+            "type": "object",
+            "properties": {"lat": {"type": "number"}},
+            "required": ["lat"],
+        },
+    },
+    "required": ["id"],
+}
+
+
+def test_event_validator_is_cached():
+    validator = event_validator(schema)
+
+    assert event_validator(dict(reversed(list(schema.items())))) is validator
+    assert event_validator({**schema, "required": []}) is not validator
+
+
+def test_event_validator_no_schema():
+    assert event_validator(None) is None
+    assert event_validator({}) is None
+
+
+def test_event_validator_invalid_schema():
+    assert event_validator({"type": "no-such-type"}) is None
+
+
+def test_validate_events():
+    validate_events(event_validator(schema), [{"id": "a"}, {"id": "b"}])
+
+
+def test_validate_events_reports_every_invalid_event():
+    events = [
+        {"id": "a"},
+        {"id": 1},
+        {"id": "c", "position": {"lat": "north"}},
+        {},
+    ]
+
+    with pytest.raises(InvalidEventsError) as e:
+        validate_events(event_validator(schema), events)
+
+    assert str(e.value) == "Elements at index 1, 2, 3 do not match the dataset schema"
+    assert e.value.invalid_records == [
+        {"index": 1, "errors": ["id: 1 is not of type 'string'"]},
+        {"index": 2, "errors": ["position/lat: 'north' is not of type 'number'"]},
+        {"index": 3, "errors": ["'id' is a required property"]},
+    ]
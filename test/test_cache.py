@@ -0,0 +1,62 @@
+from cache import TTLCache
+
+
+class Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_get_and_set():
+    cache = TTLCache(maxsize=2, ttl=10)
+
+    assert cache.get("foo") is None
+    assert cache.get("foo", "default") == "default"
+
+    cache.set("foo", "bar")
+    assert cache.get("foo") == "bar"
+    assert cache.hits == 1
+    assert cache.misses == 2
+
+
+def test_entries_expire():
+    clock = Clock()
+    cache = TTLCache(maxsize=2, ttl=10, clock=clock)
+    cache.set("foo", 1)
+    cache.set("bar", 2, ttl=20)
+
+    clock.now = 10
+    assert cache.get("foo") is None
+    assert cache.get("bar") == 2
+    assert len(cache) == 1
+
+    clock.now = 20
+    assert cache.get("bar") is None
+
+
+def test_least_recently_used_entry_is_evicted():
+    cache = TTLCache(maxsize=2, ttl=10)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    cache.get("a")
+    cache.set("c", 3)
+
+    assert cache.get("a") == 1
+    assert cache.get("b") is None
+    assert cache.get("c") == 3
+
+
+def test_delete_and_clear():
+    cache = TTLCache(maxsize=2, ttl=10)
+    cache.set("a", 1)
+    cache.set("b", 2)
+
+    cache.delete("a")
+    cache.delete("missing")
+    assert cache.get("a") is None
+    assert cache.get("b") == 2
+
+    cache.clear()
+    assert len(cache) == 0
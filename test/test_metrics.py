@@ -0,0 +1,100 @@
+import io
+import json
+
+import metrics
+from metrics import BYTES, EMF_MAX_VALUES, MetricsRegistry
+
+
+def flushed(registry):
+    stream = io.StringIO()
+    registry.flush(stream)
+    return [json.loads(line) for line in stream.getvalue().splitlines()]
+
+
+def test_flush_histograms_and_counters():
+    registry = MetricsRegistry("test", clock=lambda: 1600000000.5)
+    registry.histogram("put_duration", 12.5, dataset_id="foo")
+    registry.histogram("put_duration", 7.0, dataset_id="foo")
+    registry.histogram("batch_bytes", 1024, BYTES, dataset_id="foo")
+    registry.count("rejected", 3, stream_name="bar")
+    registry.count("rejected", 2, stream_name="bar")
+
+    assert flushed(registry) == [
+        {
+            "_aws": {
+                "Timestamp": 1600000000500,
+                "CloudWatchMetrics": [
+                    {
+                        "Namespace": "test",
+                        "Dimensions": [["dataset_id"], []],
+                        "Metrics": [
+                            {"Name": "put_duration", "Unit": "Milliseconds"},
+                            {"Name": "batch_bytes", "Unit": "Bytes"},
+                        ],
+                    }
+                ],
+            },
+            "dataset_id": "foo",
+            "put_duration": [12.5, 7.0],
+            "batch_bytes": 1024,
+        },
+        {
+            "_aws": {
+                "Timestamp": 1600000000500,
+                "CloudWatchMetrics": [
+                    {
+                        "Namespace": "test",
+                        "Dimensions": [["stream_name"], []],
+                        "Metrics": [{"Name": "rejected", "Unit": "Count"}],
+                    }
+                ],
+            },
+            "stream_name": "bar",
+            "rejected": 5,
+        },
+    ]
+    # Flushing resets the registry.
+    assert flushed(registry) == []
+
+
+def test_flush_without_dimensions():
+    registry = MetricsRegistry("test")
+    registry.histogram("duration", 1.0, dataset_id=None)
+
+    [document] = flushed(registry)
+
+    assert document["_aws"]["CloudWatchMetrics"][0]["Dimensions"] == [[]]
+    assert document["duration"] == 1.0
+
+
+def test_flush_long_histogram():
+    registry = MetricsRegistry("test")
+    for i in range(EMF_MAX_VALUES + 1):
+        registry.histogram("duration", i)
+    registry.histogram("other", 1)
+
+    documents = flushed(registry)
+
+    assert len(documents) == 2
+    assert documents[0]["duration"] == list(range(EMF_MAX_VALUES))
+    assert documents[0]["other"] == 1
+    assert documents[1]["duration"] == EMF_MAX_VALUES
+    assert "other" not in documents[1]
+    assert [
+        m["Name"] for m in documents[1]["_aws"]["CloudWatchMetrics"][0]["Metrics"]
+    ] == ["duration"]
+
+
+def test_log_duration(monkeypatch):
+    registry = MetricsRegistry("test")
+    logged = {}
+    monkeypatch.setattr(metrics, "registry", registry)
+    monkeypatch.setattr(metrics, "log_add", lambda **kwargs: logged.update(kwargs))
+
+    assert metrics.log_duration(lambda: "result", "duration", dataset_id="foo") == (
+        "result"
+    )
+
+    [document] = flushed(registry)
+    assert document["dataset_id"] == "foo"
+    assert document["duration"] == logged["duration"]
@@ -0,0 +1,62 @@
+import json
+import time
+
+from botocore.exceptions import ClientError
+
+import overflow_handler
+from services.overflow import LocalOverflowStore
+
+
+class Context:
+    function_name = "event-stream-api-dev-drain_overflow"
+
+    def get_remaining_time_in_millis(self):
+        return 60000
+
+
+def test_handle_not_configured(monkeypatch):
+    monkeypatch.setattr(overflow_handler, "get_overflow_store", lambda: None)
+
+    assert overflow_handler.handle({}, Context()) == {"statusCode": 200, "body": "{}"}
+
+
+def test_handle(monkeypatch, tmp_path):
+    store = LocalOverflowStore(str(tmp_path))
+    store.put("foo", [{"PartitionKey": "a", "Data": b"{}\n"}])
+    sent = []
+    deadlines = []
+
+    def drain(overflow_store, event_service, deadline, errors):
+        sent.extend(overflow_store.batches())
+        deadlines.append(deadline)
+        return {"foo": 1}
+
+    monkeypatch.setattr(overflow_handler, "get_overflow_store", lambda: store)
+    monkeypatch.setattr(overflow_handler, "drain", drain)
+    monkeypatch.setattr(overflow_handler, "EventService", lambda dataset_client: None)
+
+    res = overflow_handler.handle({}, Context())
+    assert res["statusCode"] == 200
+    assert json.loads(res["body"]) == {"foo": 1}
+    assert len(sent) == 1
+    # The run stops a little before the function times out.
+    assert (
+        50 < deadlines[0] - time.monotonic() <= 60 - overflow_handler.DRAIN_TIME_MARGIN
+    )
+
+
+def test_handle_error(monkeypatch, tmp_path):
+    store = LocalOverflowStore(str(tmp_path))
+
+    def drain(overflow_store, event_service, deadline, errors):
+        errors.append(
+            ClientError({"Error": {"Code": "ResourceNotFoundException"}}, "PutRecords")
+        )
+        return {"foo": 0}
+
+    monkeypatch.setattr(overflow_handler, "get_overflow_store", lambda: store)
+    monkeypatch.setattr(overflow_handler, "drain", drain)
+    monkeypatch.setattr(overflow_handler, "EventService", lambda dataset_client: None)
+
+    # Failed drains are logged at error level.
+    assert overflow_handler.handle({}, Context())["statusCode"] == 500
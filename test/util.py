@@ -5,3 +5,15 @@ def create_event_stream(stream_name, region="eu-west-1"):
     kinesis = boto3.client("kinesis", region_name=region)
     kinesis.create_stream(StreamName=stream_name, ShardCount=1)
     return kinesis
+
+
+def create_idempotency_keys_table(region="eu-west-1"):
+    table_name = "event-stream-idempotency-keys"
+    client = boto3.client("dynamodb", region_name=region)
+    client.create_table(
+        TableName=table_name,
+        KeySchema=[{"AttributeName": "id", "KeyType": "HASH"}],
+        AttributeDefinitions=[{"AttributeName": "id", "AttributeType": "S"}],
+        ProvisionedThroughput={"ReadCapacityUnits": 1, "WriteCapacityUnits": 1},
+    )
+    return boto3.resource("dynamodb", region_name=region).Table(table_name)